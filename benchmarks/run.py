@@ -0,0 +1,208 @@
+"""
+End to end benchmarks of the historical loads against the local vendor simulator.
+
+    python -m benchmarks.run                                  # every scenario, compared with the baseline
+    python -m benchmarks.run --scenarios day-100 minute-1000  # some scenarios
+    python -m benchmarks.run --latency 0.02 --rate-limit-rate 0.01
+    python -m benchmarks.run --update-baseline                # record the current results as the baseline
+
+Each scenario runs in a fresh interpreter so that its peak RSS is its own. The fetch (get_data), processing
+(batch_data_processing) and archive (HDF5 appends) stages are timed separately.
+"""
+
+import os
+import sys
+import json
+import time
+import typing
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import date
+from dataclasses import dataclass
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = Path(BENCHMARKS_DIR, "baseline.json")
+RESULT_MARKER = "BENCHMARK_RESULT "
+
+# Throughput can drop and peak RSS grow by this share of the baseline before being reported as a regression
+TOLERANCE = 0.25
+
+
+@dataclass
+class Scenario:
+    symbols: int
+    timespan: str
+    vendor_name: str
+    start: date
+    end: date
+
+
+# A year of daily bars from EODHD, a day of minute bars from Polygon
+SCENARIOS = {
+    **{f"day-{n}": Scenario(n, "day", "EodhdVendor", date(2023, 1, 2), date(2023, 12, 29)) for n in (100, 1000, 10000)},
+    **{f"minute-{n}": Scenario(n, "minute", "PolygonVendor", date(2023, 1, 3), date(2023, 1, 3)) for n in (100, 1000, 10000)},
+}
+
+
+def _vendor(scenario: Scenario, url: str, max_concurrency: int):
+    from fmd.vendors.eodhd import EodhdVendor
+    from fmd.vendors.polygon import PolygonVendor
+
+    # the simulator accepts any key, the token buckets are lifted to measure the client alone
+    os.environ.setdefault("EODHISTORICALDATA", "demo")
+    os.environ.setdefault("POLYGON", "demo")
+    if scenario.vendor_name == "EodhdVendor":
+        vendor = EodhdVendor(requests_per_second=1e6, max_concurrency=max_concurrency)
+        vendor.root_url = f"{url}/api"
+    else:
+        vendor = PolygonVendor(requests_per_second=1e6, max_concurrency=max_concurrency)
+        vendor.aggregates_url = f"{url}/v2/aggs/ticker"
+    return vendor
+
+
+async def run_scenario(name: str, url: str, output_dir: str, max_concurrency: int) -> typing.Dict:
+    from fmd.utils.universe import Universe
+    from fmd.utils.http_session import close_http_session_pool
+    from fmd.utils.data_process_utils import TimeSeriesDataQuery, batch_data_processing
+    from fmd.loaders.historical import get_data
+    from fmd.storage.hdf5 import HDF5Backend
+
+    scenario = SCENARIOS[name]
+    vendor = _vendor(scenario, url, max_concurrency)
+    symbols = [f"SYM{i:05d}" for i in range(scenario.symbols)]
+    query = TimeSeriesDataQuery(
+        universe=Universe(name, "benchmark", symbols), start=scenario.start, end=scenario.end, exchange="US", timespan=scenario.timespan
+    )
+
+    stages = {}
+    start = time.perf_counter()
+    _, data = await get_data(vendor, query)
+    stages["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    processed = batch_data_processing(scenario.vendor_name, data)
+    stages["process"] = time.perf_counter() - start
+    del data
+
+    start = time.perf_counter()
+    with HDF5Backend(Path(output_dir, f"{name}.h5")) as backend:
+        for symbol, symbol_data in processed.items():
+            backend.append(symbol, symbol_data)
+    stages["archive"] = time.perf_counter() - start
+    await close_http_session_pool()
+
+    rows = sum(len(symbol_data) for symbol_data in processed.values())
+    total = sum(stages.values())
+    return {
+        "symbols": scenario.symbols,
+        "failed_symbols": scenario.symbols - len(processed),
+        "rows": rows,
+        "stages_seconds": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+        "total_seconds": round(total, 3),
+        "rows_per_second": round(rows / total),
+        "symbols_per_second": round(len(processed) / total, 1),
+        # kilobytes on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _start_simulator(args: argparse.Namespace) -> typing.Tuple[subprocess.Popen, str]:
+    command = [sys.executable, "-m", "benchmarks.simulator", "--latency", str(args.latency), "--error-rate", str(args.error_rate)]
+    command += ["--rate-limit-rate", str(args.rate_limit_rate)]
+    simulator = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, cwd=BENCHMARKS_DIR.parent)
+    line = simulator.stdout.readline()
+    if not line.startswith("SIMULATOR_URL "):
+        simulator.kill()
+        raise RuntimeError(f"The simulator did not start: {line}")
+    return simulator, line.split()[1]
+
+
+def _run_child(name: str, url: str, output_dir: str, max_concurrency: int) -> typing.Dict:
+    command = [sys.executable, "-m", "benchmarks.run", "--child", name, "--url", url, "--output-dir", output_dir]
+    command += ["--max-concurrency", str(max_concurrency)]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=BENCHMARKS_DIR.parent)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line.removeprefix(RESULT_MARKER))
+    raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr[-2000:]}")
+
+
+def compare(results: typing.Dict[str, typing.Dict], baseline: typing.Dict[str, typing.Dict], tolerance: float) -> typing.List[str]:
+    """Regressions of the results against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["rows_per_second"] < reference["rows_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rows_per_second']} rows/s, baseline {reference['rows_per_second']} rows/s")
+        if result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']} MB, baseline {reference['peak_rss_mb']} MB")
+    return regressions
+
+
+def _report(results: typing.Dict[str, typing.Dict], baseline: typing.Dict[str, typing.Dict]) -> None:
+    header = f"{'scenario':<14}{'rows':>10}{'failed':>8}{'fetch s':>9}{'process s':>11}{'archive s':>11}{'rows/s':>10}{'baseline':>10}{'RSS MB':>9}"
+    print(header)
+    for name, result in results.items():
+        stages = result["stages_seconds"]
+        reference = baseline.get(name, {}).get("rows_per_second", "-")
+        print(
+            f"{name:<14}{result['rows']:>10}{result['failed_symbols']:>8}{stages['fetch']:>9.2f}{stages['process']:>11.2f}"
+            f"{stages['archive']:>11.2f}{result['rows_per_second']:>10}{reference:>10}{result['peak_rss_mb']:>9.1f}"
+        )
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End to end benchmarks against the local vendor simulator")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0, help="mean simulated response latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--max-concurrency", type=int, default=100)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--output", type=Path, help="write the results to this json file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = asyncio.run(run_scenario(args.child, args.url, args.output_dir, args.max_concurrency))
+        print(f"{RESULT_MARKER}{json.dumps(result)}", flush=True)
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    simulator, url = _start_simulator(args)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            for name in args.scenarios:
+                results[name] = _run_child(name, url, output_dir, args.max_concurrency)
+                print(f"{name}: {results[name]['rows_per_second']} rows/s", flush=True)
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+    _report(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Local stand-in of the EODHD and Polygon time series endpoints, serving synthetic OHLCV bars.
+
+    python -m benchmarks.simulator --port 8700 --latency 0.01 --error-rate 0.01 --rate-limit-rate 0.01
+
+Point the vendors at it with `EodhdVendor.root_url = f"{url}/api"` and `PolygonVendor.aggregates_url = f"{url}/v2/aggs/ticker"`.
+"""
+
+import sys
+import json
+import zlib
+import random
+import typing
+import asyncio
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+from aiohttp import web
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:  # optional, falls back on the standard library encoder
+    orjson = None
+
+# Regular session of the synthetic intraday bars, in UTC
+SESSION_OPEN = pd.Timedelta(hours=14, minutes=30)
+SESSION_BARS = {"minute": (390, pd.Timedelta(minutes=1)), "hour": (7, pd.Timedelta(hours=1))}
+
+
+@dataclass
+class SimulatorConfig:
+    latency: float = 0.0  # mean response latency in seconds, exponentially distributed
+    error_rate: float = 0.0  # share of 500 responses
+    rate_limit_rate: float = 0.0  # share of 429 responses
+    retry_after: float = 1.0  # Retry-After of the 429 responses
+    seed: int = 0
+
+
+CONFIG = web.AppKey("config", SimulatorConfig)
+RNG = web.AppKey("rng", random.Random)
+STATS = web.AppKey("stats", collections.Counter)
+
+
+def _dumps(payload: typing.Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+def bar_timestamps(start: str, end: str, timespan: str, multiplier: int = 1) -> pd.DatetimeIndex:
+    """Bar start times between two dates: business days, and the regular session for intraday bars"""
+    days = pd.bdate_range(start, end)
+    if timespan not in SESSION_BARS:
+        return days
+    bars, step = SESSION_BARS[timespan]
+    offsets = SESSION_OPEN.value + step.value * np.arange(0, bars, multiplier)
+    return pd.DatetimeIndex((days.asi8[:, None] + offsets[None, :]).ravel().view("datetime64[ns]"))
+
+
+def synthetic_bars(symbol: str, timestamps: pd.DatetimeIndex) -> typing.Dict[str, np.ndarray]:
+    """Deterministic random walk OHLCV bars of a symbol"""
+    n = len(timestamps)
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()) + (int(timestamps[0].value // 10**9) if n else 0))
+    close = 10 + rng.random() * 90 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate([close[:1], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.random(n) * 0.01)
+    low = np.minimum(open_, close) * (1 - rng.random(n) * 0.01)
+    volume = rng.integers(100, 100_000, n)
+    return {
+        "open": open_.round(4),
+        "high": high.round(4),
+        "low": low.round(4),
+        "close": close.round(4),
+        "volume": volume,
+        "vwap": ((high + low + close) / 3).round(4),
+        "transactions": np.maximum(volume // 100, 1),
+    }
+
+
+async def _faults(request: web.Request) -> typing.Optional[web.Response]:
+    """Simulated latency, then a 429 or 500 response for the configured share of requests"""
+    config: SimulatorConfig = request.app[CONFIG]
+    rng: random.Random = request.app[RNG]
+    if config.latency > 0:
+        await asyncio.sleep(rng.expovariate(1 / config.latency))
+    draw = rng.random()
+    if draw < config.rate_limit_rate:
+        return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": str(config.retry_after)})
+    if draw < config.rate_limit_rate + config.error_rate:
+        return web.json_response({"error": "internal error"}, status=500)
+    return None
+
+
+def _respond(request: web.Request, payload: typing.Any) -> web.Response:
+    request.app[STATS][200] += 1
+    return web.Response(body=_dumps(payload), content_type="application/json")
+
+
+async def eodhd_eod(request: web.Request) -> web.Response:
+    """EODHD /api/eod/{symbol}.{exchange}?from=&to="""
+    fault = await _faults(request)
+    if fault is not None:
+        request.app[STATS][fault.status] += 1
+        return fault
+    symbol = request.match_info["ticker"].rsplit(".", 1)[0]
+    days = bar_timestamps(request.query.get("from", "2000-01-01"), request.query.get("to", "2000-12-31"), "day")
+    bars = synthetic_bars(symbol, days)
+    dates = days.strftime("%Y-%m-%d")
+    records = [
+        {"date": day, "open": o, "high": h, "low": low, "close": c, "adjusted_close": c, "volume": v}
+        for day, o, h, low, c, v in zip(dates, *(bars[field].tolist() for field in ("open", "high", "low", "close", "volume")))
+    ]
+    return _respond(request, records)
+
+
+async def polygon_aggregates(request: web.Request) -> web.Response:
+    """Polygon /v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{from}/{to}, paginated by `limit`"""
+    fault = await _faults(request)
+    if fault is not None:
+        request.app[STATS][fault.status] += 1
+        return fault
+    info = request.match_info
+    timestamps = bar_timestamps(info["start"], info["end"], info["timespan"], int(info["multiplier"]))
+    if info["timespan"] == "day":
+        # polygon daily bars are stamped at midnight New York time
+        timestamps = timestamps + pd.Timedelta(hours=5)
+    bars = synthetic_bars(info["symbol"], timestamps)
+    limit = int(request.query.get("limit", 5000))
+    cursor = int(request.query.get("cursor", 0))
+    page = slice(cursor, cursor + limit)
+    fields = {"o": "open", "h": "high", "l": "low", "c": "close", "v": "volume", "vw": "vwap", "n": "transactions"}
+    columns = [(timestamps.asi8[page] // 10**6).tolist(), *(bars[field][page].tolist() for field in fields.values())]
+    results = [dict(zip(("t", *fields), values)) for values in zip(*columns)]
+    payload = {"ticker": info["symbol"], "status": "OK", "queryCount": len(results), "resultsCount": len(results), "results": results}
+    if cursor + limit < len(timestamps):
+        payload["next_url"] = str(request.url.with_query({"cursor": cursor + limit, "limit": limit}))
+    return _respond(request, payload)
+
+
+def build_app(config: typing.Optional[SimulatorConfig] = None) -> web.Application:
+    config = config or SimulatorConfig()
+    app = web.Application()
+    app[CONFIG] = config
+    app[RNG] = random.Random(config.seed)
+    app[STATS] = collections.Counter()
+    app.router.add_get("/api/eod/{ticker}", eodhd_eod)
+    app.router.add_get("/v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/{start}/{end}", polygon_aggregates)
+    return app
+
+
+class VendorSimulator:
+    """In-process simulator, `async with VendorSimulator(config) as simulator` serves on `simulator.url`"""
+
+    def __init__(self, config: typing.Optional[SimulatorConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.app = build_app(config)
+        self.host = host
+        self.port = port
+        self.url: typing.Optional[str] = None
+        self._runner: typing.Optional[web.AppRunner] = None
+
+    @property
+    def stats(self) -> typing.Counter[int]:
+        """Number of responses per status"""
+        return self.app[STATS]
+
+    async def __aenter__(self) -> "VendorSimulator":
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.url = f"http://{self.host}:{self._runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback) -> None:
+        await self._runner.cleanup()
+
+
+async def _serve(config: SimulatorConfig, host: str, port: int) -> None:
+    async with VendorSimulator(config, host, port) as simulator:
+        # the benchmark runner reads the url from the first line
+        print(f"SIMULATOR_URL {simulator.url}", flush=True)
+        await asyncio.Event().wait()
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local EODHD/Polygon time series simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    config = SimulatorConfig(args.latency, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+    try:
+        asyncio.run(_serve(config, args.host, args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -48,7 +48,7 @@ CREATE TABLE IF NOT EXISTS ta_symbols_details (
 	isEtf TEXT,
 	isActivelyTrading TEXT,
 	isAdr  TEXT,
-    isFund TEXT
+    isFund TEXT,
     created_date TIMESTAMPTZ,
     last_updated_date TIMESTAMPTZ
 );
@@ -62,7 +62,7 @@ CREATE TABLE IF NOT EXISTS ta_prices_microcaps (
     low DOUBLE PRECISION,
     adjusted_close DOUBLE PRECISION,
     volume BIGINT,
-    vw_avg_price BIGINT,
+    vw_avg_price DOUBLE PRECISION,
     transactions_numbr INTEGER,
     PRIMARY KEY (symbol, dt),
     CONSTRAINT fk_symbol_id FOREIGN KEY (symbol_id) REFERENCES ta_symbols_details (id)
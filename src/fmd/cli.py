@@ -0,0 +1,198 @@
+"""
+Command line entry point, installed as `fmd`:
+
+    fmd fetch us_index_etf --vendor eodhd --start 2023-01-02 --end 2023-12-29
+    fmd archive us_index_etf --vendor polygon --timespan minute --start 2024-01-02 --incremental
+    fmd exchanges --vendor eodhd
+    fmd symbols US --vendor eodhd --cached
+    fmd search apple
+
+Heavy modules (pandas, aiohttp, the vendors) are imported by the commands needing them. Logging, the .env file
+and the output directories are set up on first use, so light commands such as `fmd symbols --cached` start fast.
+Importing the library itself never configures logging, scripts call fmd.utils.log.configure_logging.
+"""
+
+import sys
+import json
+import typing
+import argparse
+import importlib
+from pathlib import Path
+from datetime import date
+
+from fmd.utils.paths import HIST_DATA_PATH, METADATA_PATH, UNIVERSE_CONFIG_PATH
+
+VENDORS = {
+    "eodhd": ("fmd.vendors.eodhd", "EodhdVendor"),
+    "polygon": ("fmd.vendors.polygon", "PolygonVendor"),
+}
+
+
+def _vendor_class(name: str) -> type:
+    """Vendor class of a command, logging is configured along with this first heavy import"""
+    from fmd.utils.log import configure_logging
+
+    configure_logging()
+    module_name, class_name = VENDORS[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _print_json(payload: typing.Any) -> None:
+    json.dump(payload, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def _run(coroutine: typing.Coroutine) -> typing.Any:
+    """Run a coroutine, closing the shared http sessions before the loop goes away"""
+    import asyncio
+    from fmd.utils.http_session import close_http_session_pool
+
+    async def run() -> typing.Any:
+        try:
+            return await coroutine
+        finally:
+            await close_http_session_pool()
+
+    return asyncio.run(run())
+
+
+def _query(args: argparse.Namespace):
+    from fmd.utils.universe import Universe, UniverseManager
+    from fmd.utils.data_process_utils import TimeSeriesDataQuery
+
+    if args.symbols:
+        universe = Universe(args.universe, "command line universe", args.symbols)
+    else:
+        universe = UniverseManager(args.universe_config).get_universe(args.universe)
+    return TimeSeriesDataQuery(
+        universe=universe,
+        start=args.start,
+        end=args.end,
+        exchange=args.exchange,
+        timespan=args.timespan,
+        multiplier=args.multiplier,
+    )
+
+
+def fetch(args: argparse.Namespace) -> int:
+    """Fetch a universe and print the bars count and range of each symbol, or write every bar to --csv"""
+    from fmd.loaders.historical import get_data
+
+    _, bars = _run(get_data(_vendor_class(args.vendor)(), _query(args), compact=True))
+    if args.csv:
+        bars.to_pandas().to_csv(args.csv)
+    for symbol in bars:
+        df = bars.frame(symbol)
+        if len(df):
+            print(f"{symbol}\t{len(df)}\t{df.index[0]}\t{df.index[-1]}")
+    return 0 if len(bars.symbols) else 1
+
+
+def archive(args: argparse.Namespace) -> int:
+    """Fetch a universe into its HDF5 archive"""
+    from fmd.loaders.historical import get_data
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    query = _query(args)
+    _, data = _run(
+        get_data(_vendor_class(args.vendor)(), query, do_archive=True, output_path=args.output, stream=args.stream, incremental=args.incremental)
+    )
+    print(f"{len(data)}/{len(query.universe.symbols)} symbols archived to {args.output}")
+    return 0
+
+
+def exchanges(args: argparse.Namespace) -> int:
+    """Print the exchanges supported by the vendor, and keep them in the output directory"""
+    from fmd.loaders.misc import Miscellaneous
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    _print_json(Miscellaneous(_vendor_class(args.vendor)).get_exchanges(args.output))
+    return 0
+
+
+def symbols(args: argparse.Namespace) -> int:
+    """Print the symbols of an exchange. With --cached, the list kept by the last `fmd symbols` run is read
+    without any request (nor any heavy import)."""
+    # the file written by Miscellaneous.get_symbols_from_exchange
+    cached_path = Path(args.output, f"{VENDORS[args.vendor][1]}_{args.exchange}_tickers.json")
+    if args.cached:
+        if not cached_path.exists():
+            print(f"No cached symbols at {cached_path}, run `fmd symbols {args.exchange}` first", file=sys.stderr)
+            return 1
+        exchange_symbols = json.loads(cached_path.read_text())
+    else:
+        from fmd.loaders.misc import Miscellaneous
+
+        args.output.mkdir(parents=True, exist_ok=True)
+        exchange_symbols = Miscellaneous(_vendor_class(args.vendor)).get_symbols_from_exchange(args.exchange, args.output)
+    if args.json:
+        _print_json(exchange_symbols)
+    else:
+        # polygon wraps its tickers in a {"results": [...]} envelope, eodhd returns the list itself, see SymbolMaster.refresh
+        records = exchange_symbols.get("results", []) if isinstance(exchange_symbols, dict) else exchange_symbols
+        # eodhd symbols have a Code, polygon tickers a ticker
+        sys.stdout.write("".join(f"{record.get('Code') or record.get('ticker')}\n" for record in records))
+    return 0
+
+
+def search(args: argparse.Namespace) -> int:
+    """Search symbols by name or ticker (EODHD)"""
+    _print_json(_vendor_class("eodhd")().search(args.query, args.limit))
+    return 0
+
+
+def _add_query_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("universe", help="universe name of the universe configuration file, or of the --symbols list")
+    parser.add_argument("--symbols", nargs="+", help="symbols to load in place of the configured universe")
+    parser.add_argument("--universe-config", type=Path, default=UNIVERSE_CONFIG_PATH)
+    parser.add_argument("--vendor", choices=list(VENDORS), default="eodhd")
+    parser.add_argument("--start", type=date.fromisoformat, required=True)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--exchange", default="US")
+    parser.add_argument("--timespan", default="day")
+    parser.add_argument("--multiplier", type=int, default=1)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="fmd", description="Financial market data service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = commands.add_parser("fetch", help=fetch.__doc__)
+    _add_query_arguments(fetch_parser)
+    fetch_parser.add_argument("--csv", type=Path, help="write every bar to this csv file")
+    fetch_parser.set_defaults(handler=fetch)
+
+    archive_parser = commands.add_parser("archive", help=archive.__doc__)
+    _add_query_arguments(archive_parser)
+    archive_parser.add_argument("--output", type=Path, default=HIST_DATA_PATH)
+    archive_parser.add_argument("--stream", action="store_true", help="archive each symbol as soon as it lands")
+    archive_parser.add_argument("--incremental", action="store_true", help="only fetch the tail missing from the archive")
+    archive_parser.set_defaults(handler=archive)
+
+    exchanges_parser = commands.add_parser("exchanges", help=exchanges.__doc__)
+    exchanges_parser.add_argument("--vendor", choices=list(VENDORS), default="eodhd")
+    exchanges_parser.add_argument("--output", type=Path, default=METADATA_PATH)
+    exchanges_parser.set_defaults(handler=exchanges)
+
+    symbols_parser = commands.add_parser("symbols", help="Print the symbols of an exchange")
+    symbols_parser.add_argument("exchange")
+    symbols_parser.add_argument("--vendor", choices=list(VENDORS), default="eodhd")
+    symbols_parser.add_argument("--output", type=Path, default=METADATA_PATH)
+    symbols_parser.add_argument("--cached", action="store_true", help="read the symbols kept by the last run, without any request")
+    symbols_parser.add_argument("--json", action="store_true", help="print the full symbol records")
+    symbols_parser.set_defaults(handler=symbols)
+
+    search_parser = commands.add_parser("search", help=search.__doc__)
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=15)
+    search_parser.set_defaults(handler=search)
+    return parser
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import time
+import typing
+import sqlite3
+import threading
+import logging
+from dataclasses import replace
+from datetime import datetime, date, timedelta
+from pathlib import Path, PosixPath
+
+from fmd.vendors.vendor import MarketDataVendor
+from fmd.utils.paths import OUT_DIR
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery
+from fmd.storage.backend import StorageBackend
+from fmd.storage.writer import ArchiveWriter
+from fmd.loaders.historical import get_data, archive_backend
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+BACKFILL_MANIFEST_PATH = Path(OUT_DIR, "backfill", "manifest.sqlite")
+
+# Days of data per (symbol, window) unit, and symbols fetched and archived per checkpoint
+BACKFILL_WINDOW_DAYS = 365
+BACKFILL_BATCH_SYMBOLS = 200
+
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+class BackfillUnit(typing.NamedTuple):
+    symbol: str
+    window_start: date
+    window_end: date
+
+
+def backfill_windows(
+    start: typing.Union[datetime, date], end: typing.Union[datetime, date], window_days: int
+) -> typing.List[typing.Tuple[date, date]]:
+    """Split [start, end] into consecutive windows of `window_days` days"""
+    start = start.date() if isinstance(start, datetime) else start
+    end = end.date() if isinstance(end, datetime) else end
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start, window_end))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+class BackfillManifest:
+    """
+    Status of every (symbol, window) unit of the backfill jobs, stored in SQLite.
+    Units are planned as pending, then marked done or failed with their error once their batch is archived,
+    so that an interrupted job resumes from the units that are not done yet.
+    """
+
+    def __init__(self, path: typing.Union[str, Path] = BACKFILL_MANIFEST_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS units (
+                job TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                window_start TEXT NOT NULL,
+                window_end TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job, symbol, window_start)
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS units_status ON units (job, status)")
+
+    def plan(self, job: str, units: typing.Iterable[BackfillUnit]) -> int:
+        """Register units as pending, units already known keep their status. Returns the number of new units"""
+        rows = [(job, unit.symbol, unit.window_start.isoformat(), unit.window_end.isoformat(), PENDING, time.time()) for unit in units]
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO units (job, symbol, window_start, window_end, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._connection.execute("COMMIT")
+            return self._connection.total_changes - before
+
+    def units(self, job: str, statuses: typing.Iterable[str] = (PENDING,)) -> typing.List[BackfillUnit]:
+        statuses = list(statuses)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT symbol, window_start, window_end FROM units WHERE job = ? AND status IN ({', '.join('?' * len(statuses))}) "
+                "ORDER BY window_start, symbol",
+                (job, *statuses),
+            ).fetchall()
+        return [BackfillUnit(symbol, date.fromisoformat(start), date.fromisoformat(end)) for symbol, start, end in rows]
+
+    def checkpoint(self, job: str, done: typing.Iterable[BackfillUnit], failed: typing.Dict[BackfillUnit, str]) -> None:
+        """Record the outcome of an archived batch in a single transaction"""
+        now = time.time()
+        updates = [(DONE, None, now, job, unit.symbol, unit.window_start.isoformat()) for unit in done]
+        updates += [(FAILED, error, now, job, unit.symbol, unit.window_start.isoformat()) for unit, error in failed.items()]
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "UPDATE units SET status = ?, error = ?, attempts = attempts + 1, updated_at = ? WHERE job = ? AND symbol = ? AND window_start = ?",
+                updates,
+            )
+            self._connection.execute("COMMIT")
+
+    def summary(self, job: str) -> typing.Dict[str, int]:
+        """Number of units of the job per status"""
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM units WHERE job = ? GROUP BY status", (job,)).fetchall()
+        return {PENDING: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+    def failures(self, job: str) -> typing.Dict[BackfillUnit, str]:
+        """Failed units of the job and their last error"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT symbol, window_start, window_end, error FROM units WHERE job = ? AND status = ? ORDER BY window_start, symbol", (job, FAILED)
+            ).fetchall()
+        return {BackfillUnit(symbol, date.fromisoformat(start), date.fromisoformat(end)): error for symbol, start, end, error in rows}
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class BackfillJob:
+    """
+    Resumable backfill of a query into an archive, run through `get_data`.
+    The query range is split into (symbol, window) units recorded in the manifest. Pending units are fetched
+    window by window in batches of `batch_symbols` symbols, each batch is archived then checkpointed: a crashed
+    or cancelled job only refetches the batch in progress when run again under the same name.
+    Failed units are kept in the manifest, `run(retry_failed=True)` fetches them again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        vendor: MarketDataVendor,
+        query: TimeSeriesDataQuery,
+        output_path: typing.Optional[str | PosixPath] = None,
+        backend: typing.Optional[StorageBackend] = None,
+        manifest: typing.Optional[BackfillManifest] = None,
+        window_days: int = BACKFILL_WINDOW_DAYS,
+        batch_symbols: int = BACKFILL_BATCH_SYMBOLS,
+        writer: typing.Optional[ArchiveWriter] = None,
+    ) -> None:
+        self.name = name
+        self.vendor = vendor
+        self.query = query
+        self.backend = archive_backend(vendor, query, output_path, backend)
+        if self.backend is None:
+            _logger.error("No archive for the backfill job!")
+            raise ValueError("A backfill job requires an output path or a storage backend!")
+        self.manifest = manifest if manifest is not None else BackfillManifest()
+        self.window_days = window_days
+        self.batch_symbols = batch_symbols
+        self.writer = writer
+
+    def plan(self) -> int:
+        """Register the units of the query, idempotent: symbols or windows added to the query extend the job"""
+        windows = backfill_windows(self.query.start, self.query.end, self.window_days)
+        new_units = self.manifest.plan(self.name, (BackfillUnit(symbol, *window) for window in windows for symbol in self.query.universe.symbols))
+        _logger.info(f"Backfill {self.name}: {new_units} new units planned")
+        return new_units
+
+    def _batches(self, units: typing.List[BackfillUnit]) -> typing.Iterator[typing.Tuple[typing.Tuple[date, date], typing.List[str]]]:
+        windows = {}
+        for unit in units:
+            windows.setdefault((unit.window_start, unit.window_end), []).append(unit.symbol)
+        for window, symbols in windows.items():
+            for start in range(0, len(symbols), self.batch_symbols):
+                end = start + self.batch_symbols
+                yield window, symbols[start:end]
+
+    async def _run_batch(self, window: typing.Tuple[date, date], symbols: typing.List[str]) -> None:
+        units = [BackfillUnit(symbol, *window) for symbol in symbols]
+        universe = Universe(self.query.universe.name, self.query.universe.description, symbols)
+        batch_query = replace(self.query, universe=universe, start=window[0], end=window[1], symbols_start={})
+        errors = {}
+        try:
+            _, data = await get_data(self.vendor, batch_query, do_archive=True, backend=self.backend, writer=self.writer, errors=errors)
+        except Exception as exc:
+            _logger.error("Backfill %s: batch of %d symbols for %s/%s failed: %s", self.name, len(symbols), window[0], window[1], exc)
+            self.manifest.checkpoint(self.name, [], {unit: repr(exc) for unit in units})
+            return
+        # a symbol without bars over the window is done, only fetch and archive errors fail a unit
+        done = [unit for unit in units if unit.symbol not in errors]
+        failed = {unit: repr(errors[unit.symbol]) for unit in units if unit.symbol in errors}
+        empty = [unit.symbol for unit in done if unit.symbol not in data]
+        if empty:
+            _logger.info(f"Backfill {self.name}: no data for {len(empty)} symbols over {window[0]}/{window[1]}: {empty}")
+        self.manifest.checkpoint(self.name, done, failed)
+
+    async def run(self, retry_failed: bool = False) -> typing.Dict[str, int]:
+        """Fetch and archive the units not done yet (failed ones too with `retry_failed`), returns the job summary"""
+        self.plan()
+        units = self.manifest.units(self.name, (PENDING, FAILED) if retry_failed else (PENDING,))
+        _logger.info(f"Backfill {self.name}: {len(units)} units to fetch")
+        for window, symbols in self._batches(units):
+            await self._run_batch(window, symbols)
+
+        summary = self.manifest.summary(self.name)
+        _logger.info(f"Backfill {self.name}: {summary}")
+        if summary[FAILED]:
+            _logger.warning(f"Backfill {self.name}: {summary[FAILED]} failed units, run again with retry_failed=True")
+        return summary
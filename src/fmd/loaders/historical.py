@@ -1,57 +1,275 @@
+import asyncio
 import logging
 import typing
 import pandas as pd
+from dataclasses import replace
 from pathlib import PosixPath, Path
 
 from fmd.vendors.vendor import MarketDataVendor, VALID_VENDORS
-from fmd.utils.log import logging_dict
+from fmd.utils.universe import Universe
+from fmd.utils.metrics import get_metrics_registry
 from fmd.utils.data_process_utils import (
+    INTRADAY_TIMESPANS,
     TimeSeriesDataQuery,
-    parallel_data_processing,
-    remove_duplicates,
+    batch_data_processing,
+    compact_data_processing,
+    process_vendor_data,
 )
+from fmd.storage.backend import DateLike, StorageBackend
+from fmd.storage.cache import get_frame_cache
+from fmd.storage.writer import ArchiveWriter, get_archive_writer
+from fmd.storage.hdf5 import HDF5Backend
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
 
+def archive(
+    backend: StorageBackend,
+    vendor_name: str,
+    data: typing.Dict[str, typing.Union[typing.List, typing.Dict]],
+    writer: typing.Optional[ArchiveWriter] = None,
+    errors: typing.Optional[typing.Dict] = None,
+) -> None:
+    """Process the raw data of many symbols in one batch and upsert every symbol into the storage backend.
+    With `writer`, the appends are queued to the thread owning the archive and this call waits for them.
+    With `errors`, a failed append is recorded in it under its symbol and the other symbols are still archived,
+    the first failure is raised otherwise."""
+    processed_data = batch_data_processing(vendor_name, data)
+    if writer is None:
+        metrics, backend_name = get_metrics_registry(), type(backend).__name__
+        with backend:
+            for symbol, symbol_data in processed_data.items():
+                try:
+                    with metrics.timer("fmd_archive_write_seconds", backend=backend_name):
+                        backend.append(symbol, symbol_data)
+                except Exception as exc:
+                    if errors is None:
+                        raise
+                    _logger.error("Unexpected error while archiving %s to %s: %s", symbol, backend, exc)
+                    errors[symbol] = exc
+                    continue
+                metrics.inc("fmd_archived_rows", len(symbol_data), backend=backend_name)
+        return
+    futures = {symbol: writer.submit(backend, symbol, symbol_data) for symbol, symbol_data in processed_data.items()}
+    for symbol, future in futures.items():
+        try:
+            future.result()
+        except Exception as exc:
+            # already logged by the writer thread
+            if errors is None:
+                raise
+            errors[symbol] = exc
+
+
 def h5_archive(vendor_name: str, path: str, data: typing.Tuple[str, typing.List[typing.Dict]]):
-    processed_data = parallel_data_processing(vendor_name, data.values())
+    """Archive raw data into the HDF5 file of `path`, through the writer owning the file"""
+    archive(HDF5Backend(path), vendor_name, data, get_archive_writer())
 
-    with pd.HDFStore(path, mode="a", complevel=9, complib="blosc", index=False) as store:
-        for symbol, symbol_data in zip(data.keys(), processed_data):
-            if f"/{symbol}" in store.keys():
-                # Handle duplicates rows for existing symbol
-                remove_duplicates(store[symbol], symbol_data)
-            store.append(symbol, symbol_data)
 
-    return
+def incremental_query(query: TimeSeriesDataQuery, last_timestamps: typing.Dict[str, pd.Timestamp]) -> TimeSeriesDataQuery:
+    """Restrict a query to the missing tail of each archived symbol, dropping symbols already up to date.
+    Intraday bars restart from the last archived day, overlapping bars are dropped at archiving."""
+    end = pd.Timestamp(query.end).date()
+    symbols, symbols_start = [], dict(query.symbols_start)
+    for symbol in query.universe.symbols:
+        if symbol in last_timestamps:
+            last_timestamp = last_timestamps[symbol]
+            if query.timespan in INTRADAY_TIMESPANS:
+                start = last_timestamp.date()
+            else:
+                start = (last_timestamp + pd.Timedelta(days=1)).date()
+            if start > end:
+                continue
+            symbols_start[symbol] = max(start, pd.Timestamp(query.symbol_start(symbol)).date())
+        symbols.append(symbol)
+    return replace(query, universe=replace(query.universe, symbols=symbols), symbols_start=symbols_start)
 
 
-async def get_data(
-    vendor: MarketDataVendor, query: TimeSeriesDataQuery, do_archive: bool = False, output_path: str | PosixPath = None, *args, **kwargs
-) -> typing.Coroutine[any, any, any]:
-    """Returns historical OHLCV data for a defined universe, as specified in the global universe
-    configuration file."""
+def _universe_archive_path(universe_name: str, vendor_name: str, output_path: str | PosixPath) -> str:
+    if not isinstance(output_path, PosixPath):
+        output_path = Path(output_path)
+    return f"{output_path}/{universe_name}_{vendor_name}.h5"
+
+
+def _archive_path(vendor: MarketDataVendor, query: TimeSeriesDataQuery, output_path: str | PosixPath) -> str:
+    return _universe_archive_path(query.universe.name, vendor.__class__.__name__, output_path)
+
+
+def archive_backend(
+    vendor: MarketDataVendor, query: TimeSeriesDataQuery, output_path: typing.Optional[str | PosixPath], backend: typing.Optional[StorageBackend]
+) -> typing.Optional[StorageBackend]:
+    """Storage backend targeted by get_data, the universe HDF5 file of `output_path` by default"""
+    if backend is not None:
+        return backend
+    if output_path is None:
+        return None
+    return HDF5Backend(_archive_path(vendor, query, output_path))
+
+
+def _validate_vendor(vendor: MarketDataVendor, method_name: str) -> None:
     if vendor.__class__.__name__ not in VALID_VENDORS:
         _logger.error("Invalid vendor provided!")
         raise ValueError("Vendor provided is not valid or implemented!")
+    if not hasattr(vendor, method_name):
+        raise NotImplementedError(f"{method_name}' method has not been implemented for this vendor...")
+
+
+async def stream_data(vendor: MarketDataVendor, query: TimeSeriesDataQuery, *args, **kwargs) -> typing.AsyncIterator[typing.Tuple[str, pd.DataFrame]]:
+    """Yields (symbol, processed OHLCV DataFrame) for a defined universe as soon as each symbol lands.
+    Parsing runs in a worker thread so that the next responses keep downloading meanwhile."""
+    _validate_vendor(vendor, "stream_multi_symbols_data")
+    vendor_name = vendor.__class__.__name__
+    _logger.info(f"Now streaming Ohlcv data for {query.universe.name}...")
+    _logger.info(f"Vendor: {vendor_name}")
+
+    loop = asyncio.get_running_loop()
+    async for symbol, symbol_data in vendor.stream_multi_symbols_data(query=query, *args, **kwargs):
+        try:
+            processed_data = await loop.run_in_executor(None, process_vendor_data, vendor_name, symbol_data)
+        except Exception as exc:
+            _logger.error("Unexpected error while processing %s data: %s", symbol, exc)
+            continue
+        yield symbol, processed_data
+
 
+async def _stream_archive(
+    vendor: MarketDataVendor, query: TimeSeriesDataQuery, backend: StorageBackend, writer: ArchiveWriter, *args, **kwargs
+) -> typing.List[str]:
+    """Queue each symbol to the archive writer as soon as it is processed, returns the archived symbols"""
+    loop = asyncio.get_running_loop()
+    futures = []
+    async for symbol, symbol_data in stream_data(vendor, query, *args, **kwargs):
+        # submitting blocks while the writer queue is full, which slows the fetches down to the disk pace
+        future = await loop.run_in_executor(None, writer.submit, backend, symbol, symbol_data)
+        futures.append(asyncio.wrap_future(future))
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    archived_symbols = [result for result in results if isinstance(result, str)]
+    _logger.info(f"{len(archived_symbols)} symbols archived to {backend}")
+    return archived_symbols
+
+
+async def get_data(
+    vendor: MarketDataVendor,
+    query: TimeSeriesDataQuery,
+    do_archive: bool = False,
+    output_path: str | PosixPath = None,
+    *args,
+    stream: bool = False,
+    incremental: bool = False,
+    backend: typing.Optional[StorageBackend] = None,
+    writer: typing.Optional[ArchiveWriter] = None,
+    compact: bool = False,
+    errors: typing.Optional[typing.Dict] = None,
+    **kwargs,
+) -> typing.Coroutine[any, any, any]:
+    """Returns historical OHLCV data for a defined universe, as specified in the global universe
+    configuration file.
+    Archives go to `backend` when provided (e.g. a partitioned ParquetBackend), to the universe HDF5 file
+    of `output_path` otherwise.
+    With `stream=True`, each symbol is archived as soon as it lands instead of holding the whole
+    universe in memory, and the list of archived symbols is returned in place of the raw data.
+    With `incremental=True`, only the tail missing from the archive is requested for each symbol.
+    Writes go through `writer` (the process wide archive writer, started on the first archiving call, by default),
+    which owns each archive file, so that several get_data calls can run concurrently.
+    With `compact=True`, the processed bars are returned as CompactBars in place of the raw data.
+    Outside of the streaming mode, `errors` records the fetch or archive error of each failed symbol instead of
+    failing the call or dropping the symbol silently: requested symbols missing from both the data and `errors` came back empty."""
+    backend = archive_backend(vendor, query, output_path, backend) if do_archive else None
+    if do_archive:
+        writer = writer or get_archive_writer()
+
+    if incremental:
+        if backend is None:
+            raise ValueError("Incremental mode requires do_archive and an output path or a storage backend!")
+        # blocking archive reads, kept off the event loop like the archive writes
+        last_timestamps = await asyncio.get_running_loop().run_in_executor(None, backend.last_timestamps, query.universe.symbols)
+        query = incremental_query(query, last_timestamps)
+        _logger.info(f"{len(last_timestamps)} symbols already archived, {len(query.universe.symbols)} symbols to update")
+        if not query.universe.symbols:
+            if compact and not stream:
+                return query.universe.name, compact_data_processing(vendor.__class__.__name__, {})
+            return query.universe.name, [] if stream else {}
+
+    if stream:
+        if backend is None:
+            raise ValueError("Streaming mode requires do_archive and an output path or a storage backend, use stream_data otherwise!")
+        _validate_vendor(vendor, "stream_multi_symbols_data")
+        return query.universe.name, await _stream_archive(vendor, query, backend, writer, *args, **kwargs)
+
+    _validate_vendor(vendor, "fetch_multi_symbols_data")
     _logger.info(f"Now fetching Ohlcv data for {query.universe.name}...")
     _logger.info(f"Vendor: {vendor.__class__.__name__}")
-    if not hasattr(vendor, "fetch_multi_symbols_data"):
-        raise NotImplementedError("fetchMultiSymbols' method has not been implemented for this vendor...")
 
+    if errors is not None:
+        kwargs["errors"] = errors
     data = await vendor.fetch_multi_symbols_data(query=query, *args, **kwargs)
 
     if do_archive:
-        if output_path is not None:
-            if not isinstance(output_path, PosixPath):
-                output_path = Path(output_path)
-            dest_path = f"{output_path}/{query.universe.name}_{vendor.__class__.__name__}.h5"
-            h5_archive(vendor.__class__.__name__, dest_path, data)
+        if backend is not None:
+            await asyncio.get_running_loop().run_in_executor(None, archive, backend, vendor.__class__.__name__, data, writer, errors)
         else:
             _logger.error("Invalid input output path to archive.h5 data!")
 
+    if compact:
+        data = await asyncio.get_running_loop().run_in_executor(None, compact_data_processing, vendor.__class__.__name__, data)
     return query.universe.name, data
+
+
+def read_data(
+    universe: typing.Union[str, Universe],
+    vendor: typing.Union[str, MarketDataVendor],
+    symbols: typing.Optional[typing.Iterable[str]] = None,
+    start: typing.Optional[DateLike] = None,
+    end: typing.Optional[DateLike] = None,
+    columns: typing.Optional[typing.List[str]] = None,
+    output_path: str | PosixPath = None,
+    backend: typing.Optional[StorageBackend] = None,
+    use_cache: bool = True,
+) -> typing.Dict[str, pd.DataFrame]:
+    """Returns archived OHLCV data of a universe as {symbol: DataFrame indexed by date}, restricted to [start, end]
+    and `columns`. Only the requested rows and columns are read from the archive (indexed `where` selections for
+    HDF5, partition and column pruning for parquet).
+    Slices are kept in the process wide LRU cache until the archive is written again, so repeated reads of the
+    same universe do not decompress the same blocks twice. Returned frames are shallow copies of the cached ones:
+    adding columns is safe, in-place edits of their values are not."""
+    universe_name = universe.name if isinstance(universe, Universe) else universe
+    vendor_name = vendor if isinstance(vendor, str) else vendor.__class__.__name__
+    if symbols is None and isinstance(universe, Universe):
+        symbols = universe.symbols
+    if backend is None:
+        if output_path is None:
+            raise ValueError("Reading data requires an output path or a storage backend!")
+        backend = HDF5Backend(_universe_archive_path(universe_name, vendor_name, output_path))
+
+    version = backend.version() if use_cache else None
+    if version is None:
+        return backend.read(symbols, start, end, columns)
+
+    cache = get_frame_cache()
+    slice_key = (
+        repr(backend),
+        version,
+        None if start is None else pd.Timestamp(start),
+        None if end is None else pd.Timestamp(end),
+        None if columns is None else tuple(columns),
+    )
+    if symbols is None:
+        # archived symbols are only known once read, their slices are cached for the next reads by symbols
+        data = backend.read(None, start, end, columns)
+        symbols = missing_symbols = list(data)
+    else:
+        symbols, data, missing_symbols = list(symbols), {}, []
+        for symbol in symbols:
+            cached_df = cache.get((*slice_key, symbol))
+            if cached_df is None:
+                missing_symbols.append(symbol)
+            else:
+                data[symbol] = cached_df
+        if missing_symbols:
+            data.update(backend.read(missing_symbols, start, end, columns))
+
+    for symbol in missing_symbols:
+        if symbol in data:
+            cache.set((*slice_key, symbol), data[symbol])
+    return {symbol: data[symbol].copy(deep=False) for symbol in symbols if symbol in data}
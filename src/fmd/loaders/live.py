@@ -0,0 +1,326 @@
+import os
+import json
+import random
+import asyncio
+import contextlib
+import aiohttp
+import typing
+import logging
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+from fmd.utils.json_decoder import loads
+from fmd.vendors.vendor import DataVendors, load_vendor_env
+from fmd.vendors.polygon import PolygonAssetClass, PolygonError
+from fmd.storage.backend import StorageBackend
+from fmd.storage.writer import ArchiveWriter, get_archive_writer
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+POLYGON_WEBSOCKET_URL = "wss://socket.polygon.io"
+
+# Rows kept in memory per symbol, and flush triggers of the micro-batches sent to the archive
+RING_BUFFER_CAPACITY = 4096
+LIVE_FLUSH_ROWS = 100_000
+LIVE_FLUSH_INTERVAL = 5.0
+
+# Websocket messages waiting to be decoded, the socket is not read while the queue is full
+LIVE_QUEUE_SIZE = 1024
+
+# Micro-batches waiting for the archive, the consumer only waits for the disk once the queue is full
+LIVE_FLUSH_QUEUE_SIZE = 8
+
+# Jittered exponential backoff between reconnections, in seconds
+LIVE_RECONNECT_DELAY = 1.0
+LIVE_RECONNECT_MAX_DELAY = 60.0
+
+_BAR_DTYPE = np.dtype(
+    [
+        ("date", "datetime64[ms]"),
+        ("open", "f8"),
+        ("high", "f8"),
+        ("low", "f8"),
+        ("close", "f8"),
+        ("volume", "f8"),
+        ("volume_weighted_average_price", "f8"),
+    ]
+)
+_TRADE_DTYPE = np.dtype([("date", "datetime64[ms]"), ("price", "f8"), ("size", "f8")])
+
+
+class LiveEventSpec(typing.NamedTuple):
+    symbol_key: str
+    keys: typing.Tuple[str, ...]  # event keys, in the order of the dtype fields
+    dtype: np.dtype
+    archived: bool = True
+
+
+# Polygon websocket events: aggregates per minute (AM, XA) and per second (A, XAS), trades (T, XT).
+# Archives keep one row per (symbol, timestamp): trades sharing a millisecond would be dropped as duplicates,
+# they are only kept in the ring buffers.
+LIVE_EVENTS = {
+    "AM": LiveEventSpec("sym", ("s", "o", "h", "l", "c", "v", "vw"), _BAR_DTYPE),
+    "A": LiveEventSpec("sym", ("s", "o", "h", "l", "c", "v", "vw"), _BAR_DTYPE),
+    "XA": LiveEventSpec("pair", ("s", "o", "h", "l", "c", "v", "vw"), _BAR_DTYPE),
+    "XAS": LiveEventSpec("pair", ("s", "o", "h", "l", "c", "v", "vw"), _BAR_DTYPE),
+    "T": LiveEventSpec("sym", ("t", "p", "s"), _TRADE_DTYPE, archived=False),
+    "XT": LiveEventSpec("pair", ("t", "p", "s"), _TRADE_DTYPE, archived=False),
+}
+
+
+class RingBuffer:
+    """
+    Last `capacity` rows of a symbol in a preallocated structured array, rows are written in place.
+    Rows appended since the previous flush are drained by `unflushed`, rows overwritten before being
+    flushed are counted in `lost`.
+    """
+
+    def __init__(self, capacity: int, dtype: np.dtype) -> None:
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+        self.flushed = 0
+        self.lost = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, row: typing.Tuple) -> None:
+        self.data[self.count % self.capacity] = row
+        self.count += 1
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        return self.data[np.arange(start, stop) % self.capacity]
+
+    def latest(self, n: typing.Optional[int] = None) -> np.ndarray:
+        """Copy of the last `n` rows (all the buffered rows by default), oldest first"""
+        n = len(self) if n is None else min(n, len(self))
+        return self._rows(self.count - n, self.count)
+
+    def unflushed(self) -> np.ndarray:
+        """Copy of the rows appended since the previous call, oldest first"""
+        start = max(self.flushed, self.count - self.capacity)
+        self.lost += start - self.flushed
+        rows = self._rows(start, self.count)
+        self.flushed = self.count
+        return rows
+
+
+class LiveLoader:
+    """
+    Streaming ingestion of Polygon websocket events into per-symbol ring buffers.
+    A reader task pulls raw messages from the socket into a bounded queue, the consumer decodes them and writes
+    each event in place into the ring buffer of its symbol. Rows of aggregate channels are flushed to `backend`
+    in micro-batches, once `flush_rows` rows are pending or every `flush_interval` seconds: micro-batches are
+    queued to a background task which builds the frames and hands them to the archive writer from a worker
+    thread, so that the consumer only waits for the disk once `flush_queue_size` micro-batches are pending.
+    Trade channels are not archived, `backend` is then None.
+    The reader reconnects after a disconnect, with jittered exponential backoff, and subscribes again.
+    """
+
+    def __init__(
+        self,
+        backend: typing.Optional[StorageBackend],
+        symbols: typing.List[str],
+        channel: str = "AM",
+        asset_class: PolygonAssetClass = PolygonAssetClass.STOCKS,
+        api_key: typing.Optional[str] = None,
+        url: typing.Optional[str] = None,
+        capacity: int = RING_BUFFER_CAPACITY,
+        flush_rows: int = LIVE_FLUSH_ROWS,
+        flush_interval: float = LIVE_FLUSH_INTERVAL,
+        queue_size: int = LIVE_QUEUE_SIZE,
+        writer: typing.Optional[ArchiveWriter] = None,
+        flush_queue_size: int = LIVE_FLUSH_QUEUE_SIZE,
+        max_reconnects: typing.Optional[int] = None,
+        reconnect_delay: float = LIVE_RECONNECT_DELAY,
+        reconnect_max_delay: float = LIVE_RECONNECT_MAX_DELAY,
+    ) -> None:
+        if channel not in LIVE_EVENTS:
+            raise ValueError(f"Unexpected channel: {channel}, expected one of {list(LIVE_EVENTS)}")
+        if backend is not None and not LIVE_EVENTS[channel].archived:
+            _logger.error(f"{channel} events cannot be archived, trades sharing a timestamp would be dropped")
+            raise ValueError(f"{channel} events cannot be archived, trades sharing a timestamp would be dropped")
+        load_vendor_env()
+        self.api_key = api_key or os.environ.get(DataVendors.POLYGON.name)
+        if self.api_key is None:
+            raise PolygonError(f"{DataVendors.POLYGON.name} api_key is None!")
+        self.backend = backend
+        self.symbols = symbols
+        self.channel = channel
+        self.url = url or f"{POLYGON_WEBSOCKET_URL}/{asset_class.value}"
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.flush_queue_size = flush_queue_size
+        # None: reconnect until `stop`, otherwise the number of failed reconnections in a row before giving up
+        self.max_reconnects = max_reconnects
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.writer = (writer or get_archive_writer()) if backend is not None else None
+        self.buffers: typing.Dict[str, RingBuffer] = {}
+        self.received_messages = 0
+        self.connections = 0
+        self._pending_rows = 0
+        self._flushes: typing.Optional[asyncio.Queue] = None
+        self._stopping: typing.Optional[asyncio.Event] = None
+        self._ws: typing.Optional[aiohttp.ClientWebSocketResponse] = None
+
+    def latest(self, symbol: str, n: typing.Optional[int] = None) -> np.ndarray:
+        """Last `n` rows received for `symbol`, oldest first"""
+        buffer = self.buffers.get(symbol)
+        return buffer.latest(n) if buffer is not None else np.zeros(0, dtype=LIVE_EVENTS[self.channel].dtype)
+
+    async def _authenticate(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        await ws.send_str(json.dumps({"action": "auth", "params": self.api_key}))
+        async for message in ws:
+            statuses = [event.get("status") for event in loads(message.data) if event.get("ev") == "status"]
+            if "auth_success" in statuses:
+                return
+            if "auth_failed" in statuses:
+                break
+        raise PolygonError("Polygon websocket authentication failed!")
+
+    async def _subscribe(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        await ws.send_str(json.dumps({"action": "subscribe", "params": ",".join(f"{self.channel}.{symbol}" for symbol in self.symbols)}))
+        _logger.info(f"Subscribed to {len(self.symbols)} {self.channel} symbols on {self.url}")
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse, queue: asyncio.Queue) -> None:
+        """Move raw messages from the socket to the queue, the socket is not read while the queue is full"""
+        try:
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    await queue.put(message.data)
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    _logger.error(f"Polygon websocket error: {ws.exception()}")
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            _logger.error(f"Unexpected error while reading the Polygon websocket: {exc}")
+
+    async def _receive(self, session: aiohttp.ClientSession, queue: asyncio.Queue) -> None:
+        """Connect, authenticate, subscribe and read the socket until `stop`, reconnecting after every disconnect.
+        Gives up after `max_reconnects` failed reconnections in a row, authentication failures are not retried."""
+        failures = 0
+        cancelled = False
+        try:
+            while not self._stopping.is_set():
+                try:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        self._ws = ws
+                        await self._authenticate(ws)
+                        await self._subscribe(ws)
+                        self.connections += 1
+                        failures = 0
+                        await self._read(ws, queue)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exc:
+                    _logger.warning(f"Polygon websocket connection failed: {exc}")
+                finally:
+                    self._ws = None
+                if self._stopping.is_set():
+                    break
+                failures += 1
+                if self.max_reconnects is not None and failures > self.max_reconnects:
+                    _logger.error(f"Polygon websocket unreachable after {failures - 1} reconnections, giving up")
+                    break
+                delay = random.uniform(0, min(self.reconnect_delay * 2 ** (failures - 1), self.reconnect_max_delay))
+                _logger.warning(f"Polygon websocket disconnected, reconnecting in {delay:.1f}s")
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # end of stream marker, the consumer flushes and returns
+            if not cancelled:
+                await queue.put(None)
+
+    def _consume(self, raw_message: str) -> None:
+        """Write the events of a message into the ring buffers, no frame is built here"""
+        for event in loads(raw_message):
+            spec = LIVE_EVENTS.get(event.get("ev"))
+            if spec is None:
+                if event.get("ev") == "status":
+                    _logger.info(f"Polygon websocket status: {event.get('message')}")
+                continue
+            symbol = event[spec.symbol_key]
+            buffer = self.buffers.get(symbol)
+            if buffer is None:
+                buffer = self.buffers[symbol] = RingBuffer(self.capacity, spec.dtype)
+            buffer.append(tuple(map(event.get, spec.keys)))
+            self._pending_rows += 1
+        self.received_messages += 1
+
+    def _archive(self, batches: typing.Dict[str, np.ndarray]) -> None:
+        """Worker thread side of a flush: build the frames and wait for the archive writer"""
+        futures = []
+        for symbol, rows in batches.items():
+            symbol_data = pd.DataFrame(rows)
+            symbol_data["date"] = symbol_data["date"].astype("datetime64[ns]")
+            futures.append(self.writer.submit(self.backend, symbol, symbol_data.set_index("date")))
+        for future in concurrent.futures.as_completed(futures):
+            if future.exception() is not None:
+                _logger.error(f"Live rows could not be archived: {future.exception()}")
+
+    async def flush(self) -> None:
+        """Queue the rows received since the previous flush to the archiving task, waits only while its queue is full"""
+        if self.backend is None:
+            self._pending_rows = 0
+            return
+        batches = {symbol: buffer.unflushed() for symbol, buffer in self.buffers.items() if buffer.count > buffer.flushed}
+        self._pending_rows = 0
+        if batches:
+            await self._flushes.put(batches)
+
+    async def _archive_flushes(self) -> None:
+        """Archive the queued micro-batches one after the other, from a worker thread"""
+        loop = asyncio.get_running_loop()
+        while (batches := await self._flushes.get()) is not None:
+            try:
+                await loop.run_in_executor(None, self._archive, batches)
+            except Exception as exc:
+                _logger.error(f"Unexpected error while archiving live rows: {exc}")
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self) -> None:
+        """Close the socket without reconnecting, `run` returns once the queued messages are consumed and flushed"""
+        if self._stopping is not None:
+            self._stopping.set()
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def run(self) -> None:
+        """Subscribe to the symbols and ingest events until `stop`, or until the feed stays unreachable
+        for `max_reconnects` reconnections"""
+        self._stopping = asyncio.Event()
+        self._flushes = asyncio.Queue(maxsize=self.flush_queue_size)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        archiver = asyncio.create_task(self._archive_flushes())
+        # a dedicated session: the shared one times out requests, a subscription lasts the whole day
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+            receiver = asyncio.create_task(self._receive(session, queue))
+            flusher = asyncio.create_task(self._flush_periodically())
+            try:
+                while (raw_message := await queue.get()) is not None:
+                    self._consume(raw_message)
+                    if self._pending_rows >= self.flush_rows:
+                        await self.flush()
+                # authentication failures are raised here
+                await receiver
+            finally:
+                for task in (receiver, flusher):
+                    task.cancel()
+                await asyncio.gather(receiver, flusher, return_exceptions=True)
+                await self.flush()
+                await self._flushes.put(None)
+                await archiver
+
+        lost_rows = sum(buffer.lost for buffer in self.buffers.values())
+        if lost_rows:
+            _logger.warning(f"{lost_rows} rows overwritten in the ring buffers before being flushed, increase the capacity")
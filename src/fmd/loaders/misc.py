@@ -1,15 +1,35 @@
 import typing
 import json
 import logging
+import pandas as pd
 from pathlib import PosixPath, Path
-from fmd.utils.log import logging_dict
 from fmd.vendors.vendor import MarketDataVendor, VALID_VENDORS
 
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
+# Columns of the symbols table that can be used in `where` selections
+SYMBOLS_DATA_COLUMNS = ["ticker", "market", "locale", "primary_exchange", "type", "active"]
+
+
+def compact_symbols_table(symbols: typing.List[typing.Dict]) -> pd.DataFrame:
+    """Symbols records as a frame whose repetitive text columns (market, exchange, type...) are categoricals"""
+    df = pd.DataFrame.from_records(symbols)
+    for column in df.select_dtypes(include="object").columns:
+        if df[column].nunique() < 0.5 * len(df):
+            df[column] = df[column].astype("category")
+    return df
+
+
+def dump_json_if_changed(path: str, json_response: typing.Any) -> bool:
+    """Write json_response to path unless the file already holds the same content"""
+    content = json.dumps(json_response, indent=4)
+    if Path(path).exists() and Path(path).read_text() == content:
+        return False
+    Path(path).write_text(content)
+    return True
+
 
 class Miscellaneous:
     """Requests and load miscellaneous data"""
@@ -40,11 +60,7 @@ class Miscellaneous:
         if output_path is not None:
             if not isinstance(output_path, PosixPath):
                 output_path = Path(output_path)
-            with open(
-                f"{output_path}/{self._vendor.__class__.__name__}_exchanges.json",
-                "w",
-            ) as file:
-                json.dump(json_response, file, indent=4)
+            if dump_json_if_changed(f"{output_path}/{self._vendor.__class__.__name__}_exchanges.json", json_response):
                 _logger.info(f"Successfully fetch a list of supported exchanges of: {self._vendor.__class__.__name__}")
         else:
             _logger.warning("Invalid input path for result archiving!")
@@ -57,9 +73,33 @@ class Miscellaneous:
         if output_path is not None:
             if not isinstance(output_path, PosixPath):
                 output_path = Path(output_path)
-            with open(f"{output_path}/{self._vendor.__class__.__name__}_{exchange_code}_tickers.json", "w") as file:
-                json.dump(json_response, file, indent=4)
+            if dump_json_if_changed(f"{output_path}/{self._vendor.__class__.__name__}_{exchange_code}_tickers.json", json_response):
                 _logger.info(f"Successfully fetch a list of symbols of exchange: {exchange_code}")
         else:
             _logger.warning("Invalid input path for result archiving!")
         return json_response
+
+    async def crawl_symbols(
+        self, crawls: typing.List[typing.Tuple[str, typing.Optional[str]]], output_path: str | PosixPath = None, *args, **kwargs
+    ) -> pd.DataFrame:
+        """Crawl the complete symbol lists of several (market, exchange) pairs concurrently.
+        The result is archived as a compact queryable table in {vendor}_symbols.h5"""
+        if not hasattr(self._vendor, "crawl_symbols"):
+            raise NotImplementedError(f"Symbols crawler is not implemented for this vendor: {self._vendor.__class__.__name__}")
+        symbols = compact_symbols_table(await self._vendor.crawl_symbols(crawls, *args, **kwargs))
+        if output_path is not None:
+            if not isinstance(output_path, PosixPath):
+                output_path = Path(output_path)
+            symbols.to_hdf(
+                f"{output_path}/{self._vendor.__class__.__name__}_symbols.h5",
+                key="symbols",
+                mode="w",
+                format="table",
+                data_columns=[column for column in SYMBOLS_DATA_COLUMNS if column in symbols.columns],
+                complevel=9,
+                complib="blosc",
+            )
+            _logger.info(f"Successfully crawled {len(symbols)} symbols of: {self._vendor.__class__.__name__}")
+        else:
+            _logger.warning("Invalid input path for result archiving!")
+        return symbols
@@ -0,0 +1,39 @@
+import typing
+import pandas as pd
+from datetime import datetime, date
+
+DateLike = typing.Union[str, datetime, date, pd.Timestamp]
+
+
+class StorageBackend(typing.Protocol):
+    """
+    Base storage protocol interface to implement archive backends.
+    Writes happen inside a `with backend:` session, so that a backend can keep its files open
+    and buffer rows between appends, reads may happen at any time.
+    """
+
+    def __enter__(self) -> "StorageBackend": ...
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None: ...
+
+    def append(self, symbol: str, symbol_data: pd.DataFrame) -> None:
+        """Upsert a processed symbol time series indexed by date, rows already archived are skipped"""
+        ...
+
+    def last_timestamps(self, symbols: typing.Iterable[str]) -> typing.Dict[str, pd.Timestamp]:
+        """Last archived timestamp of each archived symbol"""
+        ...
+
+    def version(self) -> typing.Optional[typing.Hashable]:
+        """Token changing on every write to the archive, None when unknown (reads are then not cached)"""
+        ...
+
+    def read(
+        self,
+        symbols: typing.Optional[typing.Iterable[str]] = None,
+        start: typing.Optional[DateLike] = None,
+        end: typing.Optional[DateLike] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """Archived {symbol: frame indexed by date} restricted to [start, end] and `columns`"""
+        ...
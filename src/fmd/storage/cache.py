@@ -0,0 +1,68 @@
+import typing
+import threading
+import logging
+import pandas as pd
+from collections import OrderedDict
+
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+FRAME_CACHE_MAX_BYTES = 512 * 1024**2
+
+
+class FrameCache:
+    """
+    In-process LRU cache of archive slices, bounded by the memory used by the cached frames.
+    Least recently read slices are evicted once the cache grows above `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = FRAME_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames: OrderedDict[typing.Hashable, typing.Tuple[pd.DataFrame, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, key: typing.Hashable) -> typing.Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: typing.Hashable, df: pd.DataFrame) -> None:
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._frames:
+                self.nbytes -= self._frames.pop(key)[1]
+            self._frames[key] = (df, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._frames.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+
+_default_cache: typing.Optional[FrameCache] = None
+
+
+def get_frame_cache() -> FrameCache:
+    """Process wide archive slices cache, created on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FrameCache()
+    return _default_cache
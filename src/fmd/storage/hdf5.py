@@ -0,0 +1,193 @@
+import os
+import typing
+import logging
+import threading
+import pandas as pd
+from pathlib import Path
+
+from fmd.utils.data_process_utils import remove_duplicates
+from fmd.storage.backend import DateLike
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Small table holding the archived date range and row count of every symbol
+H5_METADATA_KEY = "_archive_metadata"
+
+# PyTables refuses to open a file for reading while it is open for writing in the same process: write sessions
+# and reads of a file are serialised on its lock
+_file_locks: typing.Dict[str, threading.RLock] = {}
+_file_locks_lock = threading.Lock()
+
+
+def h5_file_lock(path: typing.Union[str, Path]) -> threading.RLock:
+    """Lock held by the write session of an archive file, and by its readers"""
+    key = os.path.abspath(path)
+    with _file_locks_lock:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = threading.RLock()
+        return lock
+
+
+def h5_open(path: str) -> pd.HDFStore:
+    return pd.HDFStore(path, mode="a", complevel=9, complib="blosc", index=False)
+
+
+def h5_read_metadata(store: pd.HDFStore) -> typing.Dict[str, typing.Dict]:
+    """Archived {symbol: {start, end, nrows}} of an opened store"""
+    if f"/{H5_METADATA_KEY}" not in store:
+        return {}
+    return store[H5_METADATA_KEY].to_dict(orient="index")
+
+
+def h5_write_metadata(store: pd.HDFStore, metadata: typing.Dict[str, typing.Dict]) -> None:
+    if metadata:
+        store.put(H5_METADATA_KEY, pd.DataFrame.from_dict(metadata, orient="index", columns=["start", "end", "nrows"]))
+
+
+def h5_symbol_bounds(
+    store: pd.HDFStore, symbol: str, metadata: typing.Dict[str, typing.Dict]
+) -> typing.Optional[typing.Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Archived (start, end) of a symbol, from the metadata table when it is in sync with the symbol table.
+    Otherwise (older archives, interrupted runs) the metadata is rebuilt from the index column only."""
+    if f"/{symbol}" not in store:
+        return None
+    nrows = store.get_storer(symbol).nrows
+    if not nrows:
+        return None
+    symbol_metadata = metadata.get(symbol)
+    if symbol_metadata is None or symbol_metadata["nrows"] != nrows:
+        archived_index = store.select_column(symbol, "index")
+        symbol_metadata = {"start": archived_index.min(), "end": archived_index.max(), "nrows": nrows}
+        metadata[symbol] = symbol_metadata
+    return symbol_metadata["start"], symbol_metadata["end"]
+
+
+def h5_append(store: pd.HDFStore, symbol: str, symbol_data: pd.DataFrame, metadata: typing.Dict[str, typing.Dict]) -> None:
+    """Upsert a processed symbol time series into an opened store.
+    Only the archived rows overlapping the new batch date range are read, through the indexed table index,
+    and only the new rows are appended. `metadata` is updated in place."""
+    if symbol_data.empty:
+        return
+    new_start, new_end = symbol_data.index.min(), symbol_data.index.max()
+    bounds = h5_symbol_bounds(store, symbol, metadata)
+    if bounds is None:
+        store.append(symbol, symbol_data, index=False)
+        store.create_table_index(symbol, columns=["index"], optlevel=9, kind="full")
+        metadata[symbol] = {"start": new_start, "end": new_end, "nrows": len(symbol_data)}
+        return
+
+    archived_start, archived_end = bounds
+    if new_start <= archived_end and new_end >= archived_start:
+        # Handle duplicates rows for existing symbol
+        overlap = store.select(symbol, where=["index >= new_start", "index <= new_end"], columns=[])
+        symbol_data = remove_duplicates(overlap, symbol_data)
+    if symbol_data.empty:
+        return
+    # the CSI index is updated automatically by pytables on append
+    store.append(symbol, symbol_data, index=False)
+    metadata[symbol] = {
+        "start": min(archived_start, new_start),
+        "end": max(archived_end, new_end),
+        "nrows": metadata[symbol]["nrows"] + len(symbol_data),
+    }
+
+
+def h5_last_timestamps(path: str, symbols: typing.Iterable[str]) -> typing.Dict[str, pd.Timestamp]:
+    """Last archived timestamp of each symbol, looked up in the metadata table without loading the data"""
+    if not Path(path).exists():
+        return {}
+    last_timestamps = {}
+    with h5_file_lock(path), pd.HDFStore(path, mode="r") as store:
+        metadata = h5_read_metadata(store)
+        for symbol in symbols:
+            bounds = h5_symbol_bounds(store, symbol, metadata)
+            if bounds is not None:
+                last_timestamps[symbol] = bounds[1]
+    return last_timestamps
+
+
+def h5_where(start: typing.Optional[DateLike] = None, end: typing.Optional[DateLike] = None) -> typing.List[str]:
+    """Selection on the indexed table index, evaluated by pytables without reading the other rows"""
+    where = []
+    if start is not None:
+        where.append(f"index >= {pd.Timestamp(start).isoformat()!r}")
+    if end is not None:
+        where.append(f"index <= {pd.Timestamp(end).isoformat()!r}")
+    return where
+
+
+class HDF5Backend:
+    """
+    Archive of a universe in a single HDF5 file, with one table per symbol indexed on date.
+    The store is kept open for the whole `with` session, the metadata table is written back on exit.
+    Reads from other threads wait for the session to close.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]) -> None:
+        self.path = str(path)
+        self._store: typing.Optional[pd.HDFStore] = None
+        self._metadata: typing.Dict[str, typing.Dict] = {}
+
+    def __enter__(self) -> "HDF5Backend":
+        lock = h5_file_lock(self.path)
+        lock.acquire()
+        try:
+            self._store = h5_open(self.path)
+            self._metadata = h5_read_metadata(self._store)
+        except Exception:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+            lock.release()
+            raise
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        try:
+            h5_write_metadata(self._store, self._metadata)
+        finally:
+            self._store.close()
+            self._store = None
+            h5_file_lock(self.path).release()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path!r})"
+
+    def append(self, symbol: str, symbol_data: pd.DataFrame) -> None:
+        if self._store is None:
+            with self:
+                return self.append(symbol, symbol_data)
+        h5_append(self._store, symbol, symbol_data, self._metadata)
+
+    def version(self) -> typing.Optional[typing.Hashable]:
+        if not Path(self.path).exists():
+            return None
+        stat = Path(self.path).stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def last_timestamps(self, symbols: typing.Iterable[str]) -> typing.Dict[str, pd.Timestamp]:
+        if self._store is None:
+            return h5_last_timestamps(self.path, symbols)
+        last_timestamps = {}
+        for symbol in symbols:
+            bounds = h5_symbol_bounds(self._store, symbol, self._metadata)
+            if bounds is not None:
+                last_timestamps[symbol] = bounds[1]
+        return last_timestamps
+
+    def read(
+        self,
+        symbols: typing.Optional[typing.Iterable[str]] = None,
+        start: typing.Optional[DateLike] = None,
+        end: typing.Optional[DateLike] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        if not Path(self.path).exists():
+            return {}
+        where = h5_where(start, end) or None
+        with h5_file_lock(self.path), pd.HDFStore(self.path, mode="r") as store:
+            if symbols is None:
+                symbols = [key.lstrip("/") for key in store.keys() if key != f"/{H5_METADATA_KEY}"]
+            return {symbol: store.select(symbol, where=where, columns=columns) for symbol in symbols if f"/{symbol}" in store}
@@ -0,0 +1,194 @@
+import uuid
+import typing
+import logging
+import pandas as pd
+from pathlib import Path
+from urllib.parse import quote
+
+from fmd.utils.data_process_utils import INTRADAY_TIMESPANS
+from fmd.storage.backend import DateLike
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only required by the parquet backend
+    pa = ds = pq = None
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Buffered rows written out at once, each write lands in its own file of the touched partitions
+PARQUET_FLUSH_ROWS = 1_000_000
+
+# Rewritten on every write, files starting with an underscore are ignored by the dataset discovery
+PARQUET_VERSION_FILE = "_version"
+
+
+class ParquetBackend:
+    """
+    Columnar archive of a vendor timespan, as hive partitioned parquet files:
+        daily bars:    {root}/{vendor_name}/{timespan}/year=2023/part-*.parquet, with a symbol column
+        intraday bars: {root}/{vendor_name}/{timespan}/symbol=AAPL/year=2023/part-*.parquet
+    Appended rows are buffered during the `with` session and written once per partition, skipping the
+    (symbol, date) keys already archived. Reads only open the partitions matching the symbols and years
+    requested, and only decode the columns requested.
+    """
+
+    def __init__(
+        self,
+        root: typing.Union[str, Path],
+        vendor_name: str,
+        timespan: str = "day",
+        compression: str = "zstd",
+        flush_rows: int = PARQUET_FLUSH_ROWS,
+    ) -> None:
+        if pa is None:
+            raise ImportError("pyarrow is required by the parquet storage backend, install the `parquet` extra (`poetry install -E parquet`)")
+        self.path = Path(root, vendor_name, timespan)
+        self.intraday = timespan in INTRADAY_TIMESPANS
+        self.partition_columns = ["symbol", "year"] if self.intraday else ["year"]
+        self.compression = compression
+        self.flush_rows = flush_rows
+        self._pending: typing.List[pd.DataFrame] = []
+        self._pending_rows = 0
+
+    def __enter__(self) -> "ParquetBackend":
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        self.flush()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({str(self.path)!r})"
+
+    def _partitioning(self) -> "ds.Partitioning":
+        fields = [("symbol", pa.string()), ("year", pa.int32())] if self.intraday else [("year", pa.int32())]
+        return ds.partitioning(pa.schema(fields), flavor="hive")
+
+    def _partition_path(self, partition: typing.Tuple) -> Path:
+        # symbols are uri encoded, hive partitioning decodes them back on read
+        return Path(self.path, *(f"{column}={quote(str(value), safe='')}" for column, value in zip(self.partition_columns, partition)))
+
+    def _dataset(self) -> typing.Optional["ds.Dataset"]:
+        if not self.path.exists():
+            return None
+        return ds.dataset(self.path, format="parquet", partitioning=self._partitioning())
+
+    def append(self, symbol: str, symbol_data: pd.DataFrame) -> None:
+        if symbol_data.empty:
+            return
+        frame = symbol_data.reset_index()
+        frame.insert(0, "symbol", symbol)
+        self._pending.append(frame)
+        self._pending_rows += len(frame)
+        if self._pending_rows >= self.flush_rows:
+            self.flush()
+
+    def _new_rows(self, partition_path: Path, frame: pd.DataFrame) -> pd.DataFrame:
+        """Rows of `frame` whose (symbol, date) keys are not archived yet in the partition, reading the key columns only"""
+        if not partition_path.exists():
+            return frame
+        key_columns = ["date"] if self.intraday else ["symbol", "date"]
+        archived = ds.dataset(partition_path, format="parquet").to_table(columns=key_columns).to_pandas()
+        if archived.empty:
+            return frame
+        archived_keys = pd.MultiIndex.from_frame(archived)
+        return frame[~pd.MultiIndex.from_frame(frame[key_columns]).isin(archived_keys)]
+
+    def _write_partition(self, table: "pa.Table", partition_path: Path) -> None:
+        # sorted on date so that row group statistics let date predicates skip whole row groups
+        table = table.sort_by([(column, "ascending") for column in ("symbol", "date") if column in table.column_names])
+        pq.write_table(table, partition_path / f"part-{uuid.uuid4().hex}.parquet", compression=self.compression)
+        Path(self.path, PARQUET_VERSION_FILE).write_text(uuid.uuid4().hex)
+
+    def version(self) -> typing.Optional[typing.Hashable]:
+        version_path = Path(self.path, PARQUET_VERSION_FILE)
+        return version_path.read_text() if version_path.exists() else None
+
+    def flush(self) -> None:
+        """Write the buffered rows, one new file per touched partition"""
+        if not self._pending:
+            return
+        frame = pd.concat(self._pending, ignore_index=True)
+        self._pending, self._pending_rows = [], 0
+        frame.drop_duplicates(subset=["symbol", "date"], keep="last", inplace=True)
+        frame["year"] = frame["date"].dt.year
+
+        for partition, partition_frame in frame.groupby(self.partition_columns, sort=False):
+            partition_path = self._partition_path(partition if isinstance(partition, tuple) else (partition,))
+            partition_frame = self._new_rows(partition_path, partition_frame.drop(columns=self.partition_columns))
+            if partition_frame.empty:
+                continue
+            partition_path.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(partition_frame, preserve_index=False)
+            self._write_partition(table, partition_path)
+        _logger.debug(f"{len(frame)} rows flushed to {self.path}")
+
+    def compact(self) -> None:
+        """Rewrite every partition made of several files (e.g. after many incremental updates) into a single file"""
+        self.flush()
+        for partition_path in {file.parent for file in self.path.rglob("part-*.parquet")}:
+            files = sorted(partition_path.glob("part-*.parquet"))
+            if len(files) < 2:
+                continue
+            self._write_partition(ds.dataset(files, format="parquet").to_table(), partition_path)
+            for file in files:
+                file.unlink()
+
+    def _filter(
+        self, symbols: typing.Optional[typing.Iterable[str]], start: typing.Optional[DateLike], end: typing.Optional[DateLike]
+    ) -> typing.Optional["ds.Expression"]:
+        """Predicates on the partition columns prune whole directories, the date predicate skips row groups"""
+        predicates = []
+        if symbols is not None:
+            predicates.append(ds.field("symbol").isin(list(symbols)))
+        if start is not None:
+            start = pd.Timestamp(start)
+            predicates += [ds.field("year") >= start.year, ds.field("date") >= start]
+        if end is not None:
+            end = pd.Timestamp(end)
+            predicates += [ds.field("year") <= end.year, ds.field("date") <= end]
+        if not predicates:
+            return None
+        expression = predicates[0]
+        for predicate in predicates[1:]:
+            expression = expression & predicate
+        return expression
+
+    def scan(
+        self,
+        symbols: typing.Optional[typing.Iterable[str]] = None,
+        start: typing.Optional[DateLike] = None,
+        end: typing.Optional[DateLike] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+    ) -> pd.DataFrame:
+        """Archived rows as one long frame with symbol and date columns, e.g. the closes of every symbol in 2023"""
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=["symbol", "date", *(columns or [])])
+        if columns is not None:
+            columns = ["symbol", "date", *(column for column in columns if column not in ("symbol", "date"))]
+        table = dataset.to_table(columns=columns, filter=self._filter(symbols, start, end))
+        df = table.to_pandas()
+        if columns is None:
+            df.drop(columns="year", inplace=True)
+        df.sort_values(["symbol", "date"], inplace=True, ignore_index=True)
+        return df
+
+    def last_timestamps(self, symbols: typing.Iterable[str]) -> typing.Dict[str, pd.Timestamp]:
+        """Last archived timestamp of each symbol, reading the date column of its partitions only"""
+        df = self.scan(symbols=symbols, columns=["date"])
+        if df.empty:
+            return {}
+        return df.groupby("symbol")["date"].max().to_dict()
+
+    def read(
+        self,
+        symbols: typing.Optional[typing.Iterable[str]] = None,
+        start: typing.Optional[DateLike] = None,
+        end: typing.Optional[DateLike] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        df = self.scan(symbols, start, end, columns)
+        return {symbol: symbol_df.drop(columns="symbol").set_index("date") for symbol, symbol_df in df.groupby("symbol", sort=False)}
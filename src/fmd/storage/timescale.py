@@ -0,0 +1,238 @@
+import os
+import struct
+import typing
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+
+from fmd.storage.backend import DateLike
+
+try:
+    import psycopg
+    from psycopg.conninfo import conninfo_to_dict
+except ImportError:  # optional, only required by the timescale backend
+    psycopg = None
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+TIMESCALE_DSN_ENV = "TIMESCALEDB_DSN"
+TIMESCALE_PRICES_TABLE = "ta_prices_microcaps"
+TIMESCALE_SYMBOLS_TABLE = "ta_symbols_details"
+
+# Rows sent per COPY and upsert, and rows encoded at once while streaming a COPY
+COPY_BATCH_ROWS = 1_000_000
+COPY_CHUNK_ROWS = 100_000
+
+# Prices table columns and the processed frame columns they are taken from, first one found.
+# Polygon bars have no adjusted close, their close is adjusted or not depending on the query.
+PRICES_COLUMNS = {
+    "open": ("open",),
+    "high": ("high",),
+    "low": ("low",),
+    "adjusted_close": ("adjusted_close", "close"),
+    "volume": ("volume",),
+    "vw_avg_price": ("volume_weighted_average_price",),
+    "transactions_numbr": ("number_of_transactions",),
+}
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+POSTGRES_EPOCH_NS = pd.Timestamp("2000-01-01").value
+
+
+def copy_binary_dtype(value_columns: typing.Iterable[str]) -> np.dtype:
+    """Packed big endian layout of a binary COPY tuple (dt, symbol_id, *value_columns as float8)"""
+    fields = [("dt", ">i8"), ("symbol_id", ">i4"), *((column, ">f8") for column in value_columns)]
+    layout = itertools.chain.from_iterable(((f"{name}_length", ">i4"), (name, code)) for name, code in fields)
+    return np.dtype([("nfields", ">i2"), *layout])
+
+
+def copy_binary_rows(dt: np.ndarray, symbol_ids: np.ndarray, values: typing.Dict[str, np.ndarray]) -> bytes:
+    """
+    Encode rows in the binary COPY format without a python loop over rows: every tuple has the same fixed size,
+    so the whole batch is one numpy structured array. Naive `dt` are taken as UTC, missing values are NaNs.
+    Header and trailer are written separately, see COPY_HEADER and COPY_TRAILER.
+    """
+    dtype = copy_binary_dtype(values)
+    rows = np.empty(len(dt), dtype=dtype)
+    rows["nfields"] = len(values) + 2
+    for name in ("dt", "symbol_id", *values):
+        rows[f"{name}_length"] = dtype.fields[name][0].itemsize
+    rows["dt"] = (dt.astype("datetime64[ns]").view(np.int64) - POSTGRES_EPOCH_NS) // 1000
+    rows["symbol_id"] = symbol_ids
+    for column, column_values in values.items():
+        rows[column] = column_values
+    return rows.tobytes()
+
+
+def _prices_values(frame: pd.DataFrame) -> typing.Dict[str, np.ndarray]:
+    """Prices table columns of a processed EODHD/Polygon frame, NaNs where the vendor has no such column"""
+    values = {}
+    for column, frame_columns in PRICES_COLUMNS.items():
+        frame_column = next((frame_column for frame_column in frame_columns if frame_column in frame), None)
+        if frame_column is None:
+            values[column] = np.full(len(frame), np.nan)
+        else:
+            values[column] = pd.to_numeric(frame[frame_column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    return values
+
+
+def _utc(timestamp: DateLike) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_localize("UTC") if timestamp.tz is None else timestamp.tz_convert("UTC")
+
+
+class TimescaleBackend:
+    """
+    Database sink writing processed frames into the prices hypertable of db/initdb.sql.
+    Appended rows are buffered and streamed with binary COPY into a temporary staging table,
+    then upserted with ON CONFLICT (symbol, dt) in a single statement per batch of `batch_rows` rows.
+    The `symbol_id` of each symbol is looked up once in the symbols table, unknown symbols are registered.
+    The connection string defaults to the TIMESCALEDB_DSN environment variable.
+    """
+
+    def __init__(
+        self,
+        conninfo: typing.Optional[str] = None,
+        table: str = TIMESCALE_PRICES_TABLE,
+        symbols_table: str = TIMESCALE_SYMBOLS_TABLE,
+        batch_rows: int = COPY_BATCH_ROWS,
+    ) -> None:
+        if psycopg is None:
+            raise ImportError("psycopg is required by the timescale storage backend, install the `timescale` extra (`poetry install -E timescale`)")
+        self.conninfo = conninfo or os.environ.get(TIMESCALE_DSN_ENV)
+        if not self.conninfo:
+            _logger.error("No connection string provided for the timescale storage backend!")
+            raise ValueError(f"A connection string or the {TIMESCALE_DSN_ENV} environment variable is required")
+        self.table = table
+        self.symbols_table = symbols_table
+        self.batch_rows = batch_rows
+        self._connection: typing.Optional["psycopg.Connection"] = None
+        self._pending: typing.List[pd.DataFrame] = []
+        self._pending_rows = 0
+        self._symbol_ids: typing.Dict[str, int] = {}
+
+    def __enter__(self) -> "TimescaleBackend":
+        self._connection = psycopg.connect(self.conninfo)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback) -> None:
+        try:
+            if exception_type is None:
+                self.flush()
+                self._connection.commit()
+            else:
+                self._connection.rollback()
+                # ids of the symbols registered in the rolled back transaction are gone
+                self._symbol_ids.clear()
+        finally:
+            self._pending, self._pending_rows = [], 0
+            self._connection.close()
+            self._connection = None
+
+    def __repr__(self) -> str:
+        # never expose the credentials of the connection string
+        conninfo = conninfo_to_dict(self.conninfo)
+        return f"{self.__class__.__name__}('{conninfo.get('host', '')}/{conninfo.get('dbname', '')}.{self.table}')"
+
+    def symbol_ids(self, symbols: typing.Iterable[str]) -> typing.Dict[str, int]:
+        """Cached symbol -> id lookup, symbols missing from the symbols table are inserted"""
+        missing_symbols = sorted(set(symbols) - self._symbol_ids.keys())
+        if missing_symbols:
+            with self._connection.cursor() as cursor:
+                cursor.execute(f"SELECT symbol, MIN(id) FROM {self.symbols_table} WHERE symbol = ANY(%s) GROUP BY symbol", (missing_symbols,))
+                self._symbol_ids.update(cursor.fetchall())
+                for symbol in (symbol for symbol in missing_symbols if symbol not in self._symbol_ids):
+                    cursor.execute(f"INSERT INTO {self.symbols_table} (symbol, created_date) VALUES (%s, now()) RETURNING id", (symbol,))
+                    self._symbol_ids[symbol] = cursor.fetchone()[0]
+        return self._symbol_ids
+
+    def append(self, symbol: str, symbol_data: pd.DataFrame) -> None:
+        if self._connection is None:
+            with self:
+                return self.append(symbol, symbol_data)
+        if symbol_data.empty:
+            return
+        frame = symbol_data.reset_index()
+        frame.insert(0, "symbol", symbol)
+        self._pending.append(frame)
+        self._pending_rows += len(frame)
+        if self._pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """COPY the buffered rows into the staging table and upsert them into the prices table"""
+        if not self._pending:
+            return
+        frame = pd.concat(self._pending, ignore_index=True)
+        self._pending, self._pending_rows = [], 0
+        # a row can only be upserted once per statement
+        frame.drop_duplicates(subset=["symbol", "date"], keep="last", inplace=True)
+        dates = frame["date"].dt.tz_convert("UTC").dt.tz_localize(None) if frame["date"].dt.tz is not None else frame["date"]
+        dates = dates.to_numpy()
+        symbol_ids = frame["symbol"].map(self.symbol_ids(frame["symbol"].unique())).to_numpy(dtype=np.int32)
+        values = _prices_values(frame)
+
+        staging_table = f"_{self.table}_staging"
+        columns = ", ".join(PRICES_COLUMNS)
+        with self._connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging_table} "
+                f"(dt TIMESTAMPTZ, symbol_id INTEGER, {', '.join(f'{column} DOUBLE PRECISION' for column in PRICES_COLUMNS)})"
+            )
+            cursor.execute(f"TRUNCATE {staging_table}")
+            with cursor.copy(f"COPY {staging_table} (dt, symbol_id, {columns}) FROM STDIN (FORMAT BINARY)") as copy:
+                copy.write(COPY_HEADER)
+                for start in range(0, len(frame), COPY_CHUNK_ROWS):
+                    chunk = slice(start, start + COPY_CHUNK_ROWS)
+                    copy.write(copy_binary_rows(dates[chunk], symbol_ids[chunk], {column: array[chunk] for column, array in values.items()}))
+                copy.write(COPY_TRAILER)
+
+            # NaNs stand for missing values in the binary rows, they land as NULLs.
+            # Integer columns are filled through the assignment casts of the insert.
+            selected_columns = ", ".join(f"NULLIF(s.{column}, 'NaN')" for column in PRICES_COLUMNS)
+            updated_columns = ", ".join(f"{column} = EXCLUDED.{column}" for column in PRICES_COLUMNS)
+            cursor.execute(
+                f"INSERT INTO {self.table} (dt, symbol_id, symbol, {columns}) "
+                f"SELECT s.dt, s.symbol_id, d.symbol, {selected_columns} "
+                f"FROM {staging_table} s JOIN {self.symbols_table} d ON d.id = s.symbol_id "
+                f"ON CONFLICT (symbol, dt) DO UPDATE SET symbol_id = EXCLUDED.symbol_id, {updated_columns}"
+            )
+        _logger.debug(f"{len(frame)} rows upserted into {self}")
+
+    def version(self) -> typing.Optional[typing.Hashable]:
+        # the database can be written by other clients, reads are not cached
+        return None
+
+    def last_timestamps(self, symbols: typing.Iterable[str]) -> typing.Dict[str, pd.Timestamp]:
+        with psycopg.connect(self.conninfo) as connection:
+            rows = connection.execute(f"SELECT symbol, MAX(dt) FROM {self.table} WHERE symbol = ANY(%s) GROUP BY symbol", (list(symbols),))
+            return {symbol: pd.Timestamp(dt).tz_convert("UTC").tz_localize(None) for symbol, dt in rows}
+
+    def read(
+        self,
+        symbols: typing.Optional[typing.Iterable[str]] = None,
+        start: typing.Optional[DateLike] = None,
+        end: typing.Optional[DateLike] = None,
+        columns: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        columns = list(PRICES_COLUMNS) if columns is None else [column for column in columns if column in PRICES_COLUMNS]
+        predicates, params = ["TRUE"], []
+        if symbols is not None:
+            predicates.append("symbol = ANY(%s)")
+            params.append(list(symbols))
+        if start is not None:
+            predicates.append("dt >= %s")
+            params.append(_utc(start))
+        if end is not None:
+            predicates.append("dt <= %s")
+            params.append(_utc(end))
+        query = f"SELECT symbol, dt, {', '.join(columns)} FROM {self.table} WHERE {' AND '.join(predicates)} ORDER BY symbol, dt"
+        with psycopg.connect(self.conninfo) as connection:
+            df = pd.DataFrame(connection.execute(query, params).fetchall(), columns=["symbol", "date", *columns])
+        if df.empty:
+            return {}
+        df["date"] = pd.to_datetime(df["date"], utc=True).dt.tz_localize(None)
+        return {symbol: symbol_df.drop(columns="symbol").set_index("date") for symbol, symbol_df in df.groupby("symbol", sort=False)}
@@ -0,0 +1,140 @@
+import queue
+import atexit
+import typing
+import threading
+import logging
+import concurrent.futures
+import pandas as pd
+
+from fmd.utils.metrics import get_metrics_registry
+from fmd.storage.backend import StorageBackend
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Appends coalesced into a single backend session
+WRITER_BATCH_ROWS = 1_000_000
+
+# Appends waiting for their file writer, submitting blocks beyond that
+WRITER_QUEUE_SIZE = 1024
+
+
+class _AppendRequest(typing.NamedTuple):
+    symbol: str
+    symbol_data: pd.DataFrame
+    future: concurrent.futures.Future
+
+
+class _FileWriter(threading.Thread):
+    """Owner of one archive: the only thread opening its backend for writing"""
+
+    def __init__(self, backend: StorageBackend, batch_rows: int, queue_size: int) -> None:
+        super().__init__(name=f"archive-writer {backend!r}", daemon=True)
+        self.backend = backend
+        self.batch_rows = batch_rows
+        self.requests: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def _next_batch(self) -> typing.Tuple[typing.List[_AppendRequest], bool]:
+        """Block for the next append, then drain the queued ones up to `batch_rows` rows"""
+        batch, batch_rows = [], 0
+        request = self.requests.get()
+        while request is not None:
+            batch.append(request)
+            batch_rows += len(request.symbol_data)
+            if batch_rows >= self.batch_rows:
+                return batch, False
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stopped):
+                self.requests.task_done()
+
+    def _write(self, batch: typing.List[_AppendRequest]) -> None:
+        """Append the batch in one backend session, futures resolve once the session is closed and the rows are on disk"""
+        errors = {}
+        metrics, backend_name = get_metrics_registry(), type(self.backend).__name__
+        try:
+            with self.backend:
+                for request in batch:
+                    try:
+                        with metrics.timer("fmd_archive_write_seconds", backend=backend_name):
+                            self.backend.append(request.symbol, request.symbol_data)
+                        metrics.inc("fmd_archived_rows", len(request.symbol_data), backend=backend_name)
+                    except Exception as exc:
+                        _logger.error("Unexpected error while archiving %s to %s: %s", request.symbol, self.backend, exc)
+                        errors[id(request)] = exc
+        except Exception as exc:
+            _logger.error("Unexpected error while writing to %s: %s", self.backend, exc)
+            errors = {id(request): errors.get(id(request), exc) for request in batch}
+        for request in batch:
+            if id(request) in errors:
+                request.future.set_exception(errors[id(request)])
+            else:
+                request.future.set_result(request.symbol)
+        _logger.debug("%d appends written to %s", len(batch) - len(errors), self.backend)
+
+
+class ArchiveWriter:
+    """
+    Serialises the writes of the whole process: every archive file is owned by a single writer thread,
+    which takes processed frames from its queue and coalesces the queued appends into one backend session.
+    Fetches for several universes or vendors can then run concurrently without concurrent HDF5 writers.
+    Archives are identified by the repr of their backend, i.e. their path.
+    """
+
+    def __init__(self, batch_rows: int = WRITER_BATCH_ROWS, queue_size: int = WRITER_QUEUE_SIZE) -> None:
+        self.batch_rows = batch_rows
+        self.queue_size = queue_size
+        self._writers: typing.Dict[str, _FileWriter] = {}
+        self._lock = threading.Lock()
+
+    def _writer(self, backend: StorageBackend) -> _FileWriter:
+        with self._lock:
+            writer = self._writers.get(repr(backend))
+            if writer is None:
+                writer = _FileWriter(backend, self.batch_rows, self.queue_size)
+                writer.start()
+                self._writers[repr(backend)] = writer
+            return writer
+
+    def submit(self, backend: StorageBackend, symbol: str, symbol_data: pd.DataFrame) -> concurrent.futures.Future:
+        """Queue a symbol append to the writer owning `backend`, blocks while its queue is full.
+        The returned future resolves to the symbol once written."""
+        future = concurrent.futures.Future()
+        self._writer(backend).requests.put(_AppendRequest(symbol, symbol_data, future))
+        return future
+
+    def flush(self) -> None:
+        """Block until every queued append is written"""
+        for writer in list(self._writers.values()):
+            writer.requests.join()
+
+    def close(self) -> None:
+        """Write the queued appends and stop the writer threads"""
+        with self._lock:
+            writers, self._writers = list(self._writers.values()), {}
+        for writer in writers:
+            writer.requests.put(None)
+        for writer in writers:
+            writer.join()
+
+
+_default_writer: typing.Optional[ArchiveWriter] = None
+
+
+def get_archive_writer() -> ArchiveWriter:
+    """Process wide archive writer, closed at interpreter exit"""
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = ArchiveWriter()
+        atexit.register(_default_writer.close)
+    return _default_writer
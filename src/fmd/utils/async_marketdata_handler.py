@@ -1,52 +1,211 @@
+import time
 import asyncio
-import aiohttp
 import itertools
 import logging
 import typing
-import logging.config
+from urllib.parse import urlsplit
 
-from fmd.utils.log import logging_dict
 from fmd.utils.http_response_handler import async_response_handler, retry
+from fmd.utils.rate_limiter import AsyncTokenBucket
+from fmd.utils.http_session import HttpSessionPool, get_http_session_pool
+from fmd.utils.json_decoder import loads
+from fmd.utils.response_cache import ResponseCache
+from fmd.utils.metrics import MetricsRegistry, get_metrics_registry
 
 # from data_services.utils.data_process_utils import TimeSeriesDataQuery
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
+# Decodes a raw response body, e.g. straight into column arrays
+ResponseDecoder = typing.Callable[[bytes], typing.Any]
+
+
+def _request_host(handler: "AsyncMarketDataHandler", symbol: str, url: str, *args, **kwargs) -> str:
+    """Host of a request, the requests sent to a vendor host share its circuit breaker"""
+    return urlsplit(url).netloc
+
 
 class AsyncMarketDataHandler:
-    def __init__(self) -> None:
+    """
+    Fetch many symbols concurrently with at most `max_concurrency` requests in flight, across every call sharing
+    the handler (e.g. the single symbol calls of a CompositeVendor).
+    When `requests_per_second` is set, every attempt (retries included) waits for a token
+    from the vendor's token bucket before being sent.
+    Requests go through the shared session pool so connections stay warm between batches.
+    Requests sent with a `cache_ttl` are served from `response_cache` while fresh and revalidated afterwards.
+    Only rate limited, server side and timed out requests are retried, sharing the circuit breaker of their host.
+    Every request sent is recorded into `metrics`, labelled by vendor (the host when `vendor_name` is not set) and endpoint.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 50,
+        requests_per_second: typing.Optional[float] = None,
+        session_pool: typing.Optional[HttpSessionPool] = None,
+        response_cache: typing.Optional[ResponseCache] = None,
+        vendor_name: typing.Optional[str] = None,
+        metrics: typing.Optional[MetricsRegistry] = None,
+    ) -> None:
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got: {max_concurrency}")
         self.aio_session = None
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.rate_limiter = AsyncTokenBucket(rate=requests_per_second) if requests_per_second else None
+        self.session_pool = session_pool if session_pool is not None else get_http_session_pool()
+        self.response_cache = response_cache
+        self.vendor_name = vendor_name
+        self.metrics = metrics if metrics is not None else get_metrics_registry()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """In-flight slots shared by the calls of the running loop, asyncio semaphores are bound to a loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
 
     async def __aenter__(self):
-        timeout = aiohttp.ClientTimeout(total=30)
-        self.aio_session = aiohttp.ClientSession(timeout=timeout)
+        self.aio_session = self.session_pool.aio_session
         return self
 
     async def __aexit__(self, exception_type, exception_value, traceback):
-        await self.aio_session.close()
-
-    @retry(base_delay=1, max_delay=10, max_tries=3)
-    async def _fetch_symbol_data_helper(self, symbol: str, url: str, params: typing.Dict) -> typing.Tuple[str, typing.List[typing.Dict]]:
-        """fetch symbol data asynchronously"""
-        async with self.aio_session.get(url=url, params=params) as response:
-            await async_response_handler(response.status, response.headers, response.text)
-            json_data = await response.json()
-            if not json_data:
-                _logger.warning(f"No data fetched for symbol: {symbol}")
-                return None
+        # The shared session outlives the batch, it is closed once at shutdown by the pool
+        pass
 
+    @retry(base_delay=1, max_delay=10, max_tries=3, host_of=_request_host)
+    async def _fetch_symbol_data_helper(
+        self,
+        symbol: str,
+        url: str,
+        params: typing.Dict,
+        decoder: typing.Optional[ResponseDecoder] = None,
+        cache_ttl: typing.Optional[float] = None,
+        endpoint: typing.Optional[str] = None,
+    ) -> typing.Tuple[str, typing.List[typing.Dict]]:
+        """fetch symbol data asynchronously, the raw body is decoded with `decoder` when provided.
+        Response cache reads and writes are blocking sqlite calls, they run in the default executor."""
+        decoder = decoder or loads
+        labels = {"vendor": self.vendor_name or urlsplit(url).netloc, "endpoint": endpoint or ""}
+        cache_key = cached_response = None
+        if cache_ttl and self.response_cache is not None:
+            cache_key = self.response_cache.make_key(url, params)
+            cached_response = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached_response is not None and cached_response.is_fresh(cache_ttl):
+                self.metrics.inc("fmd_http_cache_hits", **labels)
+                return decoder(cached_response.body)
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        headers = ResponseCache.conditional_headers(cached_response)
+        status = "error"
+        self.metrics.inc("fmd_http_requests_in_flight", **labels)
+        start = time.perf_counter()
+        try:
+            async with self.aio_session.get(url=url, params=params, headers=headers) as response:
+                status = response.status
+                if response.status == 304 and cached_response is not None:
+                    await asyncio.to_thread(self.response_cache.touch, cache_key)
+                    raw_data = cached_response.body
+                else:
+                    await async_response_handler(response.status, response.headers, response.text)
+                    raw_data = await response.read()
+                    self.metrics.observe("fmd_http_response_size_bytes", len(raw_data), **labels)
+                    if cache_key is not None:
+                        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                        await asyncio.to_thread(self.response_cache.set, cache_key, raw_data, etag, last_modified)
+        finally:
+            self.metrics.dec("fmd_http_requests_in_flight", **labels)
+            self.metrics.observe("fmd_http_request_duration_seconds", time.perf_counter() - start, status=status, **labels)
+
+        json_data = decoder(raw_data)
+        if not json_data:
+            _logger.warning("No data fetched for symbol: %s", symbol)
+            return None
         return json_data
 
+    async def _fetch_symbol_pages_helper(
+        self,
+        symbol: str,
+        url: str,
+        params: typing.Dict,
+        decoder: typing.Optional[ResponseDecoder],
+        next_page_params: typing.Dict,
+        cache_ttl: typing.Optional[float] = None,
+        endpoint: typing.Optional[str] = None,
+    ) -> typing.Optional[typing.List[typing.Dict]]:
+        """fetch every page of a cursor paginated resource by following its `next_url`.
+        The cursor url carries the query, next pages are only sent `next_page_params` (e.g. the api key)."""
+        page = await self._fetch_symbol_data_helper(symbol, url, params, decoder=decoder, cache_ttl=cache_ttl, endpoint=endpoint)
+        if page is None:
+            return None
+        pages = [page]
+        while isinstance(page, typing.Dict) and page.get("next_url"):
+            page = await self._fetch_symbol_data_helper(
+                symbol, page["next_url"], next_page_params, decoder=decoder, cache_ttl=cache_ttl, endpoint=endpoint
+            )
+            if page is None:
+                break
+            pages.append(page)
+        return pages
+
+    async def _fetch_helper(
+        self,
+        symbol: str,
+        url: str,
+        params: typing.Dict,
+        decoder: typing.Optional[ResponseDecoder] = None,
+        next_page_params: typing.Optional[typing.Dict] = None,
+        cache_ttl: typing.Optional[float] = None,
+        endpoint: typing.Optional[str] = None,
+    ) -> typing.Union[None, typing.List, typing.Dict]:
+        """fetch a single response, or the list of all its pages when `next_page_params` is provided"""
+        if next_page_params is None:
+            return await self._fetch_symbol_data_helper(symbol, url, params, decoder=decoder, cache_ttl=cache_ttl, endpoint=endpoint)
+        return await self._fetch_symbol_pages_helper(symbol, url, params, decoder, next_page_params, cache_ttl=cache_ttl, endpoint=endpoint)
+
+    async def _bounded_fetch_symbol_data_helper(
+        self, semaphore: asyncio.Semaphore, symbol: str, url: str, params: typing.Dict, **kwargs
+    ) -> typing.Tuple[str, typing.List[typing.Dict]]:
+        """fetch symbol data while holding one of the in-flight slots"""
+        async with semaphore:
+            return await self._fetch_helper(symbol, url, params, **kwargs)
+
     async def fetch_multi_symbols_data_helper(
         self,
         symbol_list: typing.List[str],
         params: typing.Dict,
         urls: typing.List[typing.Tuple[str, str]],
+        symbols_params: typing.Optional[typing.Dict[str, typing.Dict]] = None,
+        decoder: typing.Optional[ResponseDecoder] = None,
+        next_page_params: typing.Optional[typing.Dict] = None,
+        cache_ttl: typing.Optional[float] = None,
+        endpoint: typing.Optional[str] = None,
+        errors: typing.Optional[typing.Dict] = None,
     ) -> typing.List[typing.Dict]:
-        """fetch multiple symbols data asynchronously"""
-        tasks = [self._fetch_symbol_data_helper(symbol, url, params) for symbol, url in urls]
+        """fetch multiple symbols data asynchronously, `symbols_params` overrides params of specific symbols.
+        With `next_page_params`, `next_url` cursors are followed and each symbol maps to its list of pages.
+        With `cache_ttl`, responses are served from the response cache while younger than `cache_ttl` seconds.
+        `endpoint` labels the request metrics.
+        With `errors`, the exception of each failed symbol is recorded in it: symbols missing from both the results
+        and `errors` came back empty."""
+        symbols_params = symbols_params or {}
+        semaphore = self._get_semaphore()
+        tasks = [
+            self._bounded_fetch_symbol_data_helper(
+                semaphore,
+                symbol,
+                url,
+                {**params, **symbols_params.get(symbol, {})},
+                decoder=decoder,
+                next_page_params=next_page_params,
+                cache_ttl=cache_ttl,
+                endpoint=endpoint,
+            )
+            for symbol, url in urls
+        ]
         responses = await asyncio.gather(*tasks, return_exceptions=True)
 
         success_fetch_mask = [isinstance(response, typing.List) or isinstance(response, typing.Dict) for response in responses]
@@ -57,6 +216,71 @@ class AsyncMarketDataHandler:
         failed_symbols = list(itertools.compress(symbol_list, failed_fetch_mask))
 
         if len(failed_symbols) > 0:
-            _logger.warning(f"{len(failed_symbols)} failed symbols during fetching: {failed_symbols}")
+            _logger.warning("%d failed symbols during fetching: %s", len(failed_symbols), failed_symbols)
+        if errors is not None:
+            errors.update((symbol, response) for symbol, response in zip(symbol_list, responses) if isinstance(response, BaseException))
 
         return dict(zip(success_symbols, success_responses))
+
+    async def stream_multi_symbols_data_helper(
+        self,
+        params: typing.Dict,
+        urls: typing.List[typing.Tuple[str, str]],
+        queue_size: typing.Optional[int] = None,
+        symbols_params: typing.Optional[typing.Dict[str, typing.Dict]] = None,
+        decoder: typing.Optional[ResponseDecoder] = None,
+        next_page_params: typing.Optional[typing.Dict] = None,
+        cache_ttl: typing.Optional[float] = None,
+        endpoint: typing.Optional[str] = None,
+    ) -> typing.AsyncIterator[typing.Tuple[str, typing.Union[typing.List, typing.Dict]]]:
+        """
+        fetch multiple symbols data asynchronously and yield each (symbol, response) as soon as it lands.
+        At most `max_concurrency` requests are in flight and `queue_size` responses wait for the consumer:
+        workers stop fetching while the queue is full, so memory does not grow with the universe size.
+        """
+        symbols_params = symbols_params or {}
+        queue = asyncio.Queue(maxsize=queue_size or self.max_concurrency)
+        semaphore = self._get_semaphore()
+        pending_urls = iter(urls)
+        failed_symbols = []
+        worker_done = object()
+
+        async def worker() -> None:
+            # The iterator is shared: each worker pulls the next symbol once it is free
+            for symbol, url in pending_urls:
+                try:
+                    symbol_params = {**params, **symbols_params.get(symbol, {})}
+                    response = await self._bounded_fetch_symbol_data_helper(
+                        semaphore,
+                        symbol,
+                        url,
+                        symbol_params,
+                        decoder=decoder,
+                        next_page_params=next_page_params,
+                        cache_ttl=cache_ttl,
+                        endpoint=endpoint,
+                    )
+                except Exception:
+                    response = None
+                if isinstance(response, (typing.List, typing.Dict)):
+                    await queue.put((symbol, response))
+                else:
+                    failed_symbols.append(symbol)
+            await queue.put(worker_done)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_concurrency, len(urls)))]
+        try:
+            running_workers = len(workers)
+            while running_workers > 0:
+                item = await queue.get()
+                if item is worker_done:
+                    running_workers -= 1
+                    continue
+                yield item
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if len(failed_symbols) > 0:
+            _logger.warning("%d failed symbols during fetching: %s", len(failed_symbols), failed_symbols)
@@ -0,0 +1,136 @@
+import typing
+import logging
+import numpy as np
+import pandas as pd
+
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Storage dtype of the processed columns, other columns keep their own dtype
+COMPACT_DTYPES = {
+    "open": np.float32,
+    "high": np.float32,
+    "low": np.float32,
+    "close": np.float32,
+    "adjusted_close": np.float32,
+    # share volumes go beyond the float32 precision and, for crypto, are fractional
+    "volume": np.float64,
+    "volume_weighted_average_price": np.float32,
+    "number_of_transactions": np.uint32,
+}
+
+
+def _column_dtype(column: str, parts: typing.List[typing.Optional[np.ndarray]], dtypes: typing.Dict[str, typing.Any]) -> np.dtype:
+    """Storage dtype of a column, integer columns with missing values fall back to float32"""
+    dtype = np.dtype(dtypes[column]) if column in dtypes else np.result_type(*(part.dtype for part in parts if part is not None))
+    if dtype.kind in "iu" and any(part is None or (part.dtype.kind == "f" and np.isnan(part).any()) for part in parts):
+        _logger.warning(f"Missing values in the integer column {column}, stored as float32")
+        return np.dtype(np.float32)
+    return dtype
+
+
+def _concatenate(parts: typing.List[typing.Optional[np.ndarray]], lengths: typing.List[int], dtype: np.dtype) -> np.ndarray:
+    """Concatenate column parts into one preallocated array, missing parts are NaNs"""
+    column = np.empty(sum(lengths), dtype=dtype)
+    start = 0
+    for part, length in zip(parts, lengths):
+        end = start + length
+        column[start:end] = np.nan if part is None else part
+        start = end
+    return column
+
+
+class CompactBars:
+    """
+    Bars of many symbols held in one contiguous set of column arrays, rows sorted by (symbol, date).
+    The rows of the i-th symbol are `offsets[i]:offsets[i + 1]`, so per-symbol views are zero-copy slices
+    and the symbol of each row is a categorical code. Prices are float32 and counts uint32 by default,
+    see COMPACT_DTYPES, pandas frames are built on request only.
+    """
+
+    def __init__(self, symbols: typing.List[str], offsets: np.ndarray, dates: np.ndarray, columns: typing.Dict[str, np.ndarray]) -> None:
+        if len(offsets) != len(symbols) + 1 or offsets[-1] != len(dates):
+            raise ValueError("Offsets do not match the symbols and the rows")
+        self.symbols = list(symbols)
+        self.offsets = offsets
+        self.dates = dates
+        self.columns = columns
+        self._positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_frames(cls, frames: typing.Dict[str, pd.DataFrame], dtypes: typing.Dict[str, typing.Any] = COMPACT_DTYPES) -> "CompactBars":
+        """Compact processed per-symbol frames, indexed by date"""
+        frames = {symbol: frame.sort_index() for symbol, frame in frames.items() if not frame.empty}
+        lengths = [len(frame) for frame in frames.values()]
+        column_names = list(dict.fromkeys(column for frame in frames.values() for column in frame.columns))
+        columns = {}
+        for column in column_names:
+            parts = [frame[column].to_numpy() if column in frame else None for frame in frames.values()]
+            columns[column] = _concatenate(parts, lengths, _column_dtype(column, parts, dtypes))
+        dates = _concatenate([frame.index.to_numpy(dtype="datetime64[ns]") for frame in frames.values()], lengths, np.dtype("datetime64[ns]"))
+        return cls(list(frames), np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64), dates, columns)
+
+    @classmethod
+    def concat(cls, parts: typing.List["CompactBars"], dtypes: typing.Dict[str, typing.Any] = COMPACT_DTYPES) -> "CompactBars":
+        """Concatenate compact bars of distinct symbols"""
+        parts = [part for part in parts if len(part)]
+        if len(parts) == 1:
+            return parts[0]
+        lengths = [len(part) for part in parts]
+        column_names = list(dict.fromkeys(column for part in parts for column in part.columns))
+        columns = {}
+        for column in column_names:
+            column_parts = [part.columns.get(column) for part in parts]
+            columns[column] = _concatenate(column_parts, lengths, _column_dtype(column, column_parts, dtypes))
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for part, start in zip(parts, np.cumsum([0, *lengths[:-1]])):
+            offsets.append(part.offsets[1:] + start)
+        symbols = [symbol for part in parts for symbol in part.symbols]
+        return cls(symbols, np.concatenate(offsets), _concatenate([part.dates for part in parts], lengths, np.dtype("datetime64[ns]")), columns)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._positions
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self.symbols)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.dates.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Categorical code of the symbol of each row"""
+        code_dtype = np.int16 if len(self.symbols) < np.iinfo(np.int16).max else np.int32
+        return np.repeat(np.arange(len(self.symbols), dtype=code_dtype), np.diff(self.offsets))
+
+    def _slice(self, symbol: str) -> slice:
+        if symbol not in self._positions:
+            raise KeyError(symbol)
+        i = self._positions[symbol]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def view(self, symbol: str) -> typing.Dict[str, np.ndarray]:
+        """Zero-copy column views of a symbol, "date" included"""
+        rows = self._slice(symbol)
+        return {"date": self.dates[rows], **{column: values[rows] for column, values in self.columns.items()}}
+
+    def frame(self, symbol: str) -> pd.DataFrame:
+        """Bars of a symbol as a DataFrame indexed by date, built on the column views (no copy)"""
+        rows = self._slice(symbol)
+        columns = {column: values[rows] for column, values in self.columns.items()}
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(self.dates[rows], name="date"), copy=False)
+
+    def to_frames(self) -> typing.Dict[str, pd.DataFrame]:
+        """{symbol: bars} as returned by the processing functions, in the compact dtypes"""
+        return {symbol: self.frame(symbol) for symbol in self.symbols}
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Long frame of every bar with a categorical symbol column, indexed by date"""
+        df = pd.DataFrame(self.columns, index=pd.DatetimeIndex(self.dates, name="date"), copy=False)
+        df.insert(0, "symbol", pd.Categorical.from_codes(self.codes, categories=self.symbols))
+        return df
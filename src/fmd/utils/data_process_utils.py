@@ -1,23 +1,61 @@
+import os
+import atexit
+import itertools
+import numpy as np
 import pandas as pd
 import logging
 import typing
 import concurrent.futures
 
-from fmd.utils.log import logging_dict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, date
 from fmd.utils.universe import Universe
+from fmd.utils.compact_bars import COMPACT_DTYPES, CompactBars
+from fmd.utils.metrics import get_metrics_registry
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
+POLYGON_COLUMNS = {
+    "v": "volume",
+    "vw": "volume_weighted_average_price",
+    "o": "open",
+    "c": "close",
+    "h": "high",
+    "l": "low",
+    "t": "date",
+    "n": "number_of_transactions",
+}
+
+INTRADAY_TIMESPANS = ("second", "minute", "hour")
+
+# Columns of the normalized OHLCV schema, missing vendor columns are NaNs
+NORMALIZED_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "adjusted_close",
+    "volume",
+    "volume_weighted_average_price",
+    "number_of_transactions",
+]
+
+# Above this number of rows, batches are split across the persistent process pool
+LARGE_PAYLOAD_ROWS = 1_000_000
+
+_process_pool: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+# Raw time series rows of a symbol: json records, or column arrays from a columnar decoder
+Records = typing.Union[typing.List[typing.Dict], typing.Dict[str, np.ndarray]]
+
 
 @dataclass
 class TimeSeriesDataQuery:
     """
     Build and returns a query datamodel for any api requests.
     Currently, queries for multiple tickers is possible only for same exchange.
+    `symbols_start` overrides the start of specific symbols, e.g. to fetch only the missing tail of an archive.
     """
 
     universe: Universe
@@ -28,6 +66,29 @@ class TimeSeriesDataQuery:
     multiplier: int = 1
     split_adjusted: bool = False
     sort_by_timestamp: str = "asc"
+    symbols_start: typing.Dict[str, typing.Union[datetime, date]] = field(default_factory=dict)
+
+    def symbol_start(self, symbol: str) -> typing.Union[datetime, date]:
+        return self.symbols_start.get(symbol, self.start)
+
+
+class VendorResponse(typing.NamedTuple):
+    """Raw time series of a symbol tagged with the vendor that answered, as returned by the composite vendor"""
+
+    vendor_name: str
+    timespan: str
+    data: typing.Union[typing.List, typing.Dict]
+
+
+def normalize_vendor_data(df: pd.DataFrame, timespan: str = "day") -> pd.DataFrame:
+    """
+    Map a processed frame to the normalized schema: NORMALIZED_COLUMNS as floats, NaNs where the vendor has no
+    such column. Daily bars are indexed by their session date whatever the vendor timestamping convention.
+    """
+    df = df.reindex(columns=NORMALIZED_COLUMNS).astype(np.float64)
+    if timespan not in INTRADAY_TIMESPANS:
+        df.index = df.index.normalize()
+    return df
 
 
 def process_eodhd_vendor_data(data: typing.List[typing.Dict]) -> typing.Dict:
@@ -43,19 +104,7 @@ def process_polygon_vendor_data(data: typing.List[typing.Dict]) -> typing.Dict:
     """Preprocess time series raw dataframe for polygon vendor"""
 
     df = pd.DataFrame(data["results"])
-    df.rename(
-        columns={
-            "v": "volume",
-            "vw": "volume_weighted_average_price",
-            "o": "open",
-            "c": "close",
-            "h": "high",
-            "l": "low",
-            "t": "date",
-            "n": "number_of_transactions",
-        },
-        inplace=True,
-    )
+    df.rename(columns=POLYGON_COLUMNS, inplace=True)
 
     df.date = pd.to_datetime(df.date, unit="ms")
     df.sort_values(by="date", inplace=True)
@@ -64,27 +113,196 @@ def process_polygon_vendor_data(data: typing.List[typing.Dict]) -> typing.Dict:
     return df
 
 
-def parallel_data_processing(vendor_name: str, data: typing.List[typing.Dict]) -> typing.Iterable:
+def process_composite_vendor_data(data: VendorResponse) -> pd.DataFrame:
+    """Preprocess a composite vendor response with the processor of the vendor that answered"""
+    return normalize_vendor_data(process_vendor_data(data.vendor_name, data.data), data.timespan)
+
+
+VENDOR_DATA_PROCESSORS = {
+    "EodhdVendor": process_eodhd_vendor_data,
+    "PolygonVendor": process_polygon_vendor_data,
+    "CompositeVendor": process_composite_vendor_data,
+}
+
+
+def process_vendor_data(vendor_name: str, data: typing.Union[typing.List[typing.Dict], typing.Dict]) -> pd.DataFrame:
+    """Preprocess a single symbol time series raw data with the vendor data processor"""
+    if vendor_name not in VENDOR_DATA_PROCESSORS:
+        _logger.error(f"No existing data processor function! Unexpected vendor name: {vendor_name}!")
+        raise ValueError(f"Unexpected vendor name: {vendor_name}")
+    if vendor_name == "CompositeVendor":
+        # recorded under the vendor that answered
+        return process_composite_vendor_data(data)
+    metrics = get_metrics_registry()
+    with metrics.timer("fmd_parse_seconds", vendor=vendor_name, mode="symbol"):
+        df = VENDOR_DATA_PROCESSORS[vendor_name](data)
+    metrics.inc("fmd_parsed_symbols", vendor=vendor_name)
+    metrics.inc("fmd_parsed_rows", len(df), vendor=vendor_name)
+    return df
+
+
+def get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """Persistent process pool reused by every processing call, shut down at interpreter exit"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = concurrent.futures.ProcessPoolExecutor()
+        atexit.register(_process_pool.shutdown)
+    return _process_pool
+
+
+def _records_length(records: Records) -> int:
+    if isinstance(records, dict):
+        return len(next(iter(records.values()))) if records else 0
+    return len(records)
+
+
+def _records_fields(records: Records) -> typing.Tuple:
+    if isinstance(records, dict):
+        return (dict, *records)
+    return (list, *records[0])
+
+
+def _records_frame(records_by_symbol: typing.Dict[str, Records]) -> pd.DataFrame:
+    """Concatenate the records of every symbol into one frame keyed by a categorical symbol column"""
+    symbols = list(records_by_symbol)
+    lengths = [_records_length(records) for records in records_by_symbol.values()]
+    first_records = records_by_symbol[symbols[0]]
+    if isinstance(first_records, dict):
+        df = pd.DataFrame({field: np.concatenate([records[field] for records in records_by_symbol.values()]) for field in first_records})
+    else:
+        df = pd.DataFrame.from_records(list(itertools.chain.from_iterable(records_by_symbol.values())))
+    df["symbol"] = pd.Categorical.from_codes(np.repeat(np.arange(len(symbols)), lengths), categories=symbols)
+    return df
+
+
+def split_by_symbol(df: pd.DataFrame) -> typing.Dict[str, pd.DataFrame]:
+    """Sort by (symbol, date) and slice the frame into per-symbol frames indexed by date.
+    `df` has a categorical `symbol` column and a `date` column, it is sorted and indexed in place."""
+    df.sort_values(by=["symbol", "date"], inplace=True)
+    df.set_index("date", inplace=True)
+    symbols = df["symbol"].cat.categories
+    boundaries = np.searchsorted(df["symbol"].cat.codes.to_numpy(), np.arange(len(symbols) + 1))
+    df.drop(columns="symbol", inplace=True)
+    symbol_bounds = zip(symbols, boundaries[:-1], boundaries[1:])
+    return {symbol: df.iloc[start:end] for symbol, start, end in symbol_bounds if start < end}
+
+
+def batch_process_eodhd_vendor_data(records_by_symbol: typing.Dict[str, Records]) -> typing.Dict[str, pd.DataFrame]:
+    """Preprocess the eod records of many symbols in a single pass"""
+    df = _records_frame(records_by_symbol)
+    df.date = pd.to_datetime(df.date)
+    return split_by_symbol(df)
+
+
+def batch_process_polygon_vendor_data(records_by_symbol: typing.Dict[str, Records]) -> typing.Dict[str, pd.DataFrame]:
+    """Preprocess the aggregates results of many symbols in a single pass"""
+    df = _records_frame(records_by_symbol)
+    df.rename(columns=POLYGON_COLUMNS, inplace=True)
+    df.date = pd.to_datetime(df.date, unit="ms")
+    return split_by_symbol(df)
+
+
+def _eodhd_records(data: typing.List[typing.Dict]) -> typing.List[typing.Dict]:
+    return data
+
+
+def _polygon_records(data: typing.Dict) -> Records:
+    return data.get("results", [])
+
+
+BATCH_DATA_PROCESSORS = {
+    "EodhdVendor": (_eodhd_records, batch_process_eodhd_vendor_data),
+    "PolygonVendor": (_polygon_records, batch_process_polygon_vendor_data),
+}
+
+
+def _schema_batches(records_by_symbol: typing.Dict[str, Records], max_rows: int) -> typing.Iterator[typing.Dict]:
+    """
+    Group symbols whose records share the same fields, so that a missing field in one symbol does not turn
+    the columns of the others into floats, and cut the groups into batches of about `max_rows` rows.
+    """
+    schemas = {}
+    for symbol, records in records_by_symbol.items():
+        if _records_length(records):
+            schemas.setdefault(_records_fields(records), {})[symbol] = records
+    for schema_records in schemas.values():
+        batch, batch_rows = {}, 0
+        for symbol, records in schema_records.items():
+            batch[symbol] = records
+            batch_rows += _records_length(records)
+            if batch_rows >= max_rows:
+                yield batch
+                batch, batch_rows = {}, 0
+        if batch:
+            yield batch
+
+
+def batch_process_composite_vendor_data(data: typing.Dict[str, VendorResponse]) -> typing.Dict[str, pd.DataFrame]:
+    """Preprocess composite vendor responses in one batch per answering vendor, then normalize them"""
+    groups = {}
+    for symbol, response in data.items():
+        groups.setdefault((response.vendor_name, response.timespan), {})[symbol] = response.data
+    processed_data = {}
+    for (vendor_name, timespan), vendor_data in groups.items():
+        for symbol, symbol_data in batch_data_processing(vendor_name, vendor_data).items():
+            processed_data[symbol] = normalize_vendor_data(symbol_data, timespan)
+    return processed_data
+
+
+def batch_data_processing(vendor_name: str, data: typing.Dict[str, typing.Union[typing.List, typing.Dict]]) -> typing.Dict[str, pd.DataFrame]:
     """
-    Preprocess concurrently list of time series raw dataframe.
+    Preprocess the raw time series of many symbols at once, returns {symbol: processed dataframe}.
+    All records are parsed in one columnar pass in-process, the persistent process pool is only used
+    to spread genuinely large (intraday) payloads across cores.
     """
-    match (vendor_name):
-        case "EodhdVendor":
-            with concurrent.futures.ProcessPoolExecutor() as pool:
-                return pool.map(process_eodhd_vendor_data, data)
-        case "PolygonVendor":
-            with concurrent.futures.ProcessPoolExecutor() as pool:
-                return pool.map(process_polygon_vendor_data, data)
-        case _:
-            _logger.error(f"No existing data processor function! Unexpected vendor name: {vendor_name}!")
-
-
-def remove_duplicates(existing_df: pd.DataFrame, new_df: pd.DataFrame) -> typing.Union[None, pd.DataFrame]:
+    if vendor_name == "CompositeVendor":
+        # the responses of each underlying vendor are processed, and recorded, by vendor
+        return batch_process_composite_vendor_data(data)
+    if vendor_name not in BATCH_DATA_PROCESSORS:
+        _logger.error(f"No existing data processor function! Unexpected vendor name: {vendor_name}!")
+        raise ValueError(f"Unexpected vendor name: {vendor_name}")
+    extract_records, batch_processor = BATCH_DATA_PROCESSORS[vendor_name]
+    metrics = get_metrics_registry()
+    with metrics.timer("fmd_parse_seconds", vendor=vendor_name, mode="batch"):
+        records_by_symbol = {symbol: extract_records(symbol_data) for symbol, symbol_data in data.items()}
+
+        nrows = sum(_records_length(records) for records in records_by_symbol.values())
+        if nrows < LARGE_PAYLOAD_ROWS:
+            batches = _schema_batches(records_by_symbol, max_rows=nrows + 1)
+            processed_batches = map(batch_processor, batches)
+        else:
+            batches = _schema_batches(records_by_symbol, max_rows=max(nrows // (os.cpu_count() or 1), 1))
+            processed_batches = get_process_pool().map(batch_processor, batches)
+
+        processed_data = {}
+        for processed_batch in processed_batches:
+            processed_data.update(processed_batch)
+    metrics.inc("fmd_parsed_symbols", len(processed_data), vendor=vendor_name)
+    metrics.inc("fmd_parsed_rows", nrows, vendor=vendor_name)
+    return processed_data
+
+
+def compact_data_processing(
+    vendor_name: str, data: typing.Dict[str, typing.Union[typing.List, typing.Dict]], dtypes: typing.Dict[str, typing.Any] = COMPACT_DTYPES
+) -> CompactBars:
+    """
+    Preprocess the raw time series of many symbols into CompactBars. Records are processed batch by batch of
+    about LARGE_PAYLOAD_ROWS rows, so that a single batch is held as float64 frames at a time.
+    """
+    if vendor_name not in BATCH_DATA_PROCESSORS:
+        return CompactBars.from_frames(batch_data_processing(vendor_name, data), dtypes)
+    extract_records, batch_processor = BATCH_DATA_PROCESSORS[vendor_name]
+    records_by_symbol = {symbol: extract_records(symbol_data) for symbol, symbol_data in data.items()}
+    batches = _schema_batches(records_by_symbol, max_rows=LARGE_PAYLOAD_ROWS)
+    return CompactBars.concat([CompactBars.from_frames(batch_processor(batch), dtypes) for batch in batches], dtypes)
+
+
+def remove_duplicates(existing_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
     """
-    Remove duplicated data
+    Remove from new_df the rows whose index is already in existing_df
     """
     duplicates = existing_df.index.intersection(new_df.index)
     if duplicates.empty:
         return new_df
     else:
-        return new_df.drop(duplicates, inplace=True)
+        return new_df.drop(duplicates)
@@ -1,52 +1,213 @@
+import time
+import random
 import typing
 import asyncio
-import logging.config
+import aiohttp
+import collections
+import logging
 from functools import wraps
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-from fmd.utils.log import logging_dict
+from fmd.utils.metrics import get_metrics_registry
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
+# Statuses worth retrying: rate limited and server side errors, every other status is permanent
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest Retry-After honoured, in seconds
+MAX_RETRY_AFTER = 120.0
+
+# Consecutive retryable failures opening the circuit of a host, and seconds it stays open
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 10.0
+
+
+class HttpError(ValueError):
+    """Unexpected response status"""
+
+    def __init__(self, status: int, retry_after: typing.Optional[float] = None) -> None:
+        super().__init__(f"Uncorrect response status: {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RetryableHttpError(HttpError):
+    """Rate limited (429) or server side (5xx) error, worth retrying"""
+
+
+class PermanentHttpError(HttpError):
+    """Client side error (e.g. 401, 404), retrying would fail the same way"""
+
+
+class UnexpectedContentError(ValueError):
+    pass
+
+
+# Exceptions retried by `retry`: retryable statuses, timeouts and dropped connections
+RETRYABLE_EXCEPTIONS = (RetryableHttpError, asyncio.TimeoutError, aiohttp.ClientConnectionError)
+
+# Attempts outcomes of every retried call, see `get_retry_counters`
+_retry_counters: typing.Counter[typing.Tuple[str, str]] = collections.Counter()
+
+
+def get_retry_counters() -> typing.Dict[typing.Tuple[str, str], int]:
+    """Snapshot of the attempts counters keyed by (host, outcome), outcomes are "attempt", "success", "retry",
+    "permanent_error", "exhausted" and "circuit_wait", the host is "" when calls are not bound to a host"""
+    return dict(_retry_counters)
+
+
+def _count_attempt(host: str, outcome: str) -> None:
+    _retry_counters[host, outcome] += 1
+    get_metrics_registry().inc("fmd_retry_attempts", host=host, outcome=outcome)
+
+
+def parse_retry_after(value: typing.Optional[str]) -> typing.Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        _logger.debug("Unexpected Retry-After header: %s", value)
+        return None
+
 
 def response_handler():
     pass
 
 
-async def async_response_handler(
-    status: int, headers: typing.Dict, response_text: typing.Callable
-) -> None:
+async def async_response_handler(status: int, headers: typing.Dict, response_text: typing.Callable) -> None:
     if status != 200:
-        raise ValueError(f"Uncorrect response status: {status}")
+        if status in RETRYABLE_STATUSES:
+            raise RetryableHttpError(status, parse_retry_after(headers.get("Retry-After")))
+        raise PermanentHttpError(status)
     # Blank space in case of no content type
     content_type = headers.get("Content-Type", "").lower()
     if not content_type.startswith("application/json"):
         text = await response_text()
-        _logger.error(f"Unexpected content type: {content_type}")
-        _logger.error(f"First 200 characters content of the response: {text[:200]}")
-        raise ValueError(f"Unexpected content: {content_type}")
+        _logger.error("Unexpected content type: %s", content_type)
+        _logger.error("First 200 characters content of the response: %s", text[:200])
+        raise UnexpectedContentError(f"Unexpected content: {content_type}")
+
+
+class CircuitBreaker:
+    """
+    Shared by every request to a host. After `failure_threshold` consecutive retryable failures, or a Retry-After,
+    the circuit opens: requests wait until it is half open, then a single probe request is let through.
+    A successful probe closes the circuit, a failed one opens it again. Waits are loop agnostic (no asyncio lock).
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0.0
+        # a probe that never reports back (e.g. cancelled) is replaced once this deadline is over
+        self._probe_deadline = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until > 0
+
+    async def wait(self) -> bool:
+        """Wait until a request can be sent, returns whether it had to wait"""
+        waited = False
+        while self.is_open:
+            now = time.monotonic()
+            if now >= self.open_until and now >= self._probe_deadline:
+                self._probe_deadline = now + self.reset_timeout
+                break
+            waited = True
+            await asyncio.sleep(max(self.open_until - now, 0) + random.uniform(0, 0.1))
+        return waited
 
+    def record_success(self) -> None:
+        if self.is_open:
+            _logger.info("Circuit closed, the host answers again")
+        self.failures = 0
+        self.open_until = self._probe_deadline = 0.0
+
+    def record_failure(self, retry_after: typing.Optional[float] = None) -> None:
+        self.failures += 1
+        if self.is_open or self.failures >= self.failure_threshold or retry_after:
+            delay = min(retry_after, MAX_RETRY_AFTER) if retry_after else self.reset_timeout
+            if not self.is_open:
+                _logger.warning("Circuit open for %.1fs after %d failures", delay, self.failures)
+            self.open_until = time.monotonic() + delay
+            self._probe_deadline = 0.0
+
+
+_circuit_breakers: typing.Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """Process wide circuit breaker of a host, created on first use"""
+    if host not in _circuit_breakers:
+        _circuit_breakers[host] = CircuitBreaker()
+    return _circuit_breakers[host]
+
+
+# Retry mechanism with jittered exponential backoff, honouring Retry-After
+def retry(
+    base_delay: float,
+    max_delay: float,
+    max_tries: int,
+    retry_on: typing.Tuple[typing.Type[BaseException], ...] = RETRYABLE_EXCEPTIONS,
+    host_of: typing.Optional[typing.Callable[..., str]] = None,
+):
+    """
+    Retry the exceptions of `retry_on` up to `max_tries` attempts, other exceptions are raised right away.
+    Delays are drawn uniformly up to the exponential backoff (full jitter) so that failed tasks do not retry in
+    lockstep, a Retry-After of the response takes precedence. With `host_of`, returning the host of a call from
+    its arguments, calls to a host share its circuit breaker.
+    """
 
-# Simple retry mechanism with exponential backoff
-def retry(base_delay: float, max_delay: float, max_tries: int):
     def decorator(func: typing.Callable) -> typing.Callable:
         @wraps(func)
         async def wrapper(*args, **kwargs) -> typing.Any:
+            host = host_of(*args, **kwargs) if host_of is not None else ""
+            breaker = get_circuit_breaker(host) if host_of is not None else None
             for attempt in range(max_tries):
+                if breaker is not None and await breaker.wait():
+                    _count_attempt(host, "circuit_wait")
+                _count_attempt(host, "attempt")
                 try:
-                    _logger.debug(f"Attempt {attempt +1} for {func.__name__}...")
-                    return await func(*args, **kwargs)
-                except Exception as exc:
+                    _logger.debug("Attempt %d for %s...", attempt + 1, func.__name__)
+                    result = await func(*args, **kwargs)
+                except retry_on as exc:
+                    retry_after = getattr(exc, "retry_after", None)
+                    if breaker is not None:
+                        breaker.record_failure(retry_after)
                     if attempt == max_tries - 1:
-                        _logger.error(
-                            f"All {max_tries} attempts failed for {func.__name__}. Exception raised: {str(exc)}"
-                        )
+                        _count_attempt(host, "exhausted")
+                        _logger.error("All %d attempts failed for %s. Exception raised: %s", max_tries, func.__name__, exc)
                         raise
+                except Exception as exc:
+                    _count_attempt(host, "permanent_error")
+                    if breaker is not None:
+                        # the host answered, only the request is wrong
+                        breaker.record_success()
+                    _logger.debug("Not retrying %s, exception raised: %s", func.__name__, exc)
+                    raise
+                else:
+                    _count_attempt(host, "success")
+                    if breaker is not None:
+                        breaker.record_success()
+                    return result
 
-                delay = min(base_delay * (2**attempt), max_delay)  # exponential backoff
-                _logger.debug(f"Failed attempt {attempt +1} for {func.__name__}...")
-                _logger.debug(f"Waiting {delay} seconds before trying again for {func.__name__}...")
+                _count_attempt(host, "retry")
+                delay = random.uniform(0, min(base_delay * (2**attempt), max_delay))  # jittered exponential backoff
+                if retry_after is not None:
+                    delay = min(retry_after, MAX_RETRY_AFTER)
+                _logger.debug("Failed attempt %d for %s, waiting %.2f seconds before trying again", attempt + 1, func.__name__, delay)
+                get_metrics_registry().inc("fmd_retry_wait_seconds", delay, host=host)
                 await asyncio.sleep(delay)
 
         return wrapper
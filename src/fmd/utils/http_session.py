@@ -0,0 +1,106 @@
+import atexit
+import typing
+import asyncio
+import aiohttp
+import requests
+import logging
+from requests.adapters import HTTPAdapter
+
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+
+class HttpSessionPool:
+    """
+    Long-lived HTTP sessions shared by every vendor of the process.
+    The aiohttp session keeps connections alive, caches DNS lookups and limits connections per host.
+    The requests session serves the blocking reference calls with its own keep-alive pool.
+    aiohttp sessions are bound to an event loop: one session is kept for the running loop and
+    replaced when a new loop is started (e.g. by another `asyncio.run` call).
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 50,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 60,
+        total_timeout: float = 30,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.total_timeout = total_timeout
+        self._aio_session = None
+        self._aio_loop = None
+        self._sync_session = None
+
+    @property
+    def aio_session(self) -> aiohttp.ClientSession:
+        """aiohttp session bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._aio_session is None or self._aio_session.closed or self._aio_loop is not loop:
+            if self._aio_session is not None and not self._aio_session.closed:
+                # The previous loop is gone, its connections cannot be reused anymore
+                _logger.debug("Event loop changed, replacing the shared aiohttp session")
+                self._aio_session.detach()
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._aio_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.total_timeout))
+            self._aio_loop = loop
+        return self._aio_session
+
+    @property
+    def sync_session(self) -> requests.Session:
+        """requests session used by the blocking reference data calls"""
+        if self._sync_session is None:
+            adapter = HTTPAdapter(pool_connections=self.limit, pool_maxsize=self.limit_per_host)
+            self._sync_session = requests.Session()
+            self._sync_session.mount("https://", adapter)
+            self._sync_session.mount("http://", adapter)
+        return self._sync_session
+
+    async def aclose(self) -> None:
+        """Close every session of the pool, to be awaited once at shutdown"""
+        if self._aio_session is not None and not self._aio_session.closed:
+            await self._aio_session.close()
+        self._aio_session = None
+        self._aio_loop = None
+        self.close_sync_session()
+
+    def close_sync_session(self) -> None:
+        if self._sync_session is not None:
+            self._sync_session.close()
+            self._sync_session = None
+
+    def _close_at_exit(self) -> None:
+        self.close_sync_session()
+        if self._aio_session is not None and not self._aio_session.closed:
+            if self._aio_loop is not None and not self._aio_loop.is_closed() and not self._aio_loop.is_running():
+                self._aio_loop.run_until_complete(self._aio_session.close())
+            else:
+                self._aio_session.detach()
+
+
+_default_pool: typing.Optional[HttpSessionPool] = None
+
+
+def get_http_session_pool() -> HttpSessionPool:
+    """Process wide session pool, created on first use and closed at interpreter exit"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = HttpSessionPool()
+        atexit.register(_default_pool._close_at_exit)
+    return _default_pool
+
+
+async def close_http_session_pool() -> None:
+    """Close the process wide session pool"""
+    if _default_pool is not None:
+        await _default_pool.aclose()
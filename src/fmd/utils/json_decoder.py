@@ -0,0 +1,51 @@
+import json
+import typing
+import itertools
+import numpy as np
+from operator import itemgetter
+
+try:
+    import orjson
+except ImportError:  # optional, the `fast-json` extra, falls back on the standard library decoder
+    orjson = None
+
+# Column dtypes of polygon aggregates bars, other fields are kept as python objects
+POLYGON_BAR_DTYPES = {
+    "t": np.int64,
+    "o": np.float64,
+    "h": np.float64,
+    "l": np.float64,
+    "c": np.float64,
+    "v": np.float64,
+    "vw": np.float64,
+    "n": np.int64,
+    "otc": np.bool_,
+}
+
+
+def loads(raw: typing.Union[bytes, str]) -> typing.Any:
+    """Decode json with orjson when it is installed, with the standard library otherwise"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def records_to_columns(records: typing.List[typing.Dict], dtypes: typing.Dict[str, typing.Any]) -> typing.Dict[str, np.ndarray]:
+    """Transpose json records into one array per field found in any record, e.g. `vw` and `n` missing from sparse bars"""
+    columns = {}
+    for field in dict.fromkeys(itertools.chain.from_iterable(records)):
+        dtype = dtypes.get(field, object)
+        try:
+            columns[field] = np.fromiter(map(itemgetter(field), records), dtype=dtype, count=len(records))
+        except (KeyError, TypeError, ValueError):
+            # field missing or null in some records, numeric columns fall back on floats with NaNs
+            values = [record.get(field) for record in records]
+            columns[field] = np.array(values, dtype=np.float64 if dtype is not object else object)
+    return columns
+
+
+def decode_polygon_aggregates(raw: bytes) -> typing.Dict:
+    """Decode an aggregates response with its `results` bars as column arrays (t/o/h/l/c/v/vw/n)"""
+    payload = loads(raw)
+    payload["results"] = records_to_columns(payload.get("results") or [], POLYGON_BAR_DTYPES)
+    return payload
@@ -1,12 +1,26 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import typing
 import logging
+import threading
 import traceback
-import sys
+import logging.config
+import logging.handlers
 from pathlib import Path
 
-# Location for logs
+# Location for logs, created when logging is configured, `FMD_LOG_DIR` moves them elsewhere
 BASE_DIR = Path(__file__).resolve().parents[3]
-LOGS_DIR = Path(BASE_DIR, "logs")
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
+LOGS_DIR = Path(os.environ.get("FMD_LOG_DIR", Path(BASE_DIR, "logs")))
+
+# Level of the root logger, i.e. of the log file, the console stays at INFO
+LOG_LEVEL = os.environ.get("FMD_LOG_LEVEL", "DEBUG")
+
+# Warnings and errors of the same message template let through per period, the rest are counted and dropped
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_PERIOD = 60.0
 
 # logging config
 logging_dict = {
@@ -48,6 +62,80 @@ logging_dict = {
 }
 
 
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` warnings and errors of a logger message template per `period` seconds,
+    the first one let through in the next period reports how many were dropped.
+    Messages logged lazily (`_logger.warning("No data fetched for symbol: %s", symbol)`) share their template
+    across symbols, so a warning repeated for thousands of symbols is only written `burst` times.
+    """
+
+    # windows kept before the expired ones are dropped, f-string messages each open their own window
+    MAX_WINDOWS = 10_000
+
+    def __init__(self, burst: int = RATE_LIMIT_BURST, period: float = RATE_LIMIT_PERIOD) -> None:
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        # (logger name, template) -> [window start, records let through, records dropped]
+        self._windows: typing.Dict[typing.Tuple[str, typing.Any], typing.List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not logging.WARNING <= record.levelno < logging.CRITICAL:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.period:
+                if window[1] < self.burst:
+                    window[1] += 1
+                    return True
+                window[2] += 1
+                return False
+            if len(self._windows) >= self.MAX_WINDOWS:
+                self._windows = {key: window for key, window in self._windows.items() if now - window[0] < self.period}
+            self._windows[key] = [now, 1, 0]
+        if window is not None and window[2]:
+            record.msg = f"{record.msg} [{window[2]} similar messages dropped]"
+        return True
+
+
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(
+    config: typing.Dict = logging_dict, level: typing.Union[int, str, None] = None, log_dir: typing.Union[str, Path, None] = None
+) -> None:
+    """
+    Configure logging once per process, further calls are no-ops. The handlers of `config` are moved behind a
+    queue drained by a listener thread, so that logging calls on the event loop never wait for file or console I/O.
+    `log_dir` overrides the directory of the log file, LOGS_DIR by default.
+    Importing fmd does not configure logging: the `fmd` command calls this, scripts and notebooks call it themselves.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_dir = Path(log_dir) if log_dir is not None else LOGS_DIR
+    log_dir.mkdir(parents=True, exist_ok=True)
+    if "mainloader" in config.get("handlers", {}):
+        mainloader = {**config["handlers"]["mainloader"], "filename": Path(log_dir, "mainloader.log")}
+        config = {**config, "handlers": {**config["handlers"], "mainloader": mainloader}}
+    logging.config.dictConfig(config)
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    _listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [queue_handler]
+    _listener.start()
+    # the listener writes the queued records before the interpreter exits
+    atexit.register(_listener.stop)
+
+
 # Decorator function for logging traceback exception
 def log_exception(logger):
     def decorator(func):
@@ -0,0 +1,260 @@
+import os
+import time
+import bisect
+import typing
+import threading
+import contextlib
+import logging
+from pathlib import Path
+
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Histogram upper bounds, in seconds and in bytes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+COUNTER, GAUGE, HISTOGRAM = "counter", "gauge", "histogram"
+
+LabelSet = typing.Tuple[typing.Tuple[str, str], ...]
+
+
+class MetricDefinition(typing.NamedTuple):
+    name: str
+    kind: str
+    help: str
+    buckets: typing.Tuple[float, ...] = ()
+
+
+class MetricSample(typing.NamedTuple):
+    """A single observation, as handed to the hooks"""
+
+    name: str
+    kind: str
+    labels: typing.Dict[str, str]
+    value: float
+
+
+MetricsHook = typing.Callable[[MetricSample], None]
+
+# Instrumentation of the fetch, parse and archive stages. Per symbol timings are histograms labelled by vendor
+# or backend rather than by symbol, so that the number of series does not grow with the universe.
+BUILTIN_METRICS = (
+    MetricDefinition("fmd_http_request_duration_seconds", HISTOGRAM, "Latency of the vendor requests sent", LATENCY_BUCKETS),
+    MetricDefinition("fmd_http_response_size_bytes", HISTOGRAM, "Body size of the vendor responses received", SIZE_BUCKETS),
+    MetricDefinition("fmd_http_requests_in_flight", GAUGE, "Vendor requests waiting for their response"),
+    MetricDefinition("fmd_http_cache_hits", COUNTER, "Vendor requests served from the response cache"),
+    MetricDefinition("fmd_retry_attempts", COUNTER, "Outcomes of the retried calls"),
+    MetricDefinition("fmd_retry_wait_seconds", COUNTER, "Time spent waiting between retries"),
+    MetricDefinition("fmd_parse_seconds", HISTOGRAM, "Processing time of a batch of symbols, or of a single symbol", LATENCY_BUCKETS),
+    MetricDefinition("fmd_parsed_symbols", COUNTER, "Symbols processed"),
+    MetricDefinition("fmd_parsed_rows", COUNTER, "Rows processed"),
+    MetricDefinition("fmd_archive_write_seconds", HISTOGRAM, "Append time of a symbol into its archive", LATENCY_BUCKETS),
+    MetricDefinition("fmd_archived_rows", COUNTER, "Rows handed to the archive backends"),
+)
+
+
+def _label_set(labels: typing.Dict[str, typing.Any]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, buckets: typing.Tuple[float, ...]) -> None:
+        # one count per bucket, the last one catches the values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms, safe to update from the event loop and the writer threads.
+    Every observation is also handed to the registered hooks (e.g. a statsd or OpenTelemetry bridge),
+    the registry itself exports in the OpenMetrics text format.
+    """
+
+    def __init__(self, definitions: typing.Iterable[MetricDefinition] = BUILTIN_METRICS) -> None:
+        self._lock = threading.Lock()
+        self._definitions: typing.Dict[str, MetricDefinition] = {}
+        self._values: typing.Dict[str, typing.Dict[LabelSet, typing.Any]] = {}
+        self._hooks: typing.List[MetricsHook] = []
+        for definition in definitions:
+            self.register(*definition)
+
+    def register(self, name: str, kind: str, help: str, buckets: typing.Iterable[float] = ()) -> None:
+        """Declare a metric, declaring it again with the same kind is a no-op"""
+        if kind not in (COUNTER, GAUGE, HISTOGRAM):
+            _logger.error(f"Unexpected metric kind: {kind}")
+            raise ValueError(f"Unexpected metric kind: {kind}")
+        buckets = tuple(sorted(buckets))
+        if kind == HISTOGRAM and not buckets:
+            buckets = LATENCY_BUCKETS
+        with self._lock:
+            existing = self._definitions.get(name)
+            if existing is not None and existing.kind != kind:
+                _logger.error(f"Metric {name} is already registered as a {existing.kind}")
+                raise ValueError(f"Metric {name} is already registered as a {existing.kind}")
+            if existing is None:
+                self._definitions[name] = MetricDefinition(name, kind, help, buckets)
+                self._values[name] = {}
+
+    def _definition(self, name: str, *kinds: str) -> MetricDefinition:
+        definition = self._definitions.get(name)
+        if definition is None or definition.kind not in kinds:
+            _logger.error(f"Unknown {' or '.join(kinds)} metric: {name}")
+            raise ValueError(f"Unknown {' or '.join(kinds)} metric: {name}")
+        return definition
+
+    def _notify(self, definition: MetricDefinition, labels: typing.Dict[str, typing.Any], value: float) -> None:
+        for hook in self._hooks:
+            try:
+                hook(MetricSample(definition.name, definition.kind, labels, value))
+            except Exception as exc:
+                _logger.debug(f"Metrics hook {hook} failed: {exc}")
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Increment a counter, or a gauge"""
+        definition = self._definition(name, COUNTER, GAUGE)
+        if definition.kind == COUNTER and value < 0:
+            raise ValueError(f"Counter {name} can only increase, got: {value}")
+        label_set = _label_set(labels)
+        with self._lock:
+            values = self._values[name]
+            values[label_set] = values.get(label_set, 0.0) + value
+        if self._hooks:
+            self._notify(definition, labels, value)
+
+    def dec(self, name: str, value: float = 1.0, **labels) -> None:
+        """Decrement a gauge"""
+        self._definition(name, GAUGE)
+        self.inc(name, -value, **labels)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge"""
+        definition = self._definition(name, GAUGE)
+        with self._lock:
+            self._values[name][_label_set(labels)] = value
+        if self._hooks:
+            self._notify(definition, labels, value)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record an observation into a histogram"""
+        definition = self._definition(name, HISTOGRAM)
+        label_set = _label_set(labels)
+        with self._lock:
+            histogram = self._values[name].get(label_set)
+            if histogram is None:
+                histogram = self._values[name][label_set] = _Histogram(definition.buckets)
+            histogram.counts[bisect.bisect_left(definition.buckets, value)] += 1
+            histogram.count += 1
+            histogram.sum += value
+        if self._hooks:
+            self._notify(definition, labels, value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> typing.Iterator[None]:
+        """Observe the duration of the block into a histogram, failed blocks included"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_hook(self, hook: MetricsHook) -> None:
+        """Call `hook` with every subsequent observation, hooks run inline and must be cheap"""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: MetricsHook) -> None:
+        self._hooks.remove(hook)
+
+    def value(self, name: str, **labels) -> typing.Union[float, typing.Tuple[int, float]]:
+        """Current value of a counter or gauge series, (count, sum) of a histogram series"""
+        definition = self._definition(name, COUNTER, GAUGE, HISTOGRAM)
+        with self._lock:
+            current = self._values[name].get(_label_set(labels))
+        if definition.kind == HISTOGRAM:
+            return (current.count, current.sum) if current is not None else (0, 0.0)
+        return current or 0.0
+
+    def reset(self) -> None:
+        """Drop every recorded value, the definitions are kept"""
+        with self._lock:
+            self._values = {name: {} for name in self._definitions}
+
+    def to_openmetrics(self) -> str:
+        """Exposition of every metric in the OpenMetrics text format"""
+        lines = []
+        with self._lock:
+            for name, definition in self._definitions.items():
+                lines.append(f"# TYPE {name} {definition.kind}")
+                lines.append(f"# HELP {name} {_escape(definition.help)}")
+                for label_set, current in self._values[name].items():
+                    if definition.kind == COUNTER:
+                        lines.append(f"{name}_total{_format_labels(label_set)} {_format_value(current)}")
+                    elif definition.kind == GAUGE:
+                        lines.append(f"{name}{_format_labels(label_set)} {_format_value(current)}")
+                    else:
+                        cumulative = 0
+                        for bound, count in zip((*definition.buckets, float("inf")), current.counts):
+                            cumulative += count
+                            bucket_labels = _format_labels((*label_set, ("le", _format_value(bound))))
+                            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                        lines.append(f"{name}_count{_format_labels(label_set)} {current.count}")
+                        lines.append(f"{name}_sum{_format_labels(label_set)} {_format_value(current.sum)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_openmetrics(self, path: typing.Union[str, Path]) -> None:
+        """Write the exposition to a file atomically, e.g. for the node exporter textfile collector"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.to_openmetrics())
+        os.replace(tmp_path, path)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9464):
+        """Serve the exposition on http://host:port/metrics, returns the aiohttp runner to clean up once done"""
+        from aiohttp import web
+
+        async def metrics_handler(request: web.Request) -> web.Response:
+            return web.Response(body=self.to_openmetrics().encode(), headers={"Content-Type": OPENMETRICS_CONTENT_TYPE})
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        _logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return runner
+
+
+_default_registry: typing.Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Process wide metrics registry"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = MetricsRegistry()
+    return _default_registry
@@ -0,0 +1,47 @@
+import time
+import typing
+import asyncio
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket limiter shared by all the requests sent to a vendor.
+    Tokens are refilled continuously at `rate` per second, up to `capacity`.
+    A small capacity paces requests evenly instead of letting them burst.
+    """
+
+    def __init__(self, rate: float, capacity: typing.Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be strictly positive, got: {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1.0
+        if self.capacity < 1:
+            raise ValueError(f"Token bucket capacity must be at least 1, got: {self.capacity}")
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = None
+        self._lock_loop = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        """asyncio locks are bound to a loop, create one for each running loop"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available and consume them"""
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}")
+        async with self._get_lock():
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
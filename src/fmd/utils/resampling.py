@@ -0,0 +1,133 @@
+import typing
+import logging
+import numpy as np
+import pandas as pd
+
+from fmd.utils.data_process_utils import split_by_symbol
+from fmd.storage.backend import StorageBackend
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Fixed size buckets are floored on the timestamps, calendar buckets follow the periods (weeks start on Sunday)
+FIXED_BUCKETS = {"second": "s", "minute": "min", "hour": "h", "day": "D"}
+CALENDAR_BUCKETS = {"week": "W-SAT", "month": "M", "quarter": "Q", "year": "Y"}
+
+# Aggregation of the processed bars columns, the volume weighted average price is weighted by the volume
+# of the bars having one
+BAR_AGGREGATIONS = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "adjusted_close": "last",
+    "volume": "sum",
+    "number_of_transactions": "sum",
+}
+VWAP_COLUMN = "volume_weighted_average_price"
+
+
+def bucket_starts(index: pd.DatetimeIndex, timespan: str, multiplier: int = 1, tz: typing.Optional[str] = None) -> pd.DatetimeIndex:
+    """Start of the bucket of each (naive UTC) timestamp.
+    With `tz`, buckets follow the wall clock of that timezone (e.g. daily bars of an exchange), starts stay naive UTC."""
+    if tz is not None:
+        index = index.tz_localize("UTC").tz_convert(tz).tz_localize(None)
+
+    if timespan in FIXED_BUCKETS:
+        starts = index.floor(f"{multiplier}{FIXED_BUCKETS[timespan]}")
+    elif timespan in CALENDAR_BUCKETS:
+        freq = CALENDAR_BUCKETS[timespan]
+        periods = index.to_period(freq)
+        starts = (periods - periods.asi8 % multiplier).start_time
+    else:
+        _logger.error(f"Unexpected timespan: {timespan}!")
+        raise ValueError(f"Unexpected timespan: {timespan}, expected one of {[*FIXED_BUCKETS, *CALENDAR_BUCKETS]}")
+
+    if tz is not None:
+        starts = starts.tz_localize(tz, ambiguous=False, nonexistent="shift_forward").tz_convert("UTC").tz_localize(None)
+    return pd.DatetimeIndex(starts, name=index.name)
+
+
+def bucket_ends(starts: pd.DatetimeIndex, timespan: str, multiplier: int = 1, tz: typing.Optional[str] = None) -> pd.DatetimeIndex:
+    """Exclusive end of buckets given their starts"""
+    if tz is not None:
+        starts = starts.tz_localize("UTC").tz_convert(tz).tz_localize(None)
+    if timespan in FIXED_BUCKETS:
+        ends = starts + multiplier * pd.Timedelta(1, FIXED_BUCKETS[timespan])
+    else:
+        ends = (starts.to_period(CALENDAR_BUCKETS[timespan]) + multiplier).start_time
+    if tz is not None:
+        ends = ends.tz_localize(tz, ambiguous=False, nonexistent="shift_forward").tz_convert("UTC").tz_localize(None)
+    return pd.DatetimeIndex(ends)
+
+
+def resample_bars(
+    bars: typing.Dict[str, pd.DataFrame], timespan: str, multiplier: int = 1, tz: typing.Optional[str] = None
+) -> typing.Dict[str, pd.DataFrame]:
+    """
+    Aggregate the base bars of many symbols into coarser bars in a single grouped pass, returns {symbol: bars}
+    indexed by bucket start. OHLC take the first/max/min/last values, volumes and transactions are summed and
+    the VWAP is the volume weighted mean of the base VWAPs, bars without a VWAP are left out of its weights.
+    """
+    bars = {symbol: symbol_bars for symbol, symbol_bars in bars.items() if not symbol_bars.empty}
+    if not bars:
+        return {}
+    symbols = list(bars)
+    df = pd.concat(bars.values(), ignore_index=False)
+    df.index.name = "date"
+    df["symbol"] = pd.Categorical.from_codes(np.repeat(np.arange(len(symbols)), [len(bars[symbol]) for symbol in symbols]), categories=symbols)
+    df["bucket"] = bucket_starts(df.index, timespan, multiplier, tz)
+    df = df.reset_index().sort_values(["symbol", "date"], kind="stable")
+
+    aggregations = {column: (column, aggregation) for column, aggregation in BAR_AGGREGATIONS.items() if column in df}
+    if VWAP_COLUMN in df and "volume" in df:
+        df["_vwap_volume"] = df["volume"].where(df[VWAP_COLUMN].notna())
+        df["_price_volume"] = df[VWAP_COLUMN] * df["_vwap_volume"]
+        aggregations["_price_volume"] = ("_price_volume", "sum")
+        aggregations["_vwap_volume"] = ("_vwap_volume", "sum")
+    resampled = df.groupby(["symbol", "bucket"], observed=True, sort=True).agg(**aggregations)
+
+    if "_price_volume" in resampled:
+        vwap_volume = resampled.pop("_vwap_volume")
+        resampled[VWAP_COLUMN] = resampled.pop("_price_volume") / vwap_volume.where(vwap_volume > 0)
+    resampled = resampled.reset_index().rename(columns={"bucket": "date"})
+    return {symbol: symbol_bars.copy() for symbol, symbol_bars in split_by_symbol(resampled).items()}
+
+
+def update_resampled_bars(
+    resampled: typing.Dict[str, pd.DataFrame],
+    new_bars: typing.Dict[str, pd.DataFrame],
+    source: StorageBackend,
+    timespan: str,
+    multiplier: int = 1,
+    tz: typing.Optional[str] = None,
+) -> typing.Dict[str, pd.DataFrame]:
+    """
+    Refresh resampled bars after `new_bars` were archived to `source`: only the buckets touched by the new bars
+    are recomputed, from the base bars of those buckets read back from the archive. `resampled` is updated in place.
+    """
+    affected = {}
+    for symbol, symbol_bars in new_bars.items():
+        if symbol_bars.empty:
+            continue
+        starts = bucket_starts(pd.DatetimeIndex([symbol_bars.index.min(), symbol_bars.index.max()]), timespan, multiplier, tz)
+        affected[symbol] = (starts[0], bucket_ends(starts[-1:], timespan, multiplier, tz)[0])
+    if not affected:
+        return resampled
+
+    # one read covering every affected range, the base bars outside each symbol range are dropped right after
+    start = min(bounds[0] for bounds in affected.values())
+    end = max(bounds[1] for bounds in affected.values())
+    base_bars = source.read(list(affected), start=start, end=end - pd.Timedelta(1, "ns"))
+    for symbol, symbol_bars in base_bars.items():
+        bucket_start, bucket_end = affected[symbol]
+        base_bars[symbol] = symbol_bars[(symbol_bars.index >= bucket_start) & (symbol_bars.index < bucket_end)]
+
+    for symbol, recomputed in resample_bars(base_bars, timespan, multiplier, tz).items():
+        existing = resampled.get(symbol)
+        if existing is None or existing.empty:
+            resampled[symbol] = recomputed
+            continue
+        kept = existing[~existing.index.isin(recomputed.index)]
+        resampled[symbol] = pd.concat([kept, recomputed]).sort_index()
+    return resampled
@@ -0,0 +1,149 @@
+import time
+import typing
+import sqlite3
+import requests
+import threading
+import logging
+from pathlib import Path
+from urllib.parse import urlencode
+
+from fmd.utils.paths import OUT_DIR
+from fmd.utils.json_decoder import loads
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_PATH = Path(OUT_DIR, "cache", "responses.sqlite")
+
+# Credentials never take part in cache keys
+API_KEY_PARAMS = ("api_token", "apiKey")
+
+
+class CachedResponse(typing.NamedTuple):
+    body: bytes
+    etag: typing.Optional[str]
+    last_modified: typing.Optional[str]
+    stored_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.stored_at < ttl
+
+
+class ResponseCache:
+    """
+    On-disk cache of reference data responses, stored in SQLite.
+    Entries are keyed on url and params without api keys, served while younger than their endpoint ttl
+    and revalidated with ETag/Last-Modified afterwards. Least recently used entries are evicted once the
+    cache grows above `max_size_bytes`.
+    """
+
+    def __init__(self, path: typing.Union[str, Path] = RESPONSE_CACHE_PATH, max_size_bytes: int = 256 * 1024**2) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    @staticmethod
+    def make_key(url: str, params: typing.Optional[typing.Dict] = None) -> str:
+        params = sorted((key, str(value)) for key, value in (params or {}).items() if key not in API_KEY_PARAMS)
+        return f"{url}?{urlencode(params)}"
+
+    def get(self, key: str) -> typing.Optional[CachedResponse]:
+        with self._lock:
+            row = self._connection.execute("SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(*row) if row is not None else None
+
+    def set(self, key: str, body: bytes, etag: typing.Optional[str] = None, last_modified: typing.Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, stored_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, len(body)),
+            )
+            self._evict()
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as fresh again, after a successful revalidation"""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self) -> None:
+        (total_size,) = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+        evicted = 0
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total_size <= self.max_size_bytes:
+                break
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            evicted += 1
+        _logger.debug(f"{evicted} responses evicted from cache")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def conditional_headers(entry: typing.Optional[CachedResponse]) -> typing.Dict[str, str]:
+        """Revalidation headers of a stale entry"""
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+
+def cached_get_json(
+    session: requests.Session, cache: typing.Optional[ResponseCache], url: str, params: typing.Dict, ttl: typing.Optional[float]
+) -> typing.Any:
+    """Blocking json get served from `cache` while fresh, revalidated once stale"""
+    if cache is None or not ttl:
+        return session.get(url=url, params=params).json()
+
+    key = cache.make_key(url, params)
+    entry = cache.get(key)
+    if entry is not None and entry.is_fresh(ttl):
+        return loads(entry.body)
+
+    response = session.get(url=url, params=params, headers=cache.conditional_headers(entry))
+    if response.status_code == 304 and entry is not None:
+        cache.touch(key)
+        return loads(entry.body)
+    if response.status_code == 200:
+        cache.set(key, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return response.json()
+
+
+_default_cache: typing.Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Process wide response cache, created on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
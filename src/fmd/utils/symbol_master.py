@@ -0,0 +1,278 @@
+import time
+import typing
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+
+from fmd.utils.paths import METADATA_PATH
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+SYMBOL_MASTER_PATH = Path(METADATA_PATH, "symbols.sqlite")
+
+# Listing columns of the vendor symbol lists, keyed by master column
+LISTING_FIELDS = {
+    "EodhdVendor": {"name": "Name", "exchange": "Exchange", "type": "Type", "country": "Country", "currency": "Currency", "isin": "Isin"},
+    "PolygonVendor": {"name": "name", "exchange": "primary_exchange", "type": "type", "currency": "currency_name", "active": "active"},
+}
+SYMBOL_FIELDS = {"EodhdVendor": "Code", "PolygonVendor": "ticker"}
+
+# Polygon type codes, spelled as the EODHD types so that a single constraint covers both vendors
+POLYGON_TYPES = {
+    "CS": "Common Stock",
+    "PFD": "Preferred Stock",
+    "ADRC": "ADR",
+    "ETF": "ETF",
+    "ETN": "ETN",
+    "FUND": "FUND",
+    "WARRANT": "Warrant",
+    "RIGHT": "Right",
+    "UNIT": "Unit",
+}
+
+COLUMNS = ("vendor", "symbol", "name", "exchange", "type", "sector", "country", "currency", "isin", "market_cap", "active")
+LISTING_COLUMNS = ("name", "exchange", "type", "country", "currency", "isin")
+# Screens mostly bound the market cap, its index covers the other usual constraints so that the table is not read
+INDEXES = {
+    "exchange": "exchange",
+    "type": "type",
+    "sector": "sector",
+    "market_cap": "market_cap, active, type, symbol",
+}
+
+# Constraint operators, as the `column__operator` suffix of build_universe keyword arguments
+OPERATORS = {
+    "eq": "{column} = ?",
+    "ne": "({column} IS NULL OR {column} != ?)",
+    "lt": "{column} < ?",
+    "le": "{column} <= ?",
+    "gt": "{column} > ?",
+    "ge": "{column} >= ?",
+    "in": "{column} IN ({placeholders})",
+    "not_in": "({column} IS NULL OR {column} NOT IN ({placeholders}))",
+}
+
+
+def compile_constraints(constraints: typing.Dict[str, typing.Any]) -> typing.Tuple[str, typing.List]:
+    """
+    WHERE clause and parameters of keyword constraints such as
+    {"market_cap__lt": 300e6, "active": True, "type__ne": "ETF", "exchange__in": ["NYSE", "NASDAQ"]}
+    """
+    clauses, params = [], []
+    for key, value in sorted(constraints.items()):
+        column, _, operator = key.partition("__")
+        operator = operator or "eq"
+        if column not in COLUMNS or operator not in OPERATORS:
+            _logger.error(f"Unexpected universe constraint: {key}")
+            raise ValueError(f"Unexpected universe constraint: {key}")
+        if operator in ("in", "not_in"):
+            values = [int(v) if isinstance(v, bool) else v for v in value]
+            clauses.append(OPERATORS[operator].format(column=column, placeholders=", ".join("?" * len(values))))
+            params.extend(values)
+        else:
+            clauses.append(OPERATORS[operator].format(column=column))
+            params.append(int(value) if isinstance(value, bool) else value)
+    return (" AND ".join(clauses) or "1"), params
+
+
+def _memo_value(value: typing.Any) -> typing.Any:
+    # sets iterate in a per-process hash order, equal sets must share their memo entry
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
+
+def _memo_key(constraints: typing.Dict[str, typing.Any]) -> typing.Tuple:
+    return tuple(sorted((key, _memo_value(value)) for key, value in constraints.items()))
+
+
+class SymbolMaster:
+    """
+    Local master of the vendor listings, stored in SQLite and indexed on exchange, type, sector and market cap.
+    Listings come from the vendor symbol lists, market caps and sectors from the symbol details endpoints.
+    Query results are memoized until the next write, from this process or another one.
+    """
+
+    def __init__(self, path: typing.Union[str, Path] = SYMBOL_MASTER_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memo: typing.Dict[typing.Tuple, typing.List[str]] = {}
+        self._memo_version = -1
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS symbols (
+                vendor TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                name TEXT,
+                exchange TEXT,
+                type TEXT,
+                sector TEXT,
+                country TEXT,
+                currency TEXT,
+                isin TEXT,
+                market_cap REAL,
+                active INTEGER NOT NULL DEFAULT 1,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (vendor, symbol)
+            )
+            """
+        )
+        for name, columns in INDEXES.items():
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS symbols_{name} ON symbols ({columns})")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+
+    def version(self) -> int:
+        """Incremented by every write"""
+        with self._lock:
+            return self._version()
+
+    def _version(self) -> int:
+        return self._connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _write(self, statement: str, rows: typing.List[typing.Tuple]) -> int:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(statement, rows)
+                self._connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            # refresh the planner statistics once the master has grown
+            self._connection.execute("PRAGMA optimize")
+            self._memo.clear()
+        return len(rows)
+
+    def upsert_listings(self, vendor_name: str, records: typing.Iterable[typing.Dict], active: typing.Optional[bool] = None) -> int:
+        """
+        Insert or update the listings of a vendor symbol list (e.g. EodhdVendor.fetch_symbols results).
+        Market caps and sectors already known are kept. `active` overrides the activity of every record,
+        e.g. False for a delisted symbols list.
+        """
+        if vendor_name not in LISTING_FIELDS:
+            _logger.error(f"Unexpected vendor for the symbol master: {vendor_name}")
+            raise ValueError(f"Unexpected vendor for the symbol master: {vendor_name}")
+        fields, symbol_field = LISTING_FIELDS[vendor_name], SYMBOL_FIELDS[vendor_name]
+        now = time.time()
+        rows = []
+        for record in records:
+            listing = {column: record.get(field) for column, field in fields.items()}
+            if vendor_name == "PolygonVendor":
+                listing["type"] = POLYGON_TYPES.get(listing["type"], listing["type"])
+            if active is not None:
+                listing["active"] = active
+            is_active = int(listing.get("active") is not False)
+            listed = (listing.get(column) for column in LISTING_COLUMNS)
+            rows.append((vendor_name, record[symbol_field], *listed, is_active, now))
+        return self._write(
+            """
+            INSERT INTO symbols (vendor, symbol, name, exchange, type, country, currency, isin, active, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (vendor, symbol) DO UPDATE SET
+                name = excluded.name, exchange = excluded.exchange, type = excluded.type, country = excluded.country,
+                currency = excluded.currency, isin = excluded.isin, active = excluded.active, updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+
+    def update_details(self, vendor_name: str, details: typing.Dict[str, typing.Dict]) -> int:
+        """Set market caps and sectors from symbol details, e.g. the results of PolygonVendor.fetch_multi_symbols_details"""
+        now = time.time()
+        rows = []
+        for symbol, payload in details.items():
+            result = payload.get("results", payload)
+            rows.append((result.get("market_cap"), result.get("sic_description"), now, vendor_name, symbol))
+        return self._write(
+            """
+            UPDATE symbols SET market_cap = COALESCE(?, market_cap), sector = COALESCE(?, sector), updated_at = ?
+            WHERE vendor = ? AND symbol = ?
+            """,
+            rows,
+        )
+
+    def refresh(self, vendor, exchange_code: typing.Optional[str] = None) -> int:
+        """Fetch the symbol list of an exchange from `vendor` into the master"""
+        response = vendor.fetch_symbols(exchange_code) if exchange_code else vendor.fetch_symbols()
+        # polygon merges its pages into a single response, eodhd returns the list itself
+        records = response.get("results", []) if isinstance(response, dict) else response
+        count = self.upsert_listings(type(vendor).__name__, records)
+        _logger.info(f"{count} {type(vendor).__name__} listings refreshed for exchange {exchange_code}")
+        return count
+
+    async def refresh_details(self, vendor, symbols: typing.Optional[typing.List[str]] = None) -> int:
+        """Fetch market caps and sectors from the symbol details endpoint of `vendor`, every active listing by default"""
+        vendor_name = type(vendor).__name__
+        if symbols is None:
+            with self._lock:
+                rows = self._connection.execute("SELECT symbol FROM symbols WHERE vendor = ? AND active = 1", (vendor_name,)).fetchall()
+            symbols = [symbol for (symbol,) in rows]
+        details = await vendor.fetch_multi_symbols_details(symbols)
+        count = self.update_details(vendor_name, details)
+        _logger.info(f"{count}/{len(symbols)} {vendor_name} symbol details refreshed")
+        return count
+
+    def query_symbols(self, order_by: typing.Optional[str] = None, limit: typing.Optional[int] = None, **constraints) -> typing.List[str]:
+        """
+        Symbols matching every constraint, listed by any vendor. `order_by` is a column, prefixed with "-"
+        for a descending order, e.g. "-market_cap". Results are memoized until the master changes.
+        """
+        key = (_memo_key(constraints), order_by, limit)
+        where, params = compile_constraints(constraints)
+        descending = bool(order_by) and order_by.startswith("-")
+        order_column = order_by.lstrip("-") if order_by else "symbol"
+        if order_column not in COLUMNS:
+            _logger.error(f"Unexpected universe order: {order_by}")
+            raise ValueError(f"Unexpected universe order: {order_by}")
+        if order_column == "symbol":
+            statement = f"SELECT DISTINCT symbol FROM symbols WHERE {where} ORDER BY symbol {'DESC' if descending else 'ASC'}"
+        else:
+            # a symbol listed by several vendors is ranked by its largest value
+            order = "DESC" if descending else "ASC"
+            statement = f"SELECT symbol FROM symbols WHERE {where} GROUP BY symbol ORDER BY MAX({order_column}) {order}, symbol"
+        if limit is not None:
+            statement += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            version = self._version()
+            if version != self._memo_version:
+                self._memo.clear()
+                self._memo_version = version
+            symbols = self._memo.get(key)
+            if symbols is None:
+                symbols = self._memo[key] = [symbol for (symbol,) in self._connection.execute(statement, params)]
+        return list(symbols)
+
+    def explain(self, **constraints) -> typing.List[str]:
+        """SQLite query plan of a constraints set"""
+        where, params = compile_constraints(constraints)
+        with self._lock:
+            rows = self._connection.execute(f"EXPLAIN QUERY PLAN SELECT symbol FROM symbols WHERE {where}", params).fetchall()
+        return [row[-1] for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+_default_master: typing.Optional[SymbolMaster] = None
+
+
+def get_symbol_master() -> SymbolMaster:
+    """Process wide symbol master"""
+    global _default_master
+    if _default_master is None:
+        _default_master = SymbolMaster()
+    return _default_master
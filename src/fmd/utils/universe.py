@@ -1,8 +1,18 @@
 import typing
+import logging
 from dataclasses import dataclass
 import yaml
 from pathlib import Path
 
+from fmd.utils.paths import UNIVERSE_CONFIG_PATH
+from fmd.utils.symbol_master import SymbolMaster, get_symbol_master
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Parsed configuration files, keyed by path, along with their (modification time, size)
+_config_cache: typing.Dict[Path, typing.Tuple[typing.Tuple[int, int], typing.Dict]] = {}
+
 
 class UniverseError(Exception):
     pass
@@ -15,13 +25,24 @@ class Universe:
     symbols: typing.List[str]
 
 
+def load_universe_config(config_path: typing.Union[str, Path]) -> typing.Dict:
+    """Parsed universe configuration, the file is parsed again only once modified"""
+    config_path = Path(config_path).resolve()
+    stat = config_path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _config_cache.get(config_path)
+    if cached is None or cached[0] != signature:
+        with open(config_path, "r") as yamlfile:
+            cached = _config_cache[config_path] = (signature, yaml.load(yamlfile, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+    return cached[1]
+
+
 class UniverseManager:
-    def __init__(self, config_path: str = "src/fmd/config/universe.yml") -> None:
+    def __init__(self, config_path: typing.Union[str, Path] = UNIVERSE_CONFIG_PATH) -> None:
         self.config_path = Path(config_path)
         if not self.config_path.exists():
             raise FileExistsError("Invalid configuration file path for universe data!")
-        with open(self.config_path, "r") as yamlfile:
-            self.universe_data = yaml.safe_load(yamlfile)
+        self.universe_data = load_universe_config(self.config_path)
 
         self.universes_category_list = list(self.universe_data.keys())
 
@@ -33,7 +54,7 @@ class UniverseManager:
                 # fmt: off
                 universe_name,
                 description=self.universe_data[universe_name]["desc"],
-                symbols=self.universe_data[universe_name]["symbols"]
+                symbols=list(self.universe_data[universe_name]["symbols"])
                 # fmt: on
             )
 
@@ -44,5 +65,21 @@ class UniverseManager:
         """validate universe name"""
         return universe_name in self.universes_category_list
 
-    def build_universe():  # with a constraint like micro caps under ???
-        pass
+    def build_universe(
+        self,
+        universe_name: str,
+        description: str = "",
+        master: typing.Optional[SymbolMaster] = None,
+        order_by: typing.Optional[str] = None,
+        limit: typing.Optional[int] = None,
+        **constraints,
+    ) -> Universe:
+        """
+        Universe of the symbol master listings matching every constraint, e.g. active micro caps which are not ETFs:
+        build_universe("us_micro_caps", market_cap__lt=300e6, active=True, type__ne="ETF", exchange__in=["NYSE", "NASDAQ"])
+        """
+        master = master or get_symbol_master()
+        symbols = master.query_symbols(order_by=order_by, limit=limit, **constraints)
+        if not symbols:
+            _logger.warning(f"No listing of the symbol master matches the constraints of universe {universe_name}: {constraints}")
+        return Universe(universe_name, description=description or f"constraints: {constraints}", symbols=symbols)
@@ -0,0 +1,148 @@
+import asyncio
+import typing
+import logging
+from dataclasses import replace
+
+from fmd.vendors.vendor import MarketDataVendor
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery, VendorResponse
+
+# Initialize logger
+_logger = logging.getLogger(__name__)
+
+# Seconds a vendor has to answer a symbol before the next vendor is asked as well
+HEDGE_DELAY = 2.0
+
+# Timespans served by the time series endpoint of each vendor, vendors missing here serve every timespan
+VENDOR_TIMESPANS = {
+    "EodhdVendor": ("day",),
+}
+
+
+class CompositeVendor:
+    """
+    Fan a time series query out to several vendors, in order of preference (e.g. EODHD then Polygon).
+    Each symbol is requested from the first vendor; when it has not answered after `hedge_delay` seconds
+    the next vendor is asked as well (hedged request) and the first answer wins, the other is cancelled.
+    A symbol failing on a vendor is retried on the next one instead of being dropped.
+    Responses are tagged with the vendor that answered and processed into the normalized OHLCV schema,
+    see `normalize_vendor_data`. Reference data requests go to the first vendor.
+    """
+
+    def __init__(
+        self,
+        vendors: typing.List[MarketDataVendor],
+        hedge_delay: float = HEDGE_DELAY,
+        max_concurrency: typing.Optional[int] = None,
+    ) -> None:
+        if not vendors:
+            raise ValueError("At least one vendor is required!")
+        self.vendors = vendors
+        self.hedge_delay = hedge_delay
+        # symbols in flight, each one holds at most one request per vendor
+        self.max_concurrency = max_concurrency or vendors[0].max_concurrency
+        self.hedged_requests = 0
+        self.fallback_requests = 0
+        self.answers: typing.Dict[str, int] = {vendor.__class__.__name__: 0 for vendor in vendors}
+
+    def fetch_supported_exchanges(self, *args, **kwargs) -> typing.List[typing.Dict]:
+        return self.vendors[0].fetch_supported_exchanges(*args, **kwargs)
+
+    def fetch_symbols(self, *args, **kwargs) -> typing.List[typing.Dict]:
+        return self.vendors[0].fetch_symbols(*args, **kwargs)
+
+    def _query_vendors(self, query: TimeSeriesDataQuery) -> typing.List[MarketDataVendor]:
+        vendors = [vendor for vendor in self.vendors if query.timespan in VENDOR_TIMESPANS.get(vendor.__class__.__name__, (query.timespan,))]
+        if not vendors:
+            _logger.error(f"No vendor serves the {query.timespan} timespan!")
+            raise ValueError(f"Unexpected timespan for the composed vendors: {query.timespan}")
+        return vendors
+
+    async def _fetch_from(
+        self, vendor: MarketDataVendor, symbol: str, query: TimeSeriesDataQuery, errors: typing.Optional[typing.Dict] = None
+    ) -> typing.Optional[VendorResponse]:
+        """Raw data of a single symbol from one vendor, None when the vendor failed (the error goes to `errors`) or returned nothing"""
+        symbol_query = replace(
+            query,
+            universe=Universe(query.universe.name, query.universe.description, [symbol]),
+            symbols_start={symbol: query.symbol_start(symbol)},
+        )
+        vendor_name = vendor.__class__.__name__
+        vendor_errors = {}
+        try:
+            symbol_data = (await vendor.fetch_multi_symbols_data(query=symbol_query, errors=vendor_errors)).get(symbol)
+        except Exception as exc:
+            vendor_errors[symbol] = exc
+        if symbol in vendor_errors:
+            _logger.warning("%s failed to fetch %s: %s", vendor_name, symbol, vendor_errors[symbol])
+            if errors is not None:
+                errors[symbol] = vendor_errors[symbol]
+            return None
+        if not symbol_data:
+            return None
+        return VendorResponse(vendor_name, query.timespan, symbol_data)
+
+    async def _fetch_symbol(
+        self,
+        semaphore: asyncio.Semaphore,
+        vendors: typing.List[MarketDataVendor],
+        symbol: str,
+        query: TimeSeriesDataQuery,
+        errors: typing.Optional[typing.Dict] = None,
+    ) -> typing.Tuple[str, typing.Optional[VendorResponse]]:
+        """Ask the vendors one after the other, on slow answers (hedge) or failures (fallback), first answer wins.
+        `errors` keeps the last vendor error of the symbols no vendor answered for."""
+        async with semaphore:
+            next_vendors = iter(vendors)
+            pending = {asyncio.create_task(self._fetch_from(next(next_vendors), symbol, query, errors))}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, timeout=self.hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.result() is not None:
+                            self.answers[task.result().vendor_name] += 1
+                            if errors is not None:
+                                errors.pop(symbol, None)
+                            return symbol, task.result()
+                    next_vendor = next(next_vendors, None)
+                    if next_vendor is not None:
+                        if done:
+                            self.fallback_requests += 1
+                        else:
+                            self.hedged_requests += 1
+                        pending.add(asyncio.create_task(self._fetch_from(next_vendor, symbol, query, errors)))
+                return symbol, None
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def stream_multi_symbols_data(
+        self, query: TimeSeriesDataQuery, errors: typing.Optional[typing.Dict] = None
+    ) -> typing.AsyncIterator[typing.Tuple[str, VendorResponse]]:
+        """Yields (symbol, vendor response) as soon as a vendor answered for the symbol.
+        With `errors`, the last vendor error of each failed symbol is recorded in it, see fetch_multi_symbols_data_helper."""
+        vendors = self._query_vendors(query)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.create_task(self._fetch_symbol(semaphore, vendors, symbol, query, errors)) for symbol in query.universe.symbols]
+        failed_symbols = []
+        try:
+            for next_answer in asyncio.as_completed(tasks):
+                symbol, response = await next_answer
+                if response is None:
+                    failed_symbols.append(symbol)
+                    continue
+                yield symbol, response
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        _logger.info(f"Answers per vendor: {self.answers}, {self.hedged_requests} hedged and {self.fallback_requests} fallback requests")
+        if len(failed_symbols) > 0:
+            _logger.warning("%d failed symbols on every vendor: %s", len(failed_symbols), failed_symbols)
+
+    async def fetch_multi_symbols_data(
+        self, query: TimeSeriesDataQuery, errors: typing.Optional[typing.Dict] = None
+    ) -> typing.Dict[str, VendorResponse]:
+        return {symbol: response async for symbol, response in self.stream_multi_symbols_data(query, errors)}
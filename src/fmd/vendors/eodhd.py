@@ -1,23 +1,16 @@
 import os
-import requests
 import logging
 import typing
-import logging.config
 
-from fmd.vendors.vendor import DataVendors
-from fmd.utils.log import logging_dict
+from fmd.vendors.vendor import DataVendors, load_vendor_env
 from fmd.utils.async_marketdata_handler import AsyncMarketDataHandler
+from fmd.utils.http_session import HttpSessionPool, get_http_session_pool
+from fmd.utils.response_cache import ResponseCache, cached_get_json, get_response_cache
 from fmd.utils.data_process_utils import TimeSeriesDataQuery
 
-from dotenv import load_dotenv
-
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
-# loading secret keys to env
-load_dotenv()
-
 
 class EodhdError(Exception):
     pass
@@ -28,7 +21,25 @@ class InvalidEodKeyError(EodhdError):
 
 
 class EodhdVendor:
-    def __init__(self) -> None:
+    # All-world plans allow 1000 requests per minute
+    requests_per_second: float = 16.0
+    max_concurrency: int = 20
+
+    # Reference data changes at most daily, responses are cached on disk for that long (seconds)
+    cache_ttls: typing.Dict[str, float] = {
+        "exchanges-list": 86400,
+        "exchange-symbol-list": 86400,
+        "search": 86400,
+    }
+
+    def __init__(
+        self,
+        requests_per_second: typing.Optional[float] = None,
+        max_concurrency: typing.Optional[int] = None,
+        session_pool: typing.Optional[HttpSessionPool] = None,
+        response_cache: typing.Optional[ResponseCache] = None,
+    ) -> None:
+        load_vendor_env()
         try:
             self.api = DataVendors.EODHISTORICALDATA
             self.root_url = "https://eodhistoricaldata.com/api"
@@ -46,15 +57,30 @@ class EodhdVendor:
             _logger.exception(err)
             raise
 
-        self.async_market_data_handler = AsyncMarketDataHandler()
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        self.session_pool = session_pool if session_pool is not None else get_http_session_pool()
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+        self.async_market_data_handler = AsyncMarketDataHandler(
+            max_concurrency=self.max_concurrency,
+            requests_per_second=self.requests_per_second,
+            session_pool=self.session_pool,
+            response_cache=self.response_cache,
+            vendor_name=type(self).__name__,
+        )
+
+    def _get_reference_data(self, url: str, params: typing.Dict, endpoint: str) -> typing.Any:
+        """Blocking get of a reference endpoint, served from the response cache for the endpoint ttl"""
+        return cached_get_json(self.session_pool.sync_session, self.response_cache, url, params, ttl=self.cache_ttls.get(endpoint))
 
     def fetch_supported_exchanges(self) -> typing.List[typing.Dict]:
         """
         api supported exchanges in json fmt
         """
         url = f"{self.root_url}/exchanges-list/"
-        response = requests.get(url=url, params=self.params)
-        return response.json()
+        return self._get_reference_data(url, self.params, "exchanges-list")
 
     def fetch_symbols(self, exchange_code: str = "US", delisted: typing.Optional[bool] = False) -> typing.List[typing.Dict]:
         """
@@ -65,8 +91,7 @@ class EodhdVendor:
         else:
             params = self.params
         url = f"{self.root_url}/exchange-symbol-list/{exchange_code}"
-        response = requests.get(url=url, params=params)
-        return response.json()
+        return self._get_reference_data(url, params, "exchange-symbol-list")
 
     def search(self, search_query: str, limit: int = 50) -> typing.List[typing.Dict]:
         """
@@ -74,16 +99,35 @@ class EodhdVendor:
         """
         params = {**self.params, "limit": limit}
         url = f"{self.root_url}/search/{search_query}"
-        response = requests.get(url=url, params=params)
-        return response.json()
+        return self._get_reference_data(url, params, "search")
+
+    def _time_series_requests(
+        self, query: TimeSeriesDataQuery
+    ) -> typing.Tuple[typing.Dict, typing.List[typing.Tuple[str, str]], typing.Dict[str, typing.Dict]]:
+        """Build request params, (symbol, url) pairs and per-symbol params of an eod time series query"""
+        params = {
+            **self.params,
+            "from": query.start.strftime("%Y-%m-%d"),
+            "to": query.end.strftime("%Y-%m-%d"),
+        }
+        urls = [(symbol, f"{self.root_url}/eod/{symbol}.{query.exchange}") for symbol in query.universe.symbols]
+        symbols_params = {symbol: {"from": start.strftime("%Y-%m-%d")} for symbol, start in query.symbols_start.items()}
+        # a CompositeVendor sends one query per symbol, the universe size is logged by the loaders
+        _logger.debug("%d tickers prices to fetch", len(urls))
+        return params, urls, symbols_params
+
+    async def fetch_multi_symbols_data(self, query: TimeSeriesDataQuery, errors: typing.Optional[typing.Dict] = None) -> typing.List[typing.Dict]:
+        params, urls, symbols_params = self._time_series_requests(query)
+        async with self.async_market_data_handler as handler:
+            return await handler.fetch_multi_symbols_data_helper(
+                symbol_list=query.universe.symbols, params=params, urls=urls, symbols_params=symbols_params, endpoint="eod", errors=errors
+            )
 
-    async def fetch_multi_symbols_data(self, query: TimeSeriesDataQuery) -> typing.List[typing.Dict]:
+    async def stream_multi_symbols_data(self, query: TimeSeriesDataQuery) -> typing.AsyncIterator[typing.Tuple[str, typing.List[typing.Dict]]]:
+        """Yields (symbol, raw eod data) as soon as each symbol response lands"""
+        params, urls, symbols_params = self._time_series_requests(query)
         async with self.async_market_data_handler as handler:
-            params = {
-                **self.params,
-                "from": query.start.strftime("%Y-%m-%d"),
-                "to": query.end.strftime("%Y-%m-%d"),
-            }
-            urls = [(symbol, f"{self.root_url}/eod/{symbol}.{query.exchange}") for symbol in query.universe.symbols]
-            _logger.info(f" {len(urls)} tickers prices to fetch!")
-            return await handler.fetch_multi_symbols_data_helper(query=query, params=params, urls=urls)
+            async for symbol, symbol_data in handler.stream_multi_symbols_data_helper(
+                params=params, urls=urls, symbols_params=symbols_params, endpoint="eod"
+            ):
+                yield symbol, symbol_data
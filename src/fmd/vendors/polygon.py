@@ -1,25 +1,21 @@
 import os
-import requests
 import logging
 import typing
-import logging.config
+import itertools
+import numpy as np
 from enum import Enum
-from datetime import datetime
-from fmd.vendors.vendor import DataVendors
-from fmd.utils.log import logging_dict
+from datetime import datetime, date, timedelta
+from fmd.vendors.vendor import DataVendors, load_vendor_env
 from fmd.utils.async_marketdata_handler import AsyncMarketDataHandler
+from fmd.utils.http_session import HttpSessionPool, get_http_session_pool
+from fmd.utils.response_cache import ResponseCache, cached_get_json, get_response_cache
+from fmd.utils.json_decoder import decode_polygon_aggregates
 
 from fmd.utils.data_process_utils import TimeSeriesDataQuery
 
-from dotenv import load_dotenv
-
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
-# loading secret keys to env
-load_dotenv()
-
 
 class PolygonError(Exception):
     pass
@@ -29,6 +25,56 @@ class InvalidPolygonKeyError(PolygonError):
     pass
 
 
+# Maximum number of base aggregates returned by a single aggregates request
+AGGREGATES_LIMIT = 50000
+
+# Maximum number of tickers per reference/tickers page
+TICKERS_PAGE_LIMIT = 1000
+
+# Upper bound of base aggregates per calendar day (24h markets, e.g. crypto)
+BASE_AGGREGATES_PER_DAY = {
+    "second": 86400,
+    "minute": 1440,
+    "hour": 24,
+    "day": 1,
+}
+
+
+def aggregates_windows(
+    start: typing.Union[datetime, date], end: typing.Union[datetime, date], timespan: str
+) -> typing.List[typing.Tuple[date, date]]:
+    """Split [start, end] into consecutive date windows of at most AGGREGATES_LIMIT base aggregates.
+    Windows shorter than a day are not possible with date bounds, `next_url` pagination covers the rest."""
+    start = start.date() if isinstance(start, datetime) else start
+    end = end.date() if isinstance(end, datetime) else end
+    window_days = max(1, AGGREGATES_LIMIT // BASE_AGGREGATES_PER_DAY.get(timespan, 1))
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start, window_end))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def stitch_aggregates_pages(pages: typing.List[typing.Dict]) -> typing.Dict:
+    """Merge ordered aggregates pages into a single response, results may be records or column arrays"""
+    results = [page["results"] for page in pages if page.get("results")]
+    stitched = {key: value for key, value in pages[0].items() if key not in ("next_url", "results")}
+    if not results:
+        stitched.update({"results": [], "resultsCount": 0})
+    elif isinstance(results[0], typing.Dict):
+        fields = dict.fromkeys(itertools.chain.from_iterable(results))
+        lengths = [len(next(iter(columns.values()))) for columns in results]
+        stitched["results"] = {
+            field: np.concatenate([columns.get(field, np.full(length, np.nan)) for columns, length in zip(results, lengths)]) for field in fields
+        }
+        stitched["resultsCount"] = sum(lengths)
+    else:
+        stitched["results"] = list(itertools.chain.from_iterable(results))
+        stitched["resultsCount"] = len(stitched["results"])
+    return stitched
+
+
 class PolygonAssetClass(Enum):
     STOCKS = "stocks"
     OPTIONS = "options"
@@ -36,10 +82,31 @@ class PolygonAssetClass(Enum):
 
 
 class PolygonVendor:
-    def __init__(self, asset_class: PolygonAssetClass = PolygonAssetClass.STOCKS) -> None:
+    # Paid plans are unlimited but Polygon recommends staying under 100 requests per second
+    requests_per_second: float = 80.0
+    max_concurrency: int = 50
+
+    # Reference data changes at most daily, responses are cached on disk for that long (seconds)
+    cache_ttls: typing.Dict[str, float] = {
+        "exchanges": 86400,
+        "tickers": 86400,
+        "ticker-details": 86400,
+    }
+
+    def __init__(
+        self,
+        asset_class: PolygonAssetClass = PolygonAssetClass.STOCKS,
+        requests_per_second: typing.Optional[float] = None,
+        max_concurrency: typing.Optional[int] = None,
+        session_pool: typing.Optional[HttpSessionPool] = None,
+        response_cache: typing.Optional[ResponseCache] = None,
+        columnar_decode: bool = True,
+    ) -> None:
+        load_vendor_env()
         try:
             self.api = DataVendors.POLYGON
             self.root_url = "https://api.polygon.io/v3/"
+            self.aggregates_url = "https://api.polygon.io/v2/aggs/ticker"
             self.api_key = os.environ.get(self.api.name)
             _logger.info(f"Api key for {self.api.name} is loaded")
             if self.api_key is None:
@@ -53,8 +120,22 @@ class PolygonVendor:
             _logger.exception(err)
             raise
 
-        self.async_market_data_handler = AsyncMarketDataHandler()
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        self.session_pool = session_pool if session_pool is not None else get_http_session_pool()
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+        self.async_market_data_handler = AsyncMarketDataHandler(
+            max_concurrency=self.max_concurrency,
+            requests_per_second=self.requests_per_second,
+            session_pool=self.session_pool,
+            response_cache=self.response_cache,
+            vendor_name=type(self).__name__,
+        )
         self.asset_class = asset_class
+        # aggregates bars are decoded from the raw body straight into column arrays
+        self.aggregates_decoder = decode_polygon_aggregates if columnar_decode else None
 
     def fetch_supported_exchanges(self) -> typing.List[typing.Dict]:
         """api supported exchanges in json fmt location should be either us or global."""
@@ -65,39 +146,83 @@ class PolygonVendor:
             locale = "us"
         params = {**self.params, "asset_class": self.asset_class.value, "locale": locale}
         try:
-            response = requests.get(url=url, params=params)
-            return response.json()
+            return self._get_reference_data(url, params, "exchanges")
         except Exception as exc:
-            _logger.error(f"Unexpected error while decoding json response: {exc}")
+            _logger.error("Unexpected error while decoding json response: %s", exc)
+
+    def _get_reference_data(self, url: str, params: typing.Dict, endpoint: str) -> typing.Any:
+        """Blocking get of a reference endpoint, served from the response cache for the endpoint ttl"""
+        return cached_get_json(self.session_pool.sync_session, self.response_cache, url, params, ttl=self.cache_ttls.get(endpoint))
+
+    def _get_all_pages(self, url: str, params: typing.Dict, endpoint: str) -> typing.Dict:
+        """Blocking get of a cursor paginated reference endpoint, pages results are merged into the first page"""
+        first_page = page = self._get_reference_data(url, params, endpoint)
+        results = list(first_page.get("results", []))
+        while page.get("next_url"):
+            page = self._get_reference_data(page["next_url"], self.params, endpoint)
+            results.extend(page.get("results", []))
+        first_page.pop("next_url", None)
+        first_page.update({"results": results, "count": len(results)})
+        return first_page
+
+    @staticmethod
+    def _tickers_params(market: str, exchange_code: typing.Optional[str] = None, active: bool = True) -> typing.Dict:
+        params = {"market": market, "active": "true" if active else "false", "limit": TICKERS_PAGE_LIMIT}
+        if exchange_code:
+            params["exchange"] = exchange_code
+        return params
 
     def fetch_symbols(self, exchange_code: str = None, active: bool = True) -> typing.Dict:
-        """Get all ticker symbols from the provider for a specific asset class"""
-        _active = "true" if active else "false"
+        """Get all ticker symbols from the provider for a specific asset class, every page is followed"""
         url = f"{self.root_url}reference/tickers"
 
         match (self.asset_class.value):
             case "crypto":
                 _logger.info("No exchange name parameter needed!")
                 try:
-                    params = {**self.params, "market": "crypto", "active": _active, "limit": 1000}
-                    response = requests.get(url=url, params=params)
-                    return response.json()
+                    params = {**self.params, **self._tickers_params("crypto", active=active)}
+                    return self._get_all_pages(url=url, params=params, endpoint="tickers")
                 except Exception as exc:
-                    _logger.error(f"Unexpected error while decoding json response: {exc}")
+                    _logger.error("Unexpected error while decoding json response: %s", exc)
                     raise
 
             case "stocks":
                 try:
-                    params = {**self.params, "exchange": exchange_code, "market": "stocks", "active": _active, "limit": 1000}
-                    response = requests.get(url=url, params=params)
-                    return response.json()
+                    params = {**self.params, **self._tickers_params("stocks", exchange_code, active)}
+                    return self._get_all_pages(url=url, params=params, endpoint="tickers")
                 except Exception as exc:
-                    _logger.error(f"Unexpected error while decoding json response: {exc}")
+                    _logger.error("Unexpected error while decoding json response: %s", exc)
                     raise
             case _:
                 _logger.error("Unexpected polygon asset class input")
                 raise ValueError("Unexpected polygon asset class input")
 
+    async def crawl_symbols(self, crawls: typing.List[typing.Tuple[str, typing.Optional[str]]], active: bool = True) -> typing.List[typing.Dict]:
+        """
+        Crawl every page of reference/tickers for several (market, exchange) pairs at once,
+        e.g. [("stocks", "XNAS"), ("stocks", "XNYS"), ("crypto", None)].
+        Pages of a crawl follow each other through their cursor, crawls run concurrently.
+        """
+        url = f"{self.root_url}reference/tickers"
+        urls = [(crawl, url) for crawl in crawls]
+        symbols_params = {crawl: self._tickers_params(*crawl, active=active) for crawl in crawls}
+        async with self.async_market_data_handler as handler:
+            responses = await handler.fetch_multi_symbols_data_helper(
+                symbol_list=crawls,
+                params=self.params,
+                urls=urls,
+                symbols_params=symbols_params,
+                next_page_params=self.params,
+                cache_ttl=self.cache_ttls.get("tickers"),
+                endpoint="tickers",
+            )
+        tickers = []
+        for crawl in crawls:
+            for page in responses.get(crawl, []):
+                tickers.extend(page.get("results", []))
+        _logger.info(f"{len(tickers)} tickers crawled from {len(responses)}/{len(crawls)} crawls")
+        return tickers
+
     async def fetch_multi_symbols_details(self, symbol_list: typing.List[str], date: datetime = datetime.now()) -> typing.List[typing.Dict]:
         """Get all details from a specific symbol/ticker"""
         if not self.asset_class == PolygonAssetClass.STOCKS:
@@ -105,15 +230,80 @@ class PolygonVendor:
         async with self.async_market_data_handler as handler:
             params = {**self.params, "date": date.strftime("%Y-%m-%d")}
             urls = [(symbol, f"{self.root_url}reference/tickers/{symbol}") for symbol in symbol_list]
-            return await handler.fetch_multi_symbols_data_helper(symbol_list=symbol_list, params=params, urls=urls)
+            return await handler.fetch_multi_symbols_data_helper(
+                symbol_list=symbol_list, params=params, urls=urls, cache_ttl=self.cache_ttls.get("ticker-details"), endpoint="ticker-details"
+            )
 
-    async def fetch_multi_symbols_data(self, query: TimeSeriesDataQuery, split_adjusted: bool = True) -> typing.List[typing.Dict]:
+    def _aggregates_requests(
+        self, query: TimeSeriesDataQuery, split_adjusted: bool = True
+    ) -> typing.Tuple[typing.Dict, typing.List[typing.Tuple[typing.Tuple[str, int], str]], typing.Dict[str, int]]:
+        """Build request params, ((symbol, window index), url) pairs and the number of windows of each symbol.
+        Long ranges are split into windows fetched concurrently, see aggregates_windows."""
         _split_adjusted = "true" if split_adjusted else "false"
+        params = {**self.params, "adjusted": _split_adjusted, "limit": AGGREGATES_LIMIT}
+        urls, windows_count = [], {}
+        for symbol in query.universe.symbols:
+            windows = aggregates_windows(query.symbol_start(symbol), query.end, query.timespan)
+            windows_count[symbol] = len(windows)
+            for i, (start, end) in enumerate(windows):
+                end_url = f"range/{query.multiplier}/{query.timespan}/{start.strftime('%Y-%m-%d')}/{end.strftime('%Y-%m-%d')}"
+                urls.append(((symbol, i), f"{self.aggregates_url}/{symbol}/{end_url}"))
+        return params, urls, windows_count
+
+    @staticmethod
+    def _stitch_windows(windows_pages: typing.Dict[int, typing.List[typing.Dict]], windows_count: int) -> typing.Optional[typing.Dict]:
+        """Stitch the pages of every window in order, None when a window is missing"""
+        if len(windows_pages) < windows_count:
+            return None
+        return stitch_aggregates_pages(list(itertools.chain.from_iterable(windows_pages[i] for i in range(windows_count))))
+
+    async def fetch_multi_symbols_data(
+        self, query: TimeSeriesDataQuery, split_adjusted: bool = True, errors: typing.Optional[typing.Dict] = None
+    ) -> typing.List[typing.Dict]:
+        """`errors` records the exception of a failed window for each failed symbol"""
+        params, urls, windows_count = self._aggregates_requests(query, split_adjusted)
+        windows_errors = {}
+        async with self.async_market_data_handler as handler:
+            responses = await handler.fetch_multi_symbols_data_helper(
+                symbol_list=[key for key, _ in urls],
+                params=params,
+                urls=urls,
+                decoder=self.aggregates_decoder,
+                next_page_params=self.params,
+                endpoint="aggregates",
+                errors=windows_errors,
+            )
+        if errors is not None:
+            errors.update((symbol, exc) for (symbol, _), exc in windows_errors.items())
+
+        windows_pages = {symbol: {} for symbol in windows_count}
+        for (symbol, i), pages in responses.items():
+            windows_pages[symbol][i] = pages
+        data, incomplete_symbols = {}, []
+        for symbol, symbol_windows_pages in windows_pages.items():
+            stitched = self._stitch_windows(symbol_windows_pages, windows_count[symbol])
+            if stitched is None:
+                incomplete_symbols.append(symbol)
+            else:
+                data[symbol] = stitched
+        if incomplete_symbols:
+            _logger.warning("%d symbols dropped because of failed windows: %s", len(incomplete_symbols), incomplete_symbols)
+        return data
+
+    async def stream_multi_symbols_data(
+        self, query: TimeSeriesDataQuery, split_adjusted: bool = True
+    ) -> typing.AsyncIterator[typing.Tuple[str, typing.Dict]]:
+        """Yields (symbol, raw aggregates response) as soon as all the windows of a symbol have landed"""
+        params, urls, windows_count = self._aggregates_requests(query, split_adjusted)
+        windows_pages = {}
         async with self.async_market_data_handler as handler:
-            params = {**self.params, "adjusted": _split_adjusted, "limit": 50000}
-            start = query.start.strftime("%Y-%m-%d")
-            end = query.end.strftime("%Y-%m-%d")
-            base_url = "https://api.polygon.io/v2/aggs/ticker"
-            end_url = f"range/{query.multiplier}/{query.timespan}/{start}/{end}"
-            urls = [(symbol, f"{base_url}/{symbol}/{end_url}") for symbol in query.universe.symbols]
-            return await handler.fetch_multi_symbols_data_helper(symbol_list=query.universe.symbols, params=params, urls=urls)
+            async for (symbol, i), pages in handler.stream_multi_symbols_data_helper(
+                params=params, urls=urls, decoder=self.aggregates_decoder, next_page_params=self.params, endpoint="aggregates"
+            ):
+                windows_pages.setdefault(symbol, {})[i] = pages
+                stitched = self._stitch_windows(windows_pages[symbol], windows_count[symbol])
+                if stitched is not None:
+                    del windows_pages[symbol]
+                    yield symbol, stitched
+        if windows_pages:
+            _logger.warning("%d symbols dropped because of failed windows: %s", len(windows_pages), list(windows_pages))
@@ -1,16 +1,28 @@
 import typing
-import logging.config
+import logging
 
-from fmd.utils.log import logging_dict
 from enum import Enum, auto
 
 # Initialize logger
-logging.config.dictConfig(logging_dict)
 _logger = logging.getLogger(__name__)
 
+_env_loaded = False
+
+
+def load_vendor_env() -> None:
+    """Load the vendors api keys of the .env file into the environment, once per process"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
 VALID_VENDORS = [
     "EodhdVendor",
     "PolygonVendor",
+    "CompositeVendor",
 ]
 
 
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Logs of the test session go to a temporary directory rather than logs/, set before fmd configures logging
+os.environ.setdefault("FMD_LOG_DIR", tempfile.mkdtemp(prefix="fmd-logs-"))
@@ -1,45 +1,46 @@
 from datetime import date
 import pytest
-from fmd.Services.eodhd import Eodhd
-from fmd.utils.generic import DataQuery
-from fmd.loader import Etf
-from enum import Enum
+
+import fmd.utils.log
+import fmd.utils.response_cache
+from fmd.utils.universe import Universe
+from fmd.utils.response_cache import ResponseCache
+from fmd.utils.data_process_utils import TimeSeriesDataQuery
+from fmd.vendors.eodhd import EodhdVendor
 
 
 @pytest.fixture
-def mock_eodhd_init_params():
-    return Eodhd()
+def mock_universe():
+    return Universe("dummy_etf_universe", "ETF", ["MCD", "AAPL"])
 
 
-@pytest.fixture
-def mock_eodhd():
-    eodhd = Eodhd()
-    eodhd.params.update({"api_token": "demo"})
-    yield eodhd
+@pytest.fixture(autouse=True)
+def process_logging(monkeypatch):
+    """Commands run in-process leave logging to pytest: their console handler would keep writing to the captured
+    stdout of the test after it is closed. test_log configures logging itself."""
+    monkeypatch.setattr(fmd.utils.log, "configure_logging", lambda *args, **kwargs: None)
 
 
-@pytest.fixture
-def mock_ohlcvquery():
-    return DataQuery(
-        exchange="US",
-        start=date(2023, 1, 1),
-        end=date(2023, 1, 15),
-        tickers=["MCD", "AAPL"],
-    )
+@pytest.fixture(autouse=True)
+def response_cache(tmp_path, monkeypatch):
+    """Temporary response cache, also installed as the process wide one so that no test writes to out/cache"""
+    cache = ResponseCache(tmp_path / "responses.sqlite")
+    monkeypatch.setattr(fmd.utils.response_cache, "_default_cache", cache)
+    yield cache
+    cache.close()
 
 
 @pytest.fixture
-def mock_universe():
-    class Universe_fixture(Enum):
-        DUMMY_ETF_UNIVERSE = (
-            "dummy_etf_universe",
-            "ETF",
-            "MCD.AAPL",
-        )
-
-    return Universe_fixture.DUMMY_ETF_UNIVERSE
+def mock_eodhd(monkeypatch, response_cache):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    return EodhdVendor(response_cache=response_cache)
 
 
 @pytest.fixture
-def mock_etf_loader():
-    return Etf()
+def mock_ohlcvquery(mock_universe):
+    return TimeSeriesDataQuery(
+        universe=mock_universe,
+        start=date(2023, 1, 2),
+        end=date(2023, 1, 13),
+        exchange="US",
+    )
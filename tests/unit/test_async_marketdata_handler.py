@@ -0,0 +1,85 @@
+import time
+import asyncio
+import pytest
+from unittest import mock
+
+from fmd.utils.rate_limiter import AsyncTokenBucket
+from fmd.utils.http_session import HttpSessionPool
+from fmd.utils.async_marketdata_handler import AsyncMarketDataHandler
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_requests():
+    bucket = AsyncTokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        await bucket.acquire()
+    # first token is available immediately, the 10 others are refilled at 50/s
+    assert time.monotonic() - start >= 10 / 50 * 0.9
+
+
+def test_token_bucket_invalid_rate():
+    with pytest.raises(ValueError):
+        AsyncTokenBucket(rate=0)
+
+
+@pytest.mark.asyncio
+async def test_fetch_multi_symbols_in_flight_cap():
+    handler = AsyncMarketDataHandler(max_concurrency=3)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [{"symbol": symbol}]
+
+    symbols = [f"SYM{i}" for i in range(20)]
+    urls = [(symbol, f"http://localhost/{symbol}") for symbol in symbols]
+    with mock.patch.object(handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        result = await handler.fetch_multi_symbols_data_helper(symbol_list=symbols, params={}, urls=urls)
+
+    assert max_in_flight == 3
+    assert list(result.keys()) == symbols
+
+
+@pytest.mark.asyncio
+async def test_handlers_share_pooled_session():
+    pool = HttpSessionPool()
+    first_handler = AsyncMarketDataHandler(session_pool=pool)
+    second_handler = AsyncMarketDataHandler(session_pool=pool)
+    async with first_handler as handler:
+        first_session = handler.aio_session
+    async with second_handler as handler:
+        second_session = handler.aio_session
+
+    assert first_session is second_session
+    assert not first_session.closed
+    await pool.aclose()
+    assert first_session.closed
+
+
+@pytest.mark.asyncio
+async def test_stream_multi_symbols_backpressure():
+    handler = AsyncMarketDataHandler(max_concurrency=2)
+    fetched = []
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        fetched.append(symbol)
+        return None if symbol == "SYM9" else [{"symbol": symbol}]
+
+    symbols = [f"SYM{i}" for i in range(10)]
+    urls = [(symbol, f"http://localhost/{symbol}") for symbol in symbols]
+    received = []
+    with mock.patch.object(handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        async for symbol, response in handler.stream_multi_symbols_data_helper(params={}, urls=urls, queue_size=1):
+            if not received:
+                await asyncio.sleep(0.01)
+                # consumer is stalled: only the queued response and the workers' blocked puts were fetched
+                assert len(fetched) <= 4
+            received.append(symbol)
+
+    assert sorted(received) == sorted(set(symbols) - {"SYM9"})
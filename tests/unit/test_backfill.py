@@ -0,0 +1,120 @@
+import pytest
+import asyncio
+import pandas as pd
+from unittest import mock
+from datetime import date
+
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery
+from fmd.vendors.eodhd import EodhdVendor
+from fmd.storage.hdf5 import HDF5Backend
+from fmd.loaders.backfill import BackfillJob, BackfillManifest, BackfillUnit, backfill_windows
+
+
+def eod_records(start: str, end: str):
+    return [
+        {"date": day.strftime("%Y-%m-%d"), "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adjusted_close": 1.5, "volume": 100}
+        for day in pd.bdate_range(start, end)
+    ]
+
+
+@pytest.fixture
+def eodhd_vendor(monkeypatch, response_cache):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    return EodhdVendor(response_cache=response_cache)
+
+
+@pytest.fixture
+def backfill_query():
+    return TimeSeriesDataQuery(
+        universe=Universe("dummy_universe", "dummy", ["AAPL", "MCD", "MSFT"]),
+        start=date(2023, 1, 2),
+        end=date(2023, 1, 6),
+        exchange="US",
+    )
+
+
+def test_backfill_windows():
+    assert backfill_windows(date(2023, 1, 2), date(2023, 1, 6), 3) == [(date(2023, 1, 2), date(2023, 1, 4)), (date(2023, 1, 5), date(2023, 1, 6))]
+
+
+@pytest.mark.asyncio
+async def test_backfill_job_resumes_from_manifest(tmp_path, eodhd_vendor, backfill_query):
+    manifest = BackfillManifest(tmp_path / "manifest.sqlite")
+    job = BackfillJob("dummy", eodhd_vendor, backfill_query, output_path=tmp_path, manifest=manifest, window_days=3, batch_symbols=2)
+    requested = []
+
+    async def hanging_fetch(symbol, url, params, **kwargs):
+        if params["from"] == "2023-01-05":
+            await asyncio.sleep(60)
+        requested.append((symbol, params["from"]))
+        return eod_records(params["from"], params["to"])
+
+    # the job is interrupted while fetching the second window
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=hanging_fetch):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(job.run(), timeout=0.5)
+    assert manifest.summary("dummy") == {"pending": 3, "done": 3, "failed": 0}
+
+    async def failing_fetch(symbol, url, params, **kwargs):
+        requested.append((symbol, params["from"]))
+        if symbol == "MSFT":
+            raise ValueError("Uncorrect response status: 500")
+        return eod_records(params["from"], params["to"])
+
+    # restarted: only the pending units are fetched, MSFT fails
+    requested.clear()
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=failing_fetch):
+        summary = await job.run()
+    assert sorted(requested) == [("AAPL", "2023-01-05"), ("MCD", "2023-01-05"), ("MSFT", "2023-01-05")]
+    assert summary == {"pending": 0, "done": 5, "failed": 1}
+    assert manifest.failures("dummy") == {
+        BackfillUnit("MSFT", date(2023, 1, 5), date(2023, 1, 6)): repr(ValueError("Uncorrect response status: 500"))
+    }
+
+    # a plain run has nothing left to fetch, failed units are fetched again on demand
+    requested.clear()
+
+    async def fetch(symbol, url, params, **kwargs):
+        requested.append((symbol, params["from"]))
+        return eod_records(params["from"], params["to"])
+
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fetch):
+        assert (await job.run())["failed"] == 1
+        assert requested == []
+        assert await job.run(retry_failed=True) == {"pending": 0, "done": 6, "failed": 0}
+    assert requested == [("MSFT", "2023-01-05")]
+
+    with pd.HDFStore(tmp_path / "dummy_universe_EodhdVendor.h5", mode="r") as store:
+        assert len(store["/AAPL"]) == 5
+        assert store["/MSFT"].index.tolist() == list(pd.bdate_range("2023-01-02", "2023-01-06"))
+
+
+@pytest.mark.asyncio
+async def test_backfill_job_fails_only_the_units_in_error(tmp_path, monkeypatch, eodhd_vendor, backfill_query):
+    manifest = BackfillManifest(tmp_path / "manifest.sqlite")
+    job = BackfillJob("dummy", eodhd_vendor, backfill_query, output_path=tmp_path, manifest=manifest, window_days=3)
+
+    async def fetch(symbol, url, params, **kwargs):
+        # MCD has no bars over the first window, the handler returns None for empty responses
+        if symbol == "MCD" and params["from"] == "2023-01-02":
+            return None
+        return eod_records(params["from"], params["to"])
+
+    append = HDF5Backend.append
+
+    def failing_append(backend, symbol, symbol_data):
+        if symbol == "MSFT" and symbol_data.index[0] == pd.Timestamp("2023-01-05"):
+            raise OSError("disk full")
+        return append(backend, symbol, symbol_data)
+
+    monkeypatch.setattr(HDF5Backend, "append", failing_append)
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fetch):
+        summary = await job.run()
+    assert summary == {"pending": 0, "done": 5, "failed": 1}
+    assert manifest.failures("dummy") == {BackfillUnit("MSFT", date(2023, 1, 5), date(2023, 1, 6)): repr(OSError("disk full"))}
+
+    with pd.HDFStore(tmp_path / "dummy_universe_EodhdVendor.h5", mode="r") as store:
+        assert len(store["/AAPL"]) == 5
+        assert len(store["/MCD"]) == 2
+        assert len(store["/MSFT"]) == 3
@@ -0,0 +1,92 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from fmd import cli
+
+SRC_DIR = Path(__file__).resolve().parents[2] / "src"
+ROOT_DIR = SRC_DIR.parent
+
+
+def test_symbols_cached_without_heavy_imports(tmp_path):
+    records = [{"Code": "AAPL", "Name": "Apple Inc"}, {"Code": "MSFT", "Name": "Microsoft Corporation"}]
+    Path(tmp_path, "EodhdVendor_US_tickers.json").write_text(json.dumps(records))
+    script = (
+        "import sys; from fmd.cli import main; code = main(sys.argv[1:]);"
+        "print(sorted(m for m in ('pandas', 'numpy', 'aiohttp', 'yaml', 'fmd.vendors', 'fmd.utils.log') if m in sys.modules)); sys.exit(code)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", script, "symbols", "US", "--cached", "--output", str(tmp_path)],
+        capture_output=True,
+        text=True,
+        env={"PYTHONPATH": str(SRC_DIR)},
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.splitlines() == ["AAPL", "MSFT", "[]"]
+
+
+def test_symbols_cached_missing(tmp_path, capsys):
+    assert cli.main(["symbols", "XETRA", "--cached", "--output", str(tmp_path)]) == 1
+    assert "fmd symbols XETRA" in capsys.readouterr().err
+
+
+def test_symbols_polygon_envelope(monkeypatch, capsys, tmp_path):
+    payload = {"results": [{"ticker": "AAPL", "name": "Apple Inc."}, {"ticker": "MSFT", "name": "Microsoft Corp"}], "status": "OK", "count": 2}
+    Path(tmp_path, "PolygonVendor_XNAS_tickers.json").write_text(json.dumps(payload))
+    assert cli.main(["symbols", "XNAS", "--vendor", "polygon", "--cached", "--output", str(tmp_path)]) == 0
+    assert capsys.readouterr().out.splitlines() == ["AAPL", "MSFT"]
+
+    monkeypatch.setenv("POLYGON", "demo")
+    with mock.patch("fmd.vendors.polygon.PolygonVendor.fetch_symbols", return_value=payload):
+        assert cli.main(["symbols", "XNAS", "--vendor", "polygon", "--output", str(tmp_path / "fetched")]) == 0
+    assert capsys.readouterr().out.splitlines() == ["AAPL", "MSFT"]
+
+
+def test_search(monkeypatch, capsys):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    found = [{"Code": "AAPL", "Exchange": "US", "Name": "Apple Inc"}]
+    with mock.patch("fmd.vendors.eodhd.cached_get_json", return_value=found) as mock_get:
+        assert cli.main(["search", "apple", "--limit", "5"]) == 0
+    assert mock_get.call_args.args[3]["limit"] == 5
+    assert json.loads(capsys.readouterr().out) == found
+
+
+@pytest.fixture
+def simulator_url():
+    simulator = subprocess.Popen([sys.executable, "-m", "benchmarks.simulator"], stdout=subprocess.PIPE, text=True, cwd=ROOT_DIR)
+    try:
+        yield simulator.stdout.readline().split()[1]
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+
+def test_fetch_and_archive(monkeypatch, capsys, tmp_path, simulator_url):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    vendor_class = cli._vendor_class
+
+    def simulated_vendor_class(name):
+        def vendor():
+            vendor = vendor_class(name)()
+            vendor.root_url = f"{simulator_url}/api"
+            return vendor
+
+        return vendor
+
+    monkeypatch.setattr(cli, "_vendor_class", simulated_vendor_class)
+    query_arguments = ["etfs", "--symbols", "SPY", "QQQ", "--start", "2023-01-02", "--end", "2023-01-13"]
+
+    assert cli.main(["fetch", *query_arguments, "--csv", str(tmp_path / "bars.csv")]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "SPY\t10\t2023-01-02 00:00:00\t2023-01-13 00:00:00",
+        "QQQ\t10\t2023-01-02 00:00:00\t2023-01-13 00:00:00",
+    ]
+    assert len(Path(tmp_path, "bars.csv").read_text().splitlines()) == 21
+
+    assert cli.main(["archive", *query_arguments, "--output", str(tmp_path / "archive")]) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == f"2/2 symbols archived to {tmp_path / 'archive'}"
+    assert Path(tmp_path, "archive", "etfs_EodhdVendor.h5").exists()
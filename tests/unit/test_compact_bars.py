@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from fmd.utils.compact_bars import CompactBars
+from fmd.utils.data_process_utils import batch_data_processing, compact_data_processing
+
+
+def polygon_aggregates(periods: int, transactions: bool = True):
+    start = pd.Timestamp("2023-01-03 14:30").value // 10**6
+    results = [
+        {"t": start + i * 60_000, "o": 1.0 + i, "h": 2.0 + i, "l": 0.5 + i, "c": 1.5 + i, "v": 100.0 * (i + 1), "vw": 1.25 + i}
+        for i in range(periods)
+    ]
+    if transactions:
+        for bar in results:
+            bar["n"] = 3
+    return {"ticker": "dummy", "results": results, "resultsCount": periods}
+
+
+def test_compact_data_processing_matches_frames():
+    data = {"MSFT": polygon_aggregates(3), "AAPL": polygon_aggregates(5), "EMPTY": polygon_aggregates(0)}
+    bars = compact_data_processing("PolygonVendor", data)
+    frames = batch_data_processing("PolygonVendor", data)
+
+    assert sorted(bars) == ["AAPL", "MSFT"] and len(bars) == 8
+    assert bars.columns["open"].dtype == np.float32
+    assert bars.columns["number_of_transactions"].dtype == np.uint32
+    for symbol, frame in frames.items():
+        pd.testing.assert_frame_equal(bars.frame(symbol), frame, check_dtype=False, check_like=True)
+    assert bars.symbols == ["MSFT", "AAPL"]
+    assert bars.codes.tolist() == [0] * 3 + [1] * 5
+
+
+def test_compact_bars_views_share_memory():
+    bars = compact_data_processing("PolygonVendor", {"AAPL": polygon_aggregates(5), "MSFT": polygon_aggregates(3)})
+    view = bars.view("MSFT")
+    assert view["date"][0] == np.datetime64("2023-01-03T14:30")
+    assert np.shares_memory(view["close"], bars.columns["close"])
+    assert np.shares_memory(bars.frame("MSFT")["close"].to_numpy(), bars.columns["close"])
+    with pytest.raises(KeyError):
+        bars.view("GOOG")
+
+    long_frame = bars.to_pandas()
+    assert long_frame["symbol"].dtype == "category"
+    assert long_frame.groupby("symbol", observed=True).size().to_dict() == {"AAPL": 5, "MSFT": 3}
+
+
+def test_compact_bars_concat_with_missing_counts():
+    with_counts = compact_data_processing("PolygonVendor", {"AAPL": polygon_aggregates(2)})
+    without_counts = compact_data_processing("PolygonVendor", {"MSFT": polygon_aggregates(3, transactions=False)})
+    bars = CompactBars.concat([with_counts, without_counts])
+
+    assert bars.symbols == ["AAPL", "MSFT"]
+    assert bars.offsets.tolist() == [0, 2, 5]
+    # counts are missing for MSFT: the column falls back to floats with NaNs
+    assert bars.columns["number_of_transactions"].dtype == np.float32
+    assert np.isnan(bars.view("MSFT")["number_of_transactions"]).all()
+    assert bars.view("AAPL")["number_of_transactions"].tolist() == [3.0, 3.0]
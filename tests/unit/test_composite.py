@@ -0,0 +1,133 @@
+import pytest
+import asyncio
+import numpy as np
+import pandas as pd
+from unittest import mock
+from datetime import date
+
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import NORMALIZED_COLUMNS, TimeSeriesDataQuery
+from fmd.vendors.eodhd import EodhdVendor
+from fmd.vendors.polygon import PolygonVendor
+from fmd.vendors.composite import CompositeVendor
+from fmd.loaders.historical import get_data
+
+
+def eod_records(start: str, periods: int):
+    return [
+        {"date": day.strftime("%Y-%m-%d"), "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adjusted_close": 1.4, "volume": 100}
+        for day in pd.bdate_range(start, periods=periods)
+    ]
+
+
+def polygon_daily_aggregates(symbol: str, start: str, periods: int):
+    # polygon daily bars are stamped at midnight New York time
+    days = pd.bdate_range(start, periods=periods).tz_localize("America/New_York")
+    results = [{"t": day.value // 10**6, "o": 1.0, "h": 2.0, "l": 0.5, "c": 1.6, "v": 100.0, "vw": 1.2, "n": 7} for day in days]
+    return {"ticker": symbol, "results": results, "resultsCount": len(results)}
+
+
+@pytest.fixture
+def vendors(monkeypatch, response_cache):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    monkeypatch.setenv("POLYGON", "demo")
+    return EodhdVendor(response_cache=response_cache), PolygonVendor(columnar_decode=False, response_cache=response_cache)
+
+
+@pytest.fixture
+def eod_query():
+    return TimeSeriesDataQuery(
+        universe=Universe("dummy_universe", "dummy", ["MCD", "SLOW", "BROKEN"]),
+        start=date(2023, 1, 2),
+        end=date(2023, 1, 6),
+        exchange="US",
+    )
+
+
+def patch_vendors(vendors, polygon_calls):
+    eodhd_vendor, polygon_vendor = vendors
+
+    async def eodhd_fetch(symbol, url, params, **kwargs):
+        if symbol == "SLOW":
+            await asyncio.sleep(5)
+        if symbol == "BROKEN":
+            raise ValueError("Uncorrect response status: 500")
+        return eod_records("2023-01-02", 5)
+
+    async def polygon_fetch(symbol, url, params, **kwargs):
+        polygon_calls.append(symbol[0])
+        return polygon_daily_aggregates(symbol[0], "2023-01-02", 5)
+
+    return (
+        mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=eodhd_fetch),
+        mock.patch.object(polygon_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=polygon_fetch),
+    )
+
+
+@pytest.mark.asyncio
+async def test_composite_vendor_hedges_and_falls_back(vendors, eod_query):
+    polygon_calls = []
+    composite_vendor = CompositeVendor(list(vendors), hedge_delay=0.05)
+    eodhd_patch, polygon_patch = patch_vendors(vendors, polygon_calls)
+    errors = {}
+    with eodhd_patch, polygon_patch:
+        data = await asyncio.wait_for(composite_vendor.fetch_multi_symbols_data(eod_query, errors), timeout=2)
+
+    assert sorted(data) == ["BROKEN", "MCD", "SLOW"]
+    # the EODHD error of BROKEN is forgotten once Polygon answered
+    assert errors == {}
+    assert data["MCD"].vendor_name == "EodhdVendor"
+    # the slow symbol is hedged, the broken one falls back, MCD never reaches Polygon
+    assert data["SLOW"].vendor_name == data["BROKEN"].vendor_name == "PolygonVendor"
+    assert sorted(polygon_calls) == ["BROKEN", "SLOW"]
+    assert (composite_vendor.hedged_requests, composite_vendor.fallback_requests) == (1, 1)
+    assert composite_vendor.answers == {"EodhdVendor": 1, "PolygonVendor": 2}
+
+
+@pytest.mark.asyncio
+async def test_composite_vendor_normalizes_archived_data(tmp_path, vendors, eod_query):
+    composite_vendor = CompositeVendor(list(vendors), hedge_delay=0.05)
+    eodhd_patch, polygon_patch = patch_vendors(vendors, [])
+    with eodhd_patch, polygon_patch:
+        await get_data(composite_vendor, eod_query, do_archive=True, output_path=tmp_path)
+
+    with pd.HDFStore(tmp_path / "dummy_universe_CompositeVendor.h5", mode="r") as store:
+        eodhd_frame, polygon_frame = store["/MCD"], store["/SLOW"]
+    for frame in (eodhd_frame, polygon_frame):
+        assert frame.columns.tolist() == NORMALIZED_COLUMNS
+        assert frame.index.tolist() == list(pd.bdate_range("2023-01-02", periods=5))
+    assert eodhd_frame["adjusted_close"].iloc[0] == 1.4 and np.isnan(eodhd_frame["number_of_transactions"].iloc[0])
+    assert polygon_frame["close"].iloc[0] == 1.6 and polygon_frame["number_of_transactions"].iloc[0] == 7.0
+
+
+def test_composite_vendor_skips_vendors_without_timespan(vendors, eod_query):
+    composite_vendor = CompositeVendor(list(vendors))
+    minute_query = TimeSeriesDataQuery(universe=eod_query.universe, start=eod_query.start, end=eod_query.end, timespan="minute")
+    assert [vendor.__class__.__name__ for vendor in composite_vendor._query_vendors(minute_query)] == ["PolygonVendor"]
+    with pytest.raises(ValueError):
+        CompositeVendor([vendors[0]])._query_vendors(minute_query)
+
+
+@pytest.mark.asyncio
+async def test_composite_vendor_keeps_the_vendor_concurrency_limit(monkeypatch, response_cache):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    eodhd_vendor = EodhdVendor(max_concurrency=2, response_cache=response_cache)
+    in_flight, peak = [0], [0]
+
+    async def eodhd_fetch(symbol, url, params, **kwargs):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return eod_records("2023-01-02", 5)
+
+    query = TimeSeriesDataQuery(
+        Universe("dummy_universe", "dummy", [f"S{i:02d}" for i in range(12)]), date(2023, 1, 2), date(2023, 1, 6), exchange="US"
+    )
+    # the composite sends one single symbol call per symbol, they share the in-flight slots of the vendor
+    composite_vendor = CompositeVendor([eodhd_vendor], max_concurrency=12)
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=eodhd_fetch):
+        data = await composite_vendor.fetch_multi_symbols_data(query)
+
+    assert len(data) == 12
+    assert peak[0] == 2
@@ -0,0 +1,91 @@
+import json
+import numpy as np
+import pandas as pd
+from unittest import mock
+
+from fmd.utils import data_process_utils
+from fmd.utils.json_decoder import decode_polygon_aggregates
+from fmd.utils.data_process_utils import (
+    batch_data_processing,
+    process_eodhd_vendor_data,
+    process_polygon_vendor_data,
+    remove_duplicates,
+)
+
+
+def polygon_response(start_ms: int, periods: int, with_transactions: bool = True):
+    results = []
+    for i in range(periods):
+        bar = {"v": 100.0 + i, "vw": 1.2, "o": 1.0, "c": 1.5, "h": 2.0, "l": 0.5, "t": start_ms + (periods - i) * 60_000}
+        if with_transactions:
+            bar["n"] = 10 + i
+        results.append(bar)
+    return {"ticker": "DUMMY", "resultsCount": periods, "results": results}
+
+
+def eod_records(dates):
+    return [{"date": day, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adjusted_close": 1.5, "volume": 100} for day in dates]
+
+
+def test_batch_processing_matches_per_symbol_processing_eodhd():
+    data = {
+        "MCD": eod_records(["2023-01-04", "2023-01-03"]),
+        "AAPL": eod_records(["2023-01-03", "2023-01-04", "2023-01-05"]),
+    }
+    processed = batch_data_processing("EodhdVendor", data)
+
+    assert list(processed) == ["MCD", "AAPL"]
+    for symbol, symbol_data in data.items():
+        pd.testing.assert_frame_equal(processed[symbol], process_eodhd_vendor_data(symbol_data), check_freq=False)
+
+
+def test_batch_processing_polygon_schemas_and_empty_results():
+    data = {
+        "AAPL": polygon_response(1_700_000_000_000, 3),
+        "OTCX": polygon_response(1_700_000_000_000, 2, with_transactions=False),
+        "EMPTY": {"ticker": "EMPTY", "resultsCount": 0},
+    }
+    processed = batch_data_processing("PolygonVendor", data)
+
+    assert sorted(processed) == ["AAPL", "OTCX"]
+    pd.testing.assert_frame_equal(processed["AAPL"], process_polygon_vendor_data(data["AAPL"]), check_freq=False)
+    assert processed["AAPL"]["number_of_transactions"].dtype == "int64"
+    assert "number_of_transactions" not in processed["OTCX"]
+
+
+def test_batch_processing_large_payload_uses_process_pool():
+    data = {symbol: polygon_response(1_700_000_000_000, 5) for symbol in ["A", "B", "C", "D"]}
+    with mock.patch.object(data_process_utils, "LARGE_PAYLOAD_ROWS", 10):
+        processed = batch_data_processing("PolygonVendor", data)
+
+    assert sorted(processed) == ["A", "B", "C", "D"]
+    assert all(len(symbol_data) == 5 and symbol_data.index.is_monotonic_increasing for symbol_data in processed.values())
+
+
+def test_remove_duplicates_returns_new_rows_only():
+    existing = process_eodhd_vendor_data(eod_records(["2023-01-03", "2023-01-04"]))
+    new = process_eodhd_vendor_data(eod_records(["2023-01-04", "2023-01-05"]))
+    assert list(remove_duplicates(existing, new).index) == [pd.Timestamp("2023-01-05")]
+
+
+def test_columnar_decode_matches_records_processing():
+    response = polygon_response(1_700_000_000_000, 4)
+    response["results"][1]["n"] = None
+    decoded = decode_polygon_aggregates(json.dumps(response).encode())
+
+    assert set(decoded["results"]) == {"v", "vw", "o", "c", "h", "l", "t", "n"}
+    assert decoded["results"]["t"].dtype == "int64"
+    assert np.isnan(decoded["results"]["n"][1])
+    processed = batch_data_processing("PolygonVendor", {"AAPL": decoded, "MSFT": decode_polygon_aggregates(json.dumps(response).encode())})
+    pd.testing.assert_frame_equal(processed["AAPL"], process_polygon_vendor_data(response), check_freq=False)
+    pd.testing.assert_frame_equal(process_polygon_vendor_data(decoded), process_polygon_vendor_data(response), check_freq=False)
+
+
+def test_columnar_decode_keeps_fields_missing_from_the_first_bar():
+    response = polygon_response(1_700_000_000_000, 3)
+    del response["results"][0]["vw"], response["results"][0]["n"]
+    decoded = decode_polygon_aggregates(json.dumps(response).encode())
+
+    assert {"vw", "n"} <= set(decoded["results"])
+    assert np.isnan(decoded["results"]["vw"][0]) and not np.isnan(decoded["results"]["vw"][1:]).any()
+    pd.testing.assert_frame_equal(process_polygon_vendor_data(decoded), process_polygon_vendor_data(response), check_freq=False)
@@ -1,26 +1,29 @@
 import pytest
-from src.fmd.Services.eodhd import Eodhd
+import pandas as pd
 from unittest import mock
-from src.fmd.Services.eodhd import InvalidEodKeyError
+from datetime import date
 
+from benchmarks.simulator import VendorSimulator
+from fmd.vendors.eodhd import EodhdVendor, InvalidEodKeyError
 
-def test_eodhd_init(mock_eodhd_init_params):
+
+def test_eodhd_init(mock_eodhd):
     expected_params = {
-        "api_token": mock_eodhd_init_params.api_key,
+        "api_token": mock_eodhd.api_key,
         "fmt": "json",
     }
     expected_root_url = "https://eodhistoricaldata.com/api"
     expected_API_name = "EODHISTORICALDATA"
 
-    assert mock_eodhd_init_params.params == expected_params
-    assert mock_eodhd_init_params.ROOT_URL == expected_root_url
-    assert mock_eodhd_init_params.API.name == expected_API_name
+    assert mock_eodhd.params == expected_params
+    assert mock_eodhd.root_url == expected_root_url
+    assert mock_eodhd.api.name == expected_API_name
 
 
-@mock.patch.dict("src.data_services.loaders.base.os.environ", {}, clear=True)
-def test_eodhd_invalidkeyerror():
-    with pytest.raises(InvalidEodKeyError, match="EODHISTORICALDATA api_key cannot be None!"):
-        Eodhd()
+def test_eodhd_invalidkeyerror(monkeypatch):
+    monkeypatch.delenv("EODHISTORICALDATA", raising=False)
+    with pytest.raises(InvalidEodKeyError, match="EODHISTORICALDATA api_key is None!"):
+        EodhdVendor()
 
 
 @pytest.mark.parametrize(
@@ -30,55 +33,34 @@ def test_eodhd_invalidkeyerror():
         (30, "MCD", [{"data": "findings_MCD_search"}]),
     ],
 )
-@mock.patch("src.data_services.loaders.eodhd.requests.Response")
-@mock.patch("src.data_services.loaders.eodhd.requests.Session.get")
-def test_search(
-    mock_request_get,
-    mock_response,
-    mock_eodhd,
-    limit,
-    search_query,
-    json_response_value,
-):
-    mock_response.json.return_value = json_response_value
-    mock_request_get.return_value = mock_response
-    assert mock_eodhd.search(search_query, limit) == json_response_value
-    url = f"{mock_eodhd.ROOT_URL}/search/{search_query}"
-    mock_request_get.assert_called_with(url=url, params=mock_eodhd.params)
-
-
-@mock.patch("src.data_services.loaders.eodhd.requests.Response")
-@mock.patch("src.data_services.loaders.eodhd.requests.Session.get")
-def test_exchange_traded_tickers(mock_request_get, mock_response, mock_eodhd):
-    mock_response.json.return_value = [{"data": "example"}]
-    mock_request_get.return_value = mock_response
-
-    exchange_code = "US"
-    assert mock_eodhd.exchange_traded_tickers(exchange_code) == [{"data": "example"}]
-    url = f"{mock_eodhd.ROOT_URL}/exchange-symbol-list/{exchange_code}"
-    mock_request_get.assert_called_with(url=url, params=mock_eodhd.params)
+def test_search(mock_eodhd, limit, search_query, json_response_value):
+    with mock.patch("fmd.vendors.eodhd.cached_get_json", return_value=json_response_value) as mock_get:
+        assert mock_eodhd.search(search_query, limit) == json_response_value
 
+    _, _, url, params = mock_get.call_args.args
+    assert url == f"{mock_eodhd.root_url}/search/{search_query}"
+    assert params == {**mock_eodhd.params, "limit": limit}
+    assert mock_get.call_args.kwargs["ttl"] == EodhdVendor.cache_ttls["search"]
 
-@pytest.mark.asyncio
-@mock.patch("src.data_services.loaders.eodhd.aiohttp.ClientSession.get")
-async def test_ohlcv(mock_get, mock_eodhd, mock_ohlcvquery):
-    # Mock the JSON responses
-    json_responses = [
-        [{"MCD": "response1"}, {"MCD": "response2"}],
-        [{"AAPL": "response1"}, {"AAPL": "response2"}],
-    ]
-
-    mock_get.return_value.__aenter__.return_value.json = mock.AsyncMock(side_effect=json_responses)
 
-    url1 = f"{mock_eodhd.ROOT_URL}/eod/{mock_ohlcvquery.tickers[0]}.{mock_ohlcvquery.exchange}"
-    url2 = f"{mock_eodhd.ROOT_URL}/eod/{mock_ohlcvquery.tickers[1]}.{mock_ohlcvquery.exchange}"
+def test_fetch_symbols(mock_eodhd):
+    with mock.patch("fmd.vendors.eodhd.cached_get_json", return_value=[{"data": "example"}]) as mock_get:
+        assert mock_eodhd.fetch_symbols("US", delisted=True) == [{"data": "example"}]
 
-    calls = [mock.call(url1, params=mock_eodhd.params), mock.call(url2, params=mock_eodhd.params)]
+    _, _, url, params = mock_get.call_args.args
+    assert url == f"{mock_eodhd.root_url}/exchange-symbol-list/US"
+    assert params["delisted"] == 1
 
-    actual_result = await mock_eodhd.ohlcv(mock_ohlcvquery)
 
-    assert actual_result == json_responses
-
-    assert mock_get.call_count == 2
-    assert mock_get.return_value.__aenter__.return_value.json.await_count == 2
-    mock_get.assert_has_calls(calls, any_order=True)
+@pytest.mark.asyncio
+async def test_fetch_multi_symbols_data(mock_eodhd, mock_ohlcvquery):
+    mock_ohlcvquery.symbols_start = {"AAPL": date(2023, 1, 9)}
+    async with VendorSimulator() as simulator:
+        mock_eodhd.root_url = f"{simulator.url}/api"
+        data = await mock_eodhd.fetch_multi_symbols_data(mock_ohlcvquery)
+
+    assert sorted(data) == ["AAPL", "MCD"]
+    assert [record["date"] for record in data["MCD"]] == list(pd.bdate_range("2023-01-02", "2023-01-13").strftime("%Y-%m-%d"))
+    # the symbol start overrides the query start
+    assert data["AAPL"][0]["date"] == "2023-01-09"
+    assert set(data["MCD"][0]) == {"date", "open", "high", "low", "close", "adjusted_close", "volume"}
@@ -1,14 +1,13 @@
-# import pytest
-from src.fmd.utils.generic import file_saver, preprocess_df
 from pathlib import Path
-import asyncio
 import pandas as pd
 
+from fmd.loaders.historical import h5_archive
+from fmd.utils.data_process_utils import process_eodhd_vendor_data
 
-# @pytest.mark.dependency(depends=)
-def test_file_dump_decorator(tmp_path):
-    test_data = [
-        [
+
+def test_h5_archive(tmp_path):
+    test_data = {
+        "MCD": [
             {
                 "date": "2023-01-03",
                 "open": 263.53,
@@ -28,7 +27,7 @@ def test_file_dump_decorator(tmp_path):
                 "volume": 2584100,
             },
         ],
-        [
+        "AAPL": [
             {
                 "date": "2023-01-03",
                 "open": 130.28,
@@ -48,19 +47,13 @@ def test_file_dump_decorator(tmp_path):
                 "volume": 89113600,
             },
         ],
-    ]
-
-    # decorated function
-    @file_saver
-    async def dummy_decorated_func(test_data):
-        filepath = f"{str(tmp_path)}/file.h5"
-        tickers = ["MCD", "AAPL"]
-        return filepath, tickers, test_data
+    }
 
-    expected_df = preprocess_df(pd.DataFrame(test_data[0]))
-    asyncio.run(dummy_decorated_func(test_data=test_data))
-    with pd.HDFStore(f"{str(tmp_path)}/file.h5", "r") as store:
+    h5_archive("EodhdVendor", Path(tmp_path, "file.h5"), test_data)
+    with pd.HDFStore(Path(tmp_path, "file.h5"), "r") as store:
         actual_df = store["MCD"]
+        archived_symbols = [symbol for symbol in ("AAPL", "MCD") if f"/{symbol}" in store]
 
     assert Path(tmp_path, "file.h5").exists() is True
-    assert actual_df.equals(expected_df) is True
+    assert archived_symbols == ["AAPL", "MCD"]
+    pd.testing.assert_frame_equal(actual_df, process_eodhd_vendor_data(test_data["MCD"]), check_dtype=False, check_freq=False)
@@ -0,0 +1,218 @@
+import pytest
+import asyncio
+import threading
+import pandas as pd
+from unittest import mock
+from datetime import date
+
+import fmd.storage.writer
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery, process_vendor_data
+from fmd.vendors.eodhd import EodhdVendor
+from fmd.loaders.historical import get_data, read_data, stream_data, h5_archive
+from fmd.storage.hdf5 import HDF5Backend, h5_read_metadata, h5_last_timestamps
+from fmd.storage.cache import FrameCache
+
+
+def eod_records(start: str, periods: int):
+    return [
+        {"date": day.strftime("%Y-%m-%d"), "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adjusted_close": 1.5, "volume": 100}
+        for day in pd.bdate_range(start, periods=periods)
+    ]
+
+
+@pytest.fixture
+def eodhd_vendor(monkeypatch, response_cache):
+    monkeypatch.setenv("EODHISTORICALDATA", "demo")
+    return EodhdVendor(response_cache=response_cache)
+
+
+@pytest.fixture
+def eod_query():
+    return TimeSeriesDataQuery(
+        universe=Universe("dummy_universe", "dummy", ["MCD", "AAPL"]),
+        start=date(2023, 1, 2),
+        end=date(2023, 1, 6),
+        exchange="US",
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_data_yields_processed_frames(eodhd_vendor, eod_query):
+    async def fake_fetch(symbol, url, params, **kwargs):
+        return eod_records("2023-01-02", 5)
+
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        result = {symbol: df async for symbol, df in stream_data(eodhd_vendor, eod_query)}
+
+    assert sorted(result) == ["AAPL", "MCD"]
+    assert isinstance(result["MCD"].index, pd.DatetimeIndex)
+    assert len(result["MCD"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_get_data_stream_archive(tmp_path, eodhd_vendor, eod_query):
+    async def fake_fetch(symbol, url, params, **kwargs):
+        return eod_records("2023-01-02", 5)
+
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        universe_name, archived_symbols = await get_data(eodhd_vendor, eod_query, do_archive=True, output_path=tmp_path, stream=True)
+
+    assert universe_name == "dummy_universe"
+    assert sorted(archived_symbols) == ["AAPL", "MCD"]
+    with pd.HDFStore(tmp_path / "dummy_universe_EodhdVendor.h5", mode="r") as store:
+        assert len(store["AAPL"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_get_data_incremental_fetches_missing_tail(tmp_path, eodhd_vendor, eod_query):
+    with pd.HDFStore(tmp_path / "dummy_universe_EodhdVendor.h5", mode="w") as store:
+        store.append("MCD", process_vendor_data("EodhdVendor", eod_records("2023-01-02", 2)))
+        store.append("AAPL", process_vendor_data("EodhdVendor", eod_records("2023-01-02", 5)))
+
+    requested_params = {}
+    reader_threads = []
+    last_timestamps = HDF5Backend.last_timestamps
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        requested_params[symbol] = params
+        return eod_records(params["from"], 3)
+
+    def spy_last_timestamps(backend, symbols):
+        reader_threads.append(threading.get_ident())
+        return last_timestamps(backend, symbols)
+
+    with (
+        mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch),
+        mock.patch.object(HDF5Backend, "last_timestamps", spy_last_timestamps),
+    ):
+        _, data = await get_data(eodhd_vendor, eod_query, do_archive=True, output_path=tmp_path, incremental=True)
+
+    # the archive is read off the event loop
+    assert len(reader_threads) == 1 and reader_threads[0] != threading.get_ident()
+    # AAPL is up to date, MCD restarts the day after its last archived bar
+    assert list(data.keys()) == ["MCD"]
+    assert requested_params["MCD"]["from"] == "2023-01-04"
+    assert requested_params["MCD"]["to"] == "2023-01-06"
+    with pd.HDFStore(tmp_path / "dummy_universe_EodhdVendor.h5", mode="r") as store:
+        assert len(store["MCD"]) == 5
+
+
+def test_h5_archive_upserts_only_new_rows(tmp_path):
+    path = f"{tmp_path}/upsert.h5"
+    writer = fmd.storage.writer.ArchiveWriter()
+    with (
+        mock.patch("fmd.loaders.historical.get_archive_writer", return_value=writer),
+        mock.patch.object(writer, "submit", wraps=writer.submit) as submit,
+    ):
+        h5_archive("EodhdVendor", path, {"MCD": eod_records("2023-01-02", 5)})
+        # overlaps the last 3 archived days and adds 2 new ones
+        h5_archive("EodhdVendor", path, {"MCD": eod_records("2023-01-04", 5)})
+    writer.close()
+    # the appends go through the writer owning the file
+    assert submit.call_count == 2
+
+    with pd.HDFStore(path, mode="r") as store:
+        archived = store["MCD"]
+        metadata = h5_read_metadata(store)
+
+    assert len(archived) == 7
+    assert archived.index.is_unique
+    assert metadata["MCD"]["nrows"] == 7
+    assert metadata["MCD"]["end"] == pd.Timestamp("2023-01-10")
+    assert h5_last_timestamps(path, ["MCD", "AAPL"]) == {"MCD": pd.Timestamp("2023-01-10")}
+
+
+@pytest.mark.asyncio
+async def test_get_data_archives_to_storage_backend(tmp_path, eodhd_vendor, eod_query):
+    pytest.importorskip("pyarrow")
+    from fmd.storage.parquet import ParquetBackend
+
+    backend = ParquetBackend(tmp_path, "EodhdVendor")
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        return eod_records(params["from"], 3)
+
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        await get_data(eodhd_vendor, eod_query, do_archive=True, backend=backend)
+        _, data = await get_data(eodhd_vendor, eod_query, do_archive=True, backend=backend, incremental=True)
+
+    assert sorted(data) == ["AAPL", "MCD"]
+    assert {symbol: len(df) for symbol, df in backend.read().items()} == {"AAPL": 6, "MCD": 6}
+    assert not (tmp_path / "dummy_universe_EodhdVendor.h5").exists()
+
+
+@pytest.mark.asyncio
+async def test_get_data_returns_compact_bars(eodhd_vendor, eod_query, monkeypatch):
+    async def fake_fetch(symbol, url, params, **kwargs):
+        return eod_records("2023-01-02", 5)
+
+    monkeypatch.setattr("fmd.storage.writer._default_writer", None)
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        _, bars = await get_data(eodhd_vendor, eod_query, compact=True)
+
+    # nothing is archived, the archive writer threads are not started
+    assert fmd.storage.writer._default_writer is None
+
+    assert sorted(bars) == ["AAPL", "MCD"]
+    assert len(bars) == 10
+    assert bars.frame("MCD")["adjusted_close"].dtype == "float32"
+
+
+def test_read_data_slices_and_caches(tmp_path):
+    path = f"{tmp_path}/dummy_universe_EodhdVendor.h5"
+    h5_archive("EodhdVendor", path, {"MCD": eod_records("2023-01-02", 10), "AAPL": eod_records("2023-01-02", 10)})
+    universe = Universe("dummy_universe", "dummy", ["MCD", "AAPL"])
+    cache = FrameCache()
+
+    with mock.patch("fmd.loaders.historical.get_frame_cache", return_value=cache):
+        data = read_data(universe, "EodhdVendor", start="2023-01-04", end="2023-01-10", columns=["close"], output_path=tmp_path)
+        assert list(data) == ["MCD", "AAPL"]
+        assert list(data["MCD"].columns) == ["close"]
+        assert data["MCD"].index.min() == pd.Timestamp("2023-01-04")
+        assert data["MCD"].index.max() == pd.Timestamp("2023-01-10")
+
+        with mock.patch("fmd.storage.hdf5.HDF5Backend.read", side_effect=AssertionError("cached slice re-read")):
+            cached = read_data(universe, "EodhdVendor", ["AAPL"], start="2023-01-04", end="2023-01-10", columns=["close"], output_path=tmp_path)
+        pd.testing.assert_frame_equal(cached["AAPL"], data["AAPL"])
+        assert cache.hits == 1
+
+        # writing to the archive invalidates the cached slices
+        h5_archive("EodhdVendor", path, {"AAPL": eod_records("2023-01-16", 1)})
+        updated = read_data(universe, "EodhdVendor", symbols=["AAPL"], start="2023-01-04", end="2023-01-31", output_path=tmp_path)
+        assert updated["AAPL"].index.max() == pd.Timestamp("2023-01-16")
+
+
+def test_frame_cache_evicts_least_recently_used():
+    frames = {key: pd.DataFrame({"close": range(1000)}, dtype="float64") for key in "abc"}
+    nbytes = int(frames["a"].memory_usage(index=True, deep=True).sum())
+    cache = FrameCache(max_bytes=2 * nbytes)
+    cache.set("a", frames["a"])
+    cache.set("b", frames["b"])
+    cache.get("a")
+    cache.set("c", frames["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is frames["a"] and cache.get("c") is frames["c"]
+    assert cache.nbytes == 2 * nbytes
+
+
+@pytest.mark.asyncio
+async def test_get_data_archives_universes_concurrently(tmp_path, eodhd_vendor, eod_query):
+    queries = [eod_query, TimeSeriesDataQuery(Universe("other_universe", "dummy", ["MSFT"]), eod_query.start, eod_query.end, exchange="US")]
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        return eod_records("2023-01-02", 5)
+
+    with mock.patch.object(eodhd_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        results = await asyncio.gather(
+            *(get_data(eodhd_vendor, query, do_archive=True, output_path=tmp_path, stream=stream) for query in queries for stream in (False, True))
+        )
+
+    assert len(results) == 4
+    assert h5_last_timestamps(tmp_path / "dummy_universe_EodhdVendor.h5", ["MCD", "AAPL"]) == {
+        "MCD": pd.Timestamp("2023-01-06"),
+        "AAPL": pd.Timestamp("2023-01-06"),
+    }
+    with pd.HDFStore(tmp_path / "other_universe_EodhdVendor.h5", mode="r") as store:
+        assert len(store["MSFT"]) == 5
@@ -0,0 +1,113 @@
+import time
+import pytest
+import asyncio
+from aiohttp import web
+
+from fmd.utils.http_session import HttpSessionPool
+from fmd.utils.async_marketdata_handler import AsyncMarketDataHandler
+from fmd.utils.http_response_handler import (
+    CircuitBreaker,
+    PermanentHttpError,
+    RetryableHttpError,
+    async_response_handler,
+    get_retry_counters,
+    parse_retry_after,
+    retry,
+)
+
+
+async def no_text():
+    return ""
+
+
+@pytest.mark.asyncio
+async def test_async_response_handler_typed_errors():
+    with pytest.raises(PermanentHttpError) as permanent:
+        await async_response_handler(404, {}, no_text)
+    with pytest.raises(RetryableHttpError) as rate_limited:
+        await async_response_handler(429, {"Retry-After": "3"}, no_text)
+
+    assert permanent.value.status == 404
+    assert rate_limited.value.retry_after == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+@pytest.mark.asyncio
+async def test_retry_only_retryable_errors():
+    calls = []
+
+    @retry(base_delay=0.01, max_delay=0.01, max_tries=3)
+    async def flaky(error):
+        calls.append(error)
+        if len(calls) < 3:
+            raise error
+        return "ok"
+
+    with pytest.raises(PermanentHttpError):
+        await flaky(PermanentHttpError(401))
+    assert len(calls) == 1
+
+    calls.clear()
+    start = time.monotonic()
+    assert await flaky(RetryableHttpError(429, retry_after=0.1)) == "ok"
+    # the Retry-After delay is honoured on each retry
+    assert len(calls) == 3 and time.monotonic() - start >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+
+    start = time.monotonic()
+    assert await breaker.wait()
+    assert time.monotonic() - start >= 0.09
+    # the probe is in flight, other requests keep waiting for its outcome
+    waiting = asyncio.create_task(breaker.wait())
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+    breaker.record_success()
+    await asyncio.wait_for(waiting, timeout=1)
+    assert not breaker.is_open and breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_handler_retries_by_status():
+    requests_count = {}
+
+    async def handler(request):
+        symbol = request.match_info["symbol"]
+        requests_count[symbol] = requests_count.get(symbol, 0) + 1
+        if symbol == "MISSING":
+            return web.json_response({"error": "not found"}, status=404)
+        if symbol == "BUSY" and requests_count[symbol] == 1:
+            return web.json_response({"error": "busy"}, status=503, headers={"Retry-After": "0"})
+        return web.json_response([{"symbol": symbol}])
+
+    app = web.Application()
+    app.router.add_get("/eod/{symbol}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host = f"127.0.0.1:{runner.addresses[0][1]}"
+    pool = HttpSessionPool()
+    try:
+        symbols = ["MISSING", "BUSY", "MCD"]
+        urls = [(symbol, f"http://{host}/eod/{symbol}") for symbol in symbols]
+        async with AsyncMarketDataHandler(session_pool=pool) as market_data_handler:
+            data = await market_data_handler.fetch_multi_symbols_data_helper(symbol_list=symbols, params={}, urls=urls)
+    finally:
+        await pool.aclose()
+        await runner.cleanup()
+
+    assert sorted(data) == ["BUSY", "MCD"]
+    # the 404 is not retried, the 503 is retried once
+    assert requests_count == {"MISSING": 1, "BUSY": 2, "MCD": 1}
+    counters = get_retry_counters()
+    assert counters[host, "attempt"] == 4
+    assert counters[host, "retry"] == 1 and counters[host, "permanent_error"] == 1 and counters[host, "success"] == 2
@@ -0,0 +1,166 @@
+import json
+import asyncio
+import pytest
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from fmd.loaders.live import LiveLoader, RingBuffer, LIVE_EVENTS
+from fmd.storage.hdf5 import HDF5Backend
+from fmd.storage.writer import ArchiveWriter
+from fmd.vendors.polygon import PolygonError
+
+
+def minute_bar(symbol: str, minute: int, close: float):
+    start = int(pd.Timestamp("2023-01-03 14:30").value // 10**6) + minute * 60_000
+    bar = {"ev": "AM", "sym": symbol, "v": 100, "av": 1000, "op": 1.0, "vw": close, "a": 1.2, "z": 10, "s": start, "e": start + 60_000}
+    return {**bar, "o": 1.0, "c": close, "h": 2.0, "l": 0.5}
+
+
+# Recorded feed: one message per minute with the bars of both symbols, then a status message
+RECORDED_MESSAGES = [[minute_bar("AAPL", minute, 100 + minute), minute_bar("MSFT", minute, 200 + minute)] for minute in range(6)] + [
+    [{"ev": "status", "status": "success", "message": "heartbeat"}]
+]
+
+
+@contextlib.asynccontextmanager
+async def polygon_ws_server(feeds=None):
+    """Local stand-in of the Polygon websocket: authenticates "demo", replays the next feed once subscribed,
+    then closes the connection. Connections are refused once every feed has been replayed."""
+    received = []
+    feeds = list(feeds if feeds is not None else [RECORDED_MESSAGES])
+
+    async def handler(request):
+        if not feeds:
+            return web.Response(status=503)
+        feed = feeds.pop(0)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_str(json.dumps([{"ev": "status", "status": "connected", "message": "Connected Successfully"}]))
+        async for message in ws:
+            action = json.loads(message.data)
+            received.append(action)
+            if action["action"] == "auth":
+                status = "auth_success" if action["params"] == "demo" else "auth_failed"
+                await ws.send_str(json.dumps([{"ev": "status", "status": status, "message": status}]))
+            elif action["action"] == "subscribe":
+                for recorded_message in feed:
+                    await ws.send_str(json.dumps(recorded_message))
+                await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/stocks", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        yield f"ws://127.0.0.1:{runner.addresses[0][1]}/stocks", received
+    finally:
+        await runner.cleanup()
+
+
+def test_ring_buffer_wraps_and_counts_lost_rows():
+    buffer = RingBuffer(4, LIVE_EVENTS["T"].dtype)
+    for i in range(3):
+        buffer.append((i, float(i), 1.0))
+    assert buffer.unflushed()["price"].tolist() == [0.0, 1.0, 2.0]
+
+    for i in range(3, 10):
+        buffer.append((i, float(i), 1.0))
+    assert len(buffer) == 4
+    assert buffer.latest(2)["price"].tolist() == [8.0, 9.0]
+    # rows 3 to 5 were overwritten before being flushed
+    assert buffer.unflushed()["price"].tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert buffer.lost == 3
+    assert len(buffer.unflushed()) == 0
+
+
+@pytest.mark.asyncio
+async def test_live_loader_replays_feed_into_archive(tmp_path):
+    writer = ArchiveWriter()
+    backend = HDF5Backend(tmp_path / "live_PolygonVendor.h5")
+    async with polygon_ws_server() as (url, received):
+        loader = LiveLoader(
+            backend, ["AAPL", "MSFT"], api_key="demo", url=url, capacity=4, flush_rows=5, flush_interval=60, writer=writer, max_reconnects=0
+        )
+        await loader.run()
+    writer.close()
+
+    assert received[1] == {"action": "subscribe", "params": "AM.AAPL,AM.MSFT"}
+    assert loader.received_messages == len(RECORDED_MESSAGES)
+    # the ring buffers keep the last bars in memory
+    assert loader.latest("AAPL")["close"].tolist() == [102.0, 103.0, 104.0, 105.0]
+    assert loader.latest("MSFT", 1)["date"][0] == np.datetime64("2023-01-03T14:35")
+
+    # every bar reached the archive through size triggered micro-batches
+    data = backend.read()
+    assert sorted(data) == ["AAPL", "MSFT"]
+    assert data["AAPL"]["close"].tolist() == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0]
+    assert data["MSFT"].index[0] == pd.Timestamp("2023-01-03 14:30")
+    assert data["MSFT"].index.is_monotonic_increasing
+
+
+@pytest.mark.asyncio
+async def test_live_loader_rejects_invalid_key(tmp_path):
+    async with polygon_ws_server() as (url, _):
+        loader = LiveLoader(HDF5Backend(tmp_path / "unused.h5"), ["AAPL"], api_key="invalid", url=url)
+        with pytest.raises(PolygonError, match="authentication failed"):
+            await loader.run()
+
+
+@pytest.mark.asyncio
+async def test_live_loader_reconnects_and_subscribes_again(tmp_path):
+    writer = ArchiveWriter()
+    backend = HDF5Backend(tmp_path / "live_PolygonVendor.h5")
+    async with polygon_ws_server([RECORDED_MESSAGES[:3], RECORDED_MESSAGES[3:]]) as (url, received):
+        loader = LiveLoader(backend, ["AAPL", "MSFT"], api_key="demo", url=url, writer=writer, max_reconnects=1, reconnect_delay=0.01)
+        await loader.run()
+    writer.close()
+
+    # the second connection subscribes again, the third one is refused and the loader gives up
+    assert [action["action"] for action in received] == ["auth", "subscribe"] * 2
+    assert loader.connections == 2
+    assert backend.read()["AAPL"]["close"].tolist() == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0]
+
+
+@pytest.mark.asyncio
+async def test_live_loader_keeps_reading_while_the_archive_is_slow(tmp_path):
+    released = threading.Event()
+
+    class SlowWriter(ArchiveWriter):
+        def submit(self, backend, symbol, symbol_data):
+            released.wait(timeout=5)
+            return super().submit(backend, symbol, symbol_data)
+
+    writer = SlowWriter()
+    backend = HDF5Backend(tmp_path / "live_PolygonVendor.h5")
+    async with polygon_ws_server() as (url, _):
+        loader = LiveLoader(backend, ["AAPL", "MSFT"], api_key="demo", url=url, flush_rows=2, flush_interval=60, writer=writer, max_reconnects=0)
+        run = asyncio.create_task(loader.run())
+        # every message is consumed while the first micro-batch is still waiting for the disk
+        for _ in range(100):
+            if loader.received_messages == len(RECORDED_MESSAGES):
+                break
+            await asyncio.sleep(0.01)
+        assert loader.received_messages == len(RECORDED_MESSAGES)
+        assert not run.done()
+        released.set()
+        await run
+    writer.close()
+
+    assert len(backend.read()["MSFT"]) == 6
+
+
+def test_live_loader_trades_are_not_archived(tmp_path, monkeypatch):
+    with pytest.raises(ValueError, match="cannot be archived"):
+        LiveLoader(HDF5Backend(tmp_path / "unused.h5"), ["AAPL"], channel="T", api_key="demo")
+
+    # keys only found in the .env file are loaded first
+    monkeypatch.delenv("POLYGON", raising=False)
+    monkeypatch.setattr("fmd.loaders.live.load_vendor_env", lambda: monkeypatch.setenv("POLYGON", "from-dotenv"))
+    loader = LiveLoader(None, ["AAPL"], channel="T")
+    assert loader.api_key == "from-dotenv" and loader.writer is None
@@ -1,23 +1,44 @@
 import pytest
-from unittest import mock
+import pandas as pd
 from datetime import date
 
+from benchmarks.simulator import SimulatorConfig, VendorSimulator
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery
+from fmd.vendors.polygon import PolygonVendor
+from fmd.loaders.historical import get_data
+
 
-# @pytest.mark.dependency(depends=["tests/test.eodhd.py::test_ohlcv"], scope="package")
 @pytest.mark.asyncio
-async def test_load_etf_universe_async(tmp_path, mock_etf_loader, mock_universe):
-    mock_etf_loader.eod.ohlcv = mock.AsyncMock(
-        return_value=[
-            [{"MCD": "response1"}, {"MCD": "response2"}],
-            [{"AAPL": "response1"}, {"AAPL": "response2"}],
-        ]
-    )
+async def test_load_eodhd_universe_into_archive(tmp_path, mock_eodhd, mock_ohlcvquery):
+    async with VendorSimulator() as simulator:
+        mock_eodhd.root_url = f"{simulator.url}/api"
+        universe_name, data = await get_data(mock_eodhd, mock_ohlcvquery, do_archive=True, output_path=tmp_path)
+
+    assert universe_name == "dummy_etf_universe"
+    assert sorted(data) == ["AAPL", "MCD"]
+    with pd.HDFStore(tmp_path / "dummy_etf_universe_EodhdVendor.h5", mode="r") as store:
+        archived = store["/MCD"]
+    assert archived.index.tolist() == list(pd.bdate_range("2023-01-02", "2023-01-13"))
+    assert (archived["high"] >= archived["low"]).all()
 
-    with mock.patch("src.data_services.loader.OUTPUT_ETF_OHLCV", new=tmp_path):
-        result = await mock_etf_loader._load_etf_universe_async.__wrapped__(
-            mock_etf_loader, start=date(2023, 1, 1), end=date(2023, 1, 15), universe=mock_universe
-        )
 
-    assert len(result) == 3
-    assert result[1] == ["MCD", "AAPL"]
-    assert result[0] == f"{tmp_path}/{mock_universe.value[0]}.h5"
+@pytest.mark.asyncio
+async def test_load_polygon_minute_bars_across_pages(tmp_path, monkeypatch, response_cache):
+    monkeypatch.setenv("POLYGON", "demo")
+    vendor = PolygonVendor(response_cache=response_cache)
+    query = TimeSeriesDataQuery(
+        universe=Universe("dummy_universe", "dummy", ["AAPL", "MSFT"]), start=date(2023, 1, 3), end=date(2023, 1, 4), timespan="minute"
+    )
+    async with VendorSimulator(SimulatorConfig(seed=1)) as simulator:
+        vendor.aggregates_url = f"{simulator.url}/v2/aggs/ticker"
+        monkeypatch.setattr("fmd.vendors.polygon.AGGREGATES_LIMIT", 200)
+        _, streamed_symbols = await get_data(vendor, query, do_archive=True, output_path=tmp_path, stream=True)
+
+    assert sorted(streamed_symbols) == ["AAPL", "MSFT"]
+    with pd.HDFStore(tmp_path / "dummy_universe_PolygonVendor.h5", mode="r") as store:
+        archived = store["/AAPL"]
+    # two sessions of 390 bars, one window per day served in pages of 200 bars
+    assert len(archived) == 780
+    assert archived.index[0] == pd.Timestamp("2023-01-03 14:30")
+    assert simulator.stats[200] == 8
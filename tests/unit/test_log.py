@@ -0,0 +1,106 @@
+import sys
+import logging
+import logging.handlers
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import fmd.utils.log
+from fmd.loaders.historical import archive
+from fmd.utils.log import RateLimitFilter, configure_logging
+
+
+SRC_DIR = Path(__file__).resolve().parents[2] / "src"
+
+
+@pytest.fixture
+def unconfigured_logging(monkeypatch):
+    """Logging state of a process where configure_logging has not run yet, the root logger is restored afterwards"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    monkeypatch.setattr(fmd.utils.log, "_listener", None)
+    yield
+    root.handlers = handlers
+    root.setLevel(level)
+
+
+def _record(msg: str, *args, level: int = logging.WARNING) -> logging.LogRecord:
+    return logging.LogRecord("fmd.test", level, __file__, 1, msg, args, None)
+
+
+def test_rate_limit_filter(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(fmd.utils.log.time, "monotonic", lambda: now[0])
+    rate_limit = RateLimitFilter(burst=2, period=60.0)
+
+    passed = [rate_limit.filter(_record("No data fetched for symbol: %s", symbol)) for symbol in ("A", "B", "C", "D")]
+    assert passed == [True, True, False, False]
+    # other templates, and messages below warning or critical ones, are not limited
+    assert rate_limit.filter(_record("%d failed symbols during fetching", 3))
+    assert all(rate_limit.filter(_record("No data fetched for symbol: %s", "E", level=logging.DEBUG)) for _ in range(5))
+    assert all(rate_limit.filter(_record("No data fetched for symbol: %s", "E", level=logging.CRITICAL)) for _ in range(5))
+
+    now[0] = 61.0
+    record = _record("No data fetched for symbol: %s", "F")
+    assert rate_limit.filter(record)
+    assert record.getMessage() == "No data fetched for symbol: F [2 similar messages dropped]"
+
+
+class _FailingBackend:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def append(self, symbol, symbol_data):
+        raise OSError("disk full")
+
+    def __repr__(self):
+        return "FailingBackend"
+
+
+def test_per_symbol_failures_share_a_rate_limit_window():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(RateLimitFilter(burst=3))
+    logger = logging.getLogger("fmd.loaders.historical")
+    logger.addHandler(handler)
+    bar = {"date": "2023-01-02", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adjusted_close": 1.5, "volume": 100}
+    errors = {}
+    try:
+        archive(_FailingBackend(), "EodhdVendor", {f"S{i:03d}": [bar] for i in range(50)}, errors=errors)
+    finally:
+        logger.removeHandler(handler)
+    assert len(errors) == 50
+    # the 50 archive errors are logged lazily, with a single template: only the burst is written
+    messages = [record.getMessage() for record in records]
+    assert messages == [f"Unexpected error while archiving S{i:03d} to FailingBackend: disk full" for i in range(3)]
+
+
+def test_logging_is_configured_once_behind_a_queue(tmp_path, unconfigured_logging):
+    configure_logging(log_dir=tmp_path)
+    root = logging.getLogger()
+    listener = fmd.utils.log._listener
+    assert listener is not None
+    queue_handlers = [handler for handler in root.handlers if isinstance(handler, logging.handlers.QueueHandler)]
+    assert len(queue_handlers) == 1
+    assert not any(isinstance(handler, logging.handlers.RotatingFileHandler) for handler in root.handlers)
+    file_handlers = [handler for handler in listener.handlers if isinstance(handler, logging.handlers.RotatingFileHandler)]
+    assert [Path(handler.baseFilename) for handler in file_handlers] == [tmp_path / "mainloader.log"]
+
+    configure_logging()
+    assert fmd.utils.log._listener is listener
+    assert [handler for handler in root.handlers if isinstance(handler, logging.handlers.QueueHandler)] == queue_handlers
+
+
+def test_importing_the_library_leaves_logging_alone():
+    script = (
+        "import logging, fmd.vendors.eodhd, fmd.loaders.historical, fmd.storage.hdf5, fmd.utils.log;"
+        "print(fmd.utils.log._listener, logging.getLogger().handlers)"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env={"PYTHONPATH": str(SRC_DIR)})
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.splitlines() == ["None []"]
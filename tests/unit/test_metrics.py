@@ -0,0 +1,100 @@
+import pytest
+import aiohttp
+import pandas as pd
+
+from benchmarks.simulator import SimulatorConfig, VendorSimulator
+from fmd.loaders.historical import get_data
+from fmd.utils.http_response_handler import get_retry_counters
+from fmd.utils.metrics import OPENMETRICS_CONTENT_TYPE, MetricsRegistry, get_metrics_registry
+
+
+def test_registry_openmetrics_exposition(tmp_path):
+    registry = MetricsRegistry(())
+    registry.register("jobs", "counter", "Jobs run")
+    registry.register("queue_depth", "gauge", "Queued jobs")
+    registry.register("job_seconds", "histogram", "Job duration", buckets=(0.1, 1.0))
+    samples = []
+    registry.add_hook(samples.append)
+
+    registry.inc("jobs", kind='nightly "eod"')
+    registry.inc("jobs", 2, kind='nightly "eod"')
+    registry.set("queue_depth", 5)
+    registry.dec("queue_depth", 2)
+    for seconds in (0.05, 0.5, 3.0):
+        registry.observe("job_seconds", seconds, stage="fetch")
+
+    assert registry.value("jobs", kind='nightly "eod"') == 3
+    assert registry.value("queue_depth") == 3
+    assert registry.value("job_seconds", stage="fetch") == (3, 3.55)
+    assert [sample.name for sample in samples] == ["jobs", "jobs", "queue_depth", "queue_depth"] + ["job_seconds"] * 3
+    with pytest.raises(ValueError):
+        registry.inc("jobs", -1)
+    with pytest.raises(ValueError):
+        registry.observe("jobs", 1.0)
+
+    registry.write_openmetrics(tmp_path / "metrics.prom")
+    exposition = (tmp_path / "metrics.prom").read_text()
+    assert exposition == "\n".join(
+        [
+            "# TYPE jobs counter",
+            "# HELP jobs Jobs run",
+            'jobs_total{kind="nightly \\"eod\\""} 3',
+            "# TYPE queue_depth gauge",
+            "# HELP queue_depth Queued jobs",
+            "queue_depth 3",
+            "# TYPE job_seconds histogram",
+            "# HELP job_seconds Job duration",
+            'job_seconds_bucket{stage="fetch",le="0.1"} 1',
+            'job_seconds_bucket{stage="fetch",le="1"} 2',
+            'job_seconds_bucket{stage="fetch",le="+Inf"} 3',
+            'job_seconds_count{stage="fetch"} 3',
+            'job_seconds_sum{stage="fetch"} 3.55',
+            "# EOF",
+            "",
+        ]
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_data_records_fetch_parse_and_archive_metrics(tmp_path, mock_eodhd, mock_ohlcvquery):
+    registry = get_metrics_registry()
+    registry.reset()
+    async with VendorSimulator(SimulatorConfig(rate_limit_rate=0.2, retry_after=0.0, seed=1)) as simulator:
+        mock_eodhd.root_url = f"{simulator.url}/api"
+        host = simulator.url.split("//")[1]
+        _, data = await get_data(mock_eodhd, mock_ohlcvquery, do_archive=True, output_path=tmp_path)
+
+    labels = {"vendor": "EodhdVendor", "endpoint": "eod"}
+    responses_count, _ = registry.value("fmd_http_request_duration_seconds", status=200, **labels)
+    rate_limited_count, _ = registry.value("fmd_http_request_duration_seconds", status=429, **labels)
+    assert responses_count == simulator.stats[200]
+    assert rate_limited_count == simulator.stats[429] > 0
+    assert registry.value("fmd_http_response_size_bytes", **labels)[0] == simulator.stats[200]
+    assert registry.value("fmd_http_requests_in_flight", **labels) == 0
+    assert get_retry_counters()[host, "attempt"] == registry.value("fmd_retry_attempts", host=host, outcome="attempt")
+    assert registry.value("fmd_retry_attempts", host=host, outcome="retry") == rate_limited_count
+
+    with pd.HDFStore(tmp_path / "dummy_etf_universe_EodhdVendor.h5", mode="r") as store:
+        archived_rows = sum(len(store[f"/{symbol}"]) for symbol in data)
+    assert registry.value("fmd_parsed_symbols", vendor="EodhdVendor") == len(data)
+    assert registry.value("fmd_parse_seconds", vendor="EodhdVendor", mode="batch")[0] == 1
+    assert registry.value("fmd_archived_rows", backend="HDF5Backend") == archived_rows
+    assert registry.value("fmd_archive_write_seconds", backend="HDF5Backend")[0] == len(data)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.inc("fmd_parsed_rows", 10, vendor="EodhdVendor")
+    runner = await registry.serve(port=0)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{runner.addresses[0][1]}/metrics") as response:
+                body = await response.text()
+                content_type = response.headers["Content-Type"]
+    finally:
+        await runner.cleanup()
+
+    assert content_type == OPENMETRICS_CONTENT_TYPE
+    assert 'fmd_parsed_rows_total{vendor="EodhdVendor"} 10' in body.splitlines()
+    assert body.endswith("# EOF\n")
@@ -0,0 +1,91 @@
+import pytest
+import pandas as pd
+from unittest import mock
+from datetime import date, timedelta
+
+from fmd.utils.universe import Universe
+from fmd.utils.data_process_utils import TimeSeriesDataQuery
+from fmd.loaders.misc import Miscellaneous
+from fmd.vendors.polygon import PolygonVendor, aggregates_windows, stitch_aggregates_pages
+
+
+@pytest.fixture
+def polygon_vendor(monkeypatch, response_cache):
+    monkeypatch.setenv("POLYGON", "demo")
+    return PolygonVendor(columnar_decode=False, response_cache=response_cache)
+
+
+@pytest.fixture
+def minute_query():
+    return TimeSeriesDataQuery(
+        universe=Universe("dummy_universe", "dummy", ["AAPL", "MSFT"]),
+        start=date(2023, 1, 1),
+        end=date(2023, 3, 31),
+        timespan="minute",
+    )
+
+
+def test_aggregates_windows_minute_bars():
+    windows = aggregates_windows(date(2023, 1, 1), date(2023, 3, 31), "minute")
+    assert windows[0] == (date(2023, 1, 1), date(2023, 2, 3))
+    assert windows[-1][1] == date(2023, 3, 31)
+    assert all(next_start == end + timedelta(days=1) for (_, end), (next_start, _) in zip(windows, windows[1:]))
+    assert aggregates_windows(date(2000, 1, 1), date(2023, 3, 31), "day") == [(date(2000, 1, 1), date(2023, 3, 31))]
+
+
+def test_stitch_aggregates_pages_records():
+    pages = [
+        {"ticker": "AAPL", "results": [{"t": 1}, {"t": 2}], "next_url": "https://api.polygon.io/next"},
+        {"ticker": "AAPL", "resultsCount": 0},
+        {"ticker": "AAPL", "results": [{"t": 3}]},
+    ]
+    stitched = stitch_aggregates_pages(pages)
+    assert stitched == {"ticker": "AAPL", "results": [{"t": 1}, {"t": 2}, {"t": 3}], "resultsCount": 3}
+
+
+@pytest.mark.asyncio
+async def test_fetch_multi_symbols_data_windows_and_cursors(polygon_vendor, minute_query):
+    requested = []
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        requested.append((symbol, url, params))
+        if url.startswith("https://api.polygon.io/cursor"):
+            return {"ticker": symbol[0], "results": [{"t": url}]}
+        if symbol == ("MSFT", 1):
+            raise ValueError("Uncorrect response status: 500")
+        return {"ticker": symbol[0], "results": [{"t": url}], "next_url": f"https://api.polygon.io/cursor/{symbol[0]}/{symbol[1]}"}
+
+    with mock.patch.object(polygon_vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        data = await polygon_vendor.fetch_multi_symbols_data(minute_query)
+
+    # MSFT lost a window, it is dropped instead of being archived with a hole
+    assert list(data) == ["AAPL"]
+    windows = aggregates_windows(minute_query.start, minute_query.end, "minute")
+    assert data["AAPL"]["resultsCount"] == 2 * len(windows)
+    first_url, cursor_url = [result["t"] for result in data["AAPL"]["results"][:2]]
+    assert first_url.endswith(f"range/1/minute/{windows[0][0]}/{windows[0][1]}")
+    assert cursor_url == "https://api.polygon.io/cursor/AAPL/0"
+    assert all(params == {"apiKey": "demo"} for _, url, params in requested if "cursor" in url)
+
+
+@pytest.mark.asyncio
+async def test_crawl_symbols_follows_cursors(tmp_path, monkeypatch):
+    monkeypatch.setenv("POLYGON", "demo")
+
+    async def fake_fetch(symbol, url, params, **kwargs):
+        if "cursor" in url:
+            return {"results": [{"ticker": f"{symbol[1]}2", "market": symbol[0], "type": "CS", "active": True}]}
+        assert params["limit"] == 1000 and params["market"] == symbol[0]
+        return {
+            "results": [{"ticker": f"{symbol[1]}1", "market": symbol[0], "type": "CS", "active": True}],
+            "next_url": f"https://api.polygon.io/v3/reference/tickers?cursor={symbol[1]}",
+        }
+
+    misc = Miscellaneous(PolygonVendor)
+    with mock.patch.object(misc._vendor.async_market_data_handler, "_fetch_symbol_data_helper", side_effect=fake_fetch):
+        symbols = await misc.crawl_symbols([("stocks", "XNAS"), ("stocks", "XNYS")], output_path=tmp_path)
+
+    assert list(symbols.ticker) == ["XNAS1", "XNAS2", "XNYS1", "XNYS2"]
+    assert symbols.market.dtype == "category"
+    archived = pd.read_hdf(tmp_path / "PolygonVendor_symbols.h5", "symbols", where="ticker == 'XNYS2'")
+    assert len(archived) == 1
@@ -0,0 +1,97 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from fmd.storage.hdf5 import HDF5Backend
+from fmd.utils.resampling import bucket_starts, resample_bars, update_resampled_bars
+
+
+def minute_bars(start: str, periods: int, price: float = 10.0) -> pd.DataFrame:
+    index = pd.date_range(start, periods=periods, freq="min", name="date")
+    prices = price + np.arange(periods, dtype=float)
+    return pd.DataFrame(
+        {
+            "open": prices,
+            "high": prices + 1,
+            "low": prices - 1,
+            "close": prices + 0.5,
+            "volume": np.arange(1, periods + 1, dtype=float),
+            "volume_weighted_average_price": prices,
+            "number_of_transactions": np.ones(periods, dtype=np.int64),
+        },
+        index=index,
+    )
+
+
+def test_bucket_starts_follow_timezone_and_calendar():
+    # 04:30 UTC is still the previous day in New York
+    index = pd.DatetimeIndex(["2023-01-03 04:30", "2023-01-03 14:30", "2023-03-13 03:59"])
+    assert bucket_starts(index, "day", tz="America/New_York").tolist() == [
+        pd.Timestamp("2023-01-02 05:00"),
+        pd.Timestamp("2023-01-03 05:00"),
+        pd.Timestamp("2023-03-12 05:00"),
+    ]
+    assert bucket_starts(pd.DatetimeIndex(["2023-02-15", "2023-04-01"]), "month", 3).tolist() == [
+        pd.Timestamp("2023-01-01"),
+        pd.Timestamp("2023-04-01"),
+    ]
+    with pytest.raises(ValueError):
+        bucket_starts(index, "fortnight")
+
+
+def test_resample_bars_aggregates_many_symbols():
+    bars = {
+        "AAPL": minute_bars("2023-01-03 14:30", 10),
+        "MSFT": minute_bars("2023-01-03 14:33", 4, price=20.0),
+        "EMPTY": minute_bars("2023-01-03", 0),
+    }
+    resampled = resample_bars(bars, "minute", 5)
+
+    assert sorted(resampled) == ["AAPL", "MSFT"]
+    aapl = resampled["AAPL"]
+    assert aapl.index.tolist() == [pd.Timestamp("2023-01-03 14:30"), pd.Timestamp("2023-01-03 14:35")]
+    assert aapl["open"].tolist() == [10.0, 15.0]
+    assert aapl["high"].tolist() == [15.0, 20.0]
+    assert aapl["low"].tolist() == [9.0, 14.0]
+    assert aapl["close"].tolist() == [14.5, 19.5]
+    assert aapl["volume"].tolist() == [15.0, 40.0]
+    assert aapl["number_of_transactions"].tolist() == [5, 5]
+    # volume weighted: (10*1 + 11*2 + 12*3 + 13*4 + 14*5) / 15
+    assert aapl["volume_weighted_average_price"].iloc[0] == pytest.approx(190 / 15)
+
+    # MSFT straddles two buckets
+    assert resampled["MSFT"]["volume"].tolist() == [3.0, 7.0]
+    assert resampled["MSFT"]["open"].tolist() == [20.0, 22.0]
+
+
+def test_resample_bars_vwap_ignores_bars_without_vwap():
+    bars = minute_bars("2023-01-03 14:30", 5)
+    bars.loc[bars.index[[1, 3]], "volume_weighted_average_price"] = np.nan
+    resampled = resample_bars({"AAPL": bars, "GAP": minute_bars("2023-01-03 14:30", 1).assign(volume_weighted_average_price=np.nan)}, "minute", 5)
+
+    # (10*1 + 12*3 + 14*5) / (1 + 3 + 5), the volumes of the bars without VWAP still count in the bar volume
+    assert resampled["AAPL"]["volume_weighted_average_price"].iloc[0] == pytest.approx(116 / 9)
+    assert resampled["AAPL"]["volume"].iloc[0] == 15.0
+    assert np.isnan(resampled["GAP"]["volume_weighted_average_price"].iloc[0])
+
+
+def test_update_resampled_bars_recomputes_affected_buckets(tmp_path):
+    backend = HDF5Backend(tmp_path / "minute_PolygonVendor.h5")
+    base_bars = {"AAPL": minute_bars("2023-01-03 14:30", 12), "MSFT": minute_bars("2023-01-03 14:30", 12, price=20.0)}
+    with backend:
+        for symbol, symbol_bars in base_bars.items():
+            backend.append(symbol, symbol_bars)
+    resampled = resample_bars(base_bars, "minute", 5)
+    untouched = resampled["AAPL"].iloc[:2].copy()
+
+    # two late minutes of AAPL complete the third bucket, MSFT is unchanged
+    new_bars = {"AAPL": minute_bars("2023-01-03 14:42", 2, price=22.0)}
+    with backend:
+        backend.append("AAPL", new_bars["AAPL"])
+    update_resampled_bars(resampled, new_bars, backend, "minute", 5)
+
+    expected = resample_bars(backend.read(["AAPL"]), "minute", 5)["AAPL"]
+    pd.testing.assert_frame_equal(resampled["AAPL"], expected, check_freq=False)
+    pd.testing.assert_frame_equal(resampled["AAPL"].iloc[:2], untouched)
+    assert resampled["AAPL"]["volume"].iloc[-1] == 11 + 12 + 1 + 2
+    assert len(resampled["MSFT"]) == 3
@@ -0,0 +1,88 @@
+import json
+import time
+import threading
+import pytest
+from unittest import mock
+from aiohttp import web
+
+from fmd.utils.http_session import HttpSessionPool
+from fmd.utils.response_cache import ResponseCache, cached_get_json
+from fmd.utils.async_marketdata_handler import AsyncMarketDataHandler
+
+
+def http_response(status_code, payload=None, headers=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.content = json.dumps(payload).encode()
+    response.json.return_value = payload
+    return response
+
+
+def test_cache_key_strips_api_keys():
+    assert ResponseCache.make_key("https://api/x", {"apiKey": "secret", "b": 2, "a": 1}) == "https://api/x?a=1&b=2"
+    assert ResponseCache.make_key("https://api/x", {"api_token": "secret"}) == ResponseCache.make_key("https://api/x", {"api_token": "other"})
+
+
+def test_cached_get_json_fresh_then_revalidated(response_cache):
+    session = mock.Mock()
+    session.get.return_value = http_response(200, [{"Code": "US"}], {"ETag": '"v1"'})
+    assert cached_get_json(session, response_cache, "https://api/exchanges", {"api_token": "demo"}, ttl=60) == [{"Code": "US"}]
+    assert cached_get_json(session, response_cache, "https://api/exchanges", {"api_token": "demo"}, ttl=60) == [{"Code": "US"}]
+    assert session.get.call_count == 1
+
+    # stale entry: revalidated with its ETag, a 304 serves the cached body
+    session.get.return_value = http_response(304)
+    with mock.patch("fmd.utils.response_cache.time.time", return_value=time.time() + 120):
+        assert cached_get_json(session, response_cache, "https://api/exchanges", {"api_token": "demo"}, ttl=60) == [{"Code": "US"}]
+    assert session.get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite", max_size_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.get("a")
+    cache.set("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_handler_serves_and_revalidates_from_cache(response_cache, monkeypatch):
+    hits = []
+    # sqlite calls must not block the event loop
+    cache_threads = []
+    for method in ("get", "set", "touch"):
+        original = getattr(response_cache, method)
+        monkeypatch.setattr(response_cache, method, lambda *args, _original=original: cache_threads.append(threading.get_ident()) or _original(*args))
+
+    async def details(request):
+        hits.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({"results": {"ticker": request.match_info["symbol"]}}, headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/tickers/{symbol}", details)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    pool = HttpSessionPool()
+    handler = AsyncMarketDataHandler(session_pool=pool, response_cache=response_cache)
+    urls = [("AAPL", f"http://127.0.0.1:{port}/tickers/AAPL")]
+    try:
+        async with handler:
+            first = await handler.fetch_multi_symbols_data_helper(["AAPL"], {"apiKey": "demo"}, urls, cache_ttl=60)
+            second = await handler.fetch_multi_symbols_data_helper(["AAPL"], {"apiKey": "demo"}, urls, cache_ttl=60)
+            with mock.patch("fmd.utils.response_cache.time.time", return_value=time.time() + 120):
+                third = await handler.fetch_multi_symbols_data_helper(["AAPL"], {"apiKey": "demo"}, urls, cache_ttl=60)
+    finally:
+        await pool.aclose()
+        await runner.cleanup()
+
+    assert first == second == third == {"AAPL": {"results": {"ticker": "AAPL"}}}
+    assert hits == [None, '"v1"']
+    assert len(cache_threads) == 5 and threading.get_ident() not in cache_threads
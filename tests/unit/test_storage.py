@@ -0,0 +1,172 @@
+import pytest
+import threading
+import pandas as pd
+
+from fmd.storage.hdf5 import HDF5Backend
+from fmd.storage.writer import ArchiveWriter
+
+pytest.importorskip("pyarrow")
+from fmd.storage.parquet import ParquetBackend  # noqa: E402
+
+
+def ohlcv(start: str, periods: int, freq: str = "B", close: float = 1.5) -> pd.DataFrame:
+    index = pd.date_range(start, periods=periods, freq=freq, name="date")
+    return pd.DataFrame({"open": 1.0, "close": close, "volume": 100}, index=index)
+
+
+class RecordingBackend:
+    """In-memory backend recording its write sessions, the first session waits for `released`"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sessions = []
+        self.threads = set()
+        self.released = threading.Event()
+
+    def __repr__(self):
+        return f"RecordingBackend({self.name!r})"
+
+    def __enter__(self):
+        self.released.wait(timeout=5)
+        self.threads.add(threading.get_ident())
+        self.sessions.append([])
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+    def append(self, symbol, symbol_data):
+        if symbol == "BROKEN":
+            raise ValueError("broken symbol")
+        self.sessions[-1].append(symbol)
+
+
+@pytest.fixture(params=["hdf5", "parquet"])
+def daily_backend(request, tmp_path):
+    if request.param == "hdf5":
+        return HDF5Backend(tmp_path / "dummy_EodhdVendor.h5")
+    return ParquetBackend(tmp_path, "EodhdVendor", timespan="day")
+
+
+def test_backend_upsert_skips_archived_rows(daily_backend):
+    with daily_backend:
+        daily_backend.append("AAPL", ohlcv("2022-12-26", 10))
+        daily_backend.append("MCD", ohlcv("2023-01-02", 5))
+    with daily_backend:
+        daily_backend.append("AAPL", ohlcv("2023-01-02", 10, close=2.0))
+
+    data = daily_backend.read()
+    assert sorted(data) == ["AAPL", "MCD"]
+    assert len(data["AAPL"]) == 15
+    assert data["AAPL"].index.is_unique and data["AAPL"].index.is_monotonic_increasing
+    # archived rows are kept, only the new tail is appended
+    assert data["AAPL"].loc["2023-01-06", "close"] == 1.5
+    assert data["AAPL"].loc["2023-01-13", "close"] == 2.0
+    assert daily_backend.last_timestamps(["AAPL", "MCD", "MSFT"]) == {
+        "AAPL": pd.Timestamp("2023-01-13"),
+        "MCD": pd.Timestamp("2023-01-06"),
+    }
+
+
+def test_backend_read_pushes_down_dates_and_columns(daily_backend):
+    with daily_backend:
+        daily_backend.append("AAPL", ohlcv("2022-12-01", 60))
+        daily_backend.append("MCD", ohlcv("2022-12-01", 60))
+
+    data = daily_backend.read(symbols=["MCD"], start="2023-01-01", end="2023-01-31", columns=["close"])
+    assert list(data) == ["MCD"]
+    assert list(data["MCD"].columns) == ["close"]
+    assert data["MCD"].index.min() >= pd.Timestamp("2023-01-01")
+    assert data["MCD"].index.max() <= pd.Timestamp("2023-01-31")
+    assert len(data["MCD"]) == len(pd.bdate_range("2023-01-01", "2023-01-31"))
+
+
+def test_parquet_daily_partitions_by_year(tmp_path):
+    backend = ParquetBackend(tmp_path, "EodhdVendor", timespan="day")
+    with backend:
+        backend.append("AAPL", ohlcv("2022-12-26", 10))
+        backend.append("MCD", ohlcv("2022-12-26", 10))
+
+    years = sorted(path.name for path in backend.path.iterdir() if path.is_dir())
+    assert years == ["year=2022", "year=2023"]
+
+    closes = backend.scan(start="2023-01-01", end="2023-12-31", columns=["close"])
+    assert list(closes.columns) == ["symbol", "date", "close"]
+    assert set(closes.symbol) == {"AAPL", "MCD"}
+    assert closes.date.min() >= pd.Timestamp("2023-01-01")
+
+
+def test_parquet_intraday_partitions_by_symbol_and_year(tmp_path):
+    backend = ParquetBackend(tmp_path, "PolygonVendor", timespan="minute", flush_rows=100)
+    with backend:
+        backend.append("X:BTC/USD", ohlcv("2022-12-31 23:00", 120, freq="min"))
+        backend.append("AAPL", ohlcv("2023-01-03 14:30", 30, freq="min"))
+
+    assert (backend.path / "symbol=X%3ABTC%2FUSD" / "year=2022").is_dir()
+    assert (backend.path / "symbol=X%3ABTC%2FUSD" / "year=2023").is_dir()
+    data = backend.read(symbols=["X:BTC/USD"], start="2023-01-01")
+    assert list(data) == ["X:BTC/USD"]
+    assert len(data["X:BTC/USD"]) == 60
+
+    with backend:
+        backend.append("AAPL", ohlcv("2023-01-03 14:45", 30, freq="min"))
+    partition_path = backend.path / "symbol=AAPL" / "year=2023"
+    assert len(list(partition_path.glob("*.parquet"))) == 2
+
+    backend.compact()
+    assert len(list(partition_path.glob("*.parquet"))) == 1
+    assert len(backend.read(symbols=["AAPL"])["AAPL"]) == 45
+
+
+def test_archive_writer_coalesces_appends_per_file():
+    writer = ArchiveWriter()
+    first, second = RecordingBackend("first.h5"), RecordingBackend("second.h5")
+    second.released.set()
+
+    futures = [writer.submit(first, "SYM0", ohlcv("2023-01-02", 5))]
+    # the owning thread waits on its first session, the appends queued meanwhile are coalesced
+    futures += [writer.submit(first, f"SYM{i}", ohlcv("2023-01-02", 5)) for i in range(1, 10)]
+    futures.append(writer.submit(first, "BROKEN", ohlcv("2023-01-02", 5)))
+    # the same file through another backend object still goes to its owning writer
+    futures.append(writer.submit(RecordingBackend("first.h5"), "SYM10", ohlcv("2023-01-02", 5)))
+    futures.append(writer.submit(second, "OTHER", ohlcv("2023-01-02", 5)))
+    first.released.set()
+    writer.close()
+
+    assert [future.result() for future in futures[:10]] == [f"SYM{i}" for i in range(10)]
+    with pytest.raises(ValueError):
+        futures[10].result()
+    assert len(first.sessions) <= 2
+    assert sum(first.sessions, []) == [f"SYM{i}" for i in range(11)]
+    assert len(first.threads) == 1 and first.threads != second.threads
+    assert second.sessions == [["OTHER"]]
+
+
+def test_hdf5_reads_wait_for_the_open_write_session(tmp_path):
+    path = tmp_path / "universe.h5"
+    HDF5Backend(path).append("AAPL", ohlcv("2023-01-02", 5))
+    writer = ArchiveWriter()
+    session_open, release = threading.Event(), threading.Event()
+
+    class SlowBackend(HDF5Backend):
+        def append(self, symbol, symbol_data):
+            super().append(symbol, symbol_data)
+            session_open.set()
+            release.wait(timeout=5)
+
+    future = writer.submit(SlowBackend(path), "MSFT", ohlcv("2023-01-02", 5))
+    assert session_open.wait(timeout=5)
+    # the writer keeps the file open in append mode, readers of the same process wait for its session to close
+    reads = []
+    reader = threading.Thread(target=lambda: reads.append((HDF5Backend(path).read(), HDF5Backend(path).last_timestamps(["AAPL", "MSFT"]))))
+    reader.start()
+    reader.join(timeout=0.2)
+    assert reader.is_alive()
+    release.set()
+    reader.join(timeout=5)
+    writer.close()
+
+    assert future.result() == "MSFT"
+    data, last_timestamps = reads[0]
+    assert sorted(data) == ["AAPL", "MSFT"]
+    assert last_timestamps == {"AAPL": pd.Timestamp("2023-01-06"), "MSFT": pd.Timestamp("2023-01-06")}
@@ -0,0 +1,125 @@
+import time
+import random
+
+import yaml
+import pytest
+
+from fmd.utils.symbol_master import SymbolMaster, compile_constraints, _memo_key
+from fmd.utils.universe import UniverseManager
+
+MICRO_CAPS = {"market_cap__lt": 300e6, "active": True, "type__ne": "ETF"}
+
+
+@pytest.fixture
+def master(tmp_path):
+    master = SymbolMaster(tmp_path / "symbols.sqlite")
+    master.upsert_listings(
+        "EodhdVendor",
+        [
+            {"Code": "AAPL", "Name": "Apple Inc", "Exchange": "NASDAQ", "Type": "Common Stock", "Country": "USA", "Currency": "USD"},
+            {"Code": "SPY", "Name": "SPDR S&P 500", "Exchange": "NYSE ARCA", "Type": "ETF", "Country": "USA", "Currency": "USD"},
+            {"Code": "TINY", "Name": "Tiny Corp", "Exchange": "NYSE", "Type": "Common Stock", "Country": "USA", "Currency": "USD"},
+        ],
+    )
+    master.upsert_listings(
+        "PolygonVendor",
+        [
+            {"ticker": "TINY", "name": "Tiny Corp", "primary_exchange": "XNYS", "type": "CS", "active": True},
+            {"ticker": "MICRO", "name": "Micro Inc", "primary_exchange": "XNAS", "type": "CS", "active": True},
+            {"ticker": "IWC", "name": "iShares Micro-Cap ETF", "primary_exchange": "ARCX", "type": "ETF", "active": True},
+            {"ticker": "GONE", "name": "Gone Inc", "primary_exchange": "XNAS", "type": "CS", "active": False},
+        ],
+    )
+    master.update_details(
+        "PolygonVendor",
+        {
+            "TINY": {"results": {"market_cap": 120e6, "sic_description": "SERVICES-PREPACKAGED SOFTWARE"}},
+            "MICRO": {"results": {"market_cap": 250e6}},
+            "IWC": {"results": {"market_cap": 90e6}},
+            "GONE": {"results": {"market_cap": 10e6}},
+        },
+    )
+    master.update_details("EodhdVendor", {"AAPL": {"market_cap": 2.8e12}})
+    yield master
+    master.close()
+
+
+def test_compile_constraints():
+    where, params = compile_constraints({"market_cap__lt": 300e6, "active": True, "exchange__in": ["XNAS", "XNYS"], "type__ne": "ETF"})
+    assert where == "active = ? AND exchange IN (?, ?) AND market_cap < ? AND (type IS NULL OR type != ?)"
+    assert params == [1, "XNAS", "XNYS", 300e6, "ETF"]
+    with pytest.raises(ValueError):
+        compile_constraints({"market_cap__between": (1, 2)})
+    with pytest.raises(ValueError):
+        compile_constraints({"symbol; DROP TABLE symbols": 1})
+
+
+def test_build_universe_from_master(master):
+    universe = UniverseManager().build_universe("us_micro_caps", master=master, **MICRO_CAPS)
+    assert universe.name == "us_micro_caps"
+    assert universe.symbols == ["MICRO", "TINY"]
+    assert master.query_symbols(order_by="-market_cap", type="Common Stock") == ["AAPL", "MICRO", "TINY", "GONE"]
+    assert master.query_symbols(order_by="-market_cap", limit=1, type="Common Stock") == ["AAPL"]
+    assert master.query_symbols(sector__in=["SERVICES-PREPACKAGED SOFTWARE"]) == ["TINY"]
+    # a delisted symbols list deactivates the listings
+    master.upsert_listings("PolygonVendor", [{"ticker": "MICRO", "name": "Micro Inc", "primary_exchange": "XNAS", "type": "CS"}], active=False)
+    assert master.query_symbols(**MICRO_CAPS) == ["TINY"]
+    # market caps survive a listing refresh
+    master.upsert_listings("PolygonVendor", [{"ticker": "MICRO", "name": "Micro Inc", "primary_exchange": "XNAS", "type": "CS", "active": True}])
+    assert master.query_symbols(**MICRO_CAPS) == ["MICRO", "TINY"]
+
+
+def test_query_results_are_memoized_until_the_master_changes(master):
+    first = master.query_symbols(**MICRO_CAPS)
+    first.append("MUTATED")
+    assert master.query_symbols(**MICRO_CAPS) == ["MICRO", "TINY"]
+    assert len(master._memo) == 1
+    # equal sets share their entry whatever their iteration order, which depends on the process hash seed
+    assert _memo_key({"exchange__in": {"XNYS", "ARCX", "XNAS"}, "active": True}) == (("active", True), ("exchange__in", ("ARCX", "XNAS", "XNYS")))
+
+    # writes from another connection, e.g. another process, invalidate the memo too
+    other = SymbolMaster(master.path)
+    version = master.version()
+    other.upsert_listings("PolygonVendor", [{"ticker": "NANO", "name": "Nano Inc", "primary_exchange": "XNAS", "type": "CS", "active": True}])
+    other.update_details("PolygonVendor", {"NANO": {"results": {"market_cap": 5e6}}})
+    other.close()
+    assert master.version() == version + 2
+    assert master.query_symbols(**MICRO_CAPS) == ["MICRO", "NANO", "TINY"]
+
+
+def test_universe_query_over_50k_listings_uses_the_indexes(tmp_path):
+    rng = random.Random(7)
+    types = ["Common Stock", "ETF", "Preferred Stock", "FUND"]
+    exchanges = ["NYSE", "NASDAQ", "NYSE ARCA", "BATS"]
+    master = SymbolMaster(tmp_path / "symbols.sqlite")
+    master.upsert_listings(
+        "EodhdVendor",
+        ({"Code": f"S{i:05d}", "Exchange": rng.choice(exchanges), "Type": rng.choice(types)} for i in range(50_000)),
+    )
+    master.update_details("EodhdVendor", {f"S{i:05d}": {"market_cap": rng.lognormvariate(20, 2)} for i in range(50_000)})
+
+    assert any("COVERING INDEX symbols_market_cap" in step for step in master.explain(**MICRO_CAPS))
+    start = time.perf_counter()
+    symbols = master.query_symbols(**MICRO_CAPS)
+    elapsed = time.perf_counter() - start
+    assert 0 < len(symbols) < 50_000
+    # generous bound for slow CI machines, the query takes a few milliseconds
+    assert elapsed < 0.5
+    master.close()
+
+
+def test_universe_config_is_parsed_once(tmp_path, monkeypatch):
+    config_path = tmp_path / "universe.yml"
+    config_path.write_text("small:\n  desc: small universe\n  symbols: [AAPL, MCD]\n")
+    parsed = []
+    load = yaml.load
+    monkeypatch.setattr(yaml, "load", lambda *args, **kwargs: parsed.append(1) or load(*args, **kwargs))
+
+    assert UniverseManager(config_path).get_universe("small").symbols == ["AAPL", "MCD"]
+    UniverseManager(config_path).get_universe("small").symbols.append("MUTATED")
+    assert UniverseManager(config_path).get_universe("small").symbols == ["AAPL", "MCD"]
+    assert len(parsed) == 1
+
+    config_path.write_text("small:\n  desc: small universe\n  symbols: [AAPL]\n")
+    assert UniverseManager(config_path).get_universe("small").symbols == ["AAPL"]
+    assert len(parsed) == 2
@@ -0,0 +1,63 @@
+import os
+import struct
+import pytest
+import numpy as np
+import pandas as pd
+
+from fmd.storage.timescale import COPY_HEADER, COPY_TRAILER, copy_binary_rows, _prices_values
+
+TEST_DSN = os.environ.get("FMD_TEST_TIMESCALEDB_DSN")
+
+
+def test_copy_binary_rows_layout():
+    dt = np.array(["2000-01-01T00:00:00", "2023-01-03T14:30:00"], dtype="datetime64[ns]")
+    encoded = copy_binary_rows(dt, np.array([7, 8]), {"open": np.array([1.5, np.nan]), "volume": np.array([100.0, 200.0])})
+
+    row_format = ">h i q i i i d i d"
+    assert len(encoded) == 2 * struct.calcsize(row_format)
+    first, second = struct.iter_unpack(row_format, encoded)
+    assert first == (4, 8, 0, 4, 7, 8, 1.5, 8, 100.0)
+    # microseconds since the postgres epoch
+    assert second[2] == (pd.Timestamp("2023-01-03 14:30") - pd.Timestamp("2000-01-01")) // pd.Timedelta(microseconds=1)
+    assert np.isnan(second[6])
+    assert COPY_HEADER.startswith(b"PGCOPY\n\xff\r\n\x00") and COPY_TRAILER == b"\xff\xff"
+
+
+def test_prices_values_maps_vendor_columns():
+    polygon_frame = pd.DataFrame({"close": [2.0], "volume": [10.0], "volume_weighted_average_price": [1.9], "number_of_transactions": [3]})
+    values = _prices_values(polygon_frame)
+
+    assert values["adjusted_close"][0] == 2.0
+    assert values["vw_avg_price"][0] == 1.9
+    assert values["transactions_numbr"][0] == 3
+    assert np.isnan(values["open"][0])
+
+
+@pytest.mark.skipif(TEST_DSN is None, reason="FMD_TEST_TIMESCALEDB_DSN is not set")
+def test_timescale_backend_upserts(tmp_path):
+    pytest.importorskip("psycopg")
+    import psycopg
+    from fmd.storage.timescale import TimescaleBackend
+
+    with psycopg.connect(TEST_DSN, autocommit=True) as connection:
+        connection.execute("DROP TABLE IF EXISTS fmd_test_prices, fmd_test_symbols")
+        connection.execute("CREATE TABLE fmd_test_symbols (id SERIAL PRIMARY KEY, symbol TEXT NOT NULL, created_date TIMESTAMPTZ)")
+        connection.execute(
+            "CREATE TABLE fmd_test_prices (dt TIMESTAMPTZ NOT NULL, symbol_id INTEGER NOT NULL, symbol TEXT NOT NULL, "
+            "open DOUBLE PRECISION, high DOUBLE PRECISION, low DOUBLE PRECISION, adjusted_close DOUBLE PRECISION, volume BIGINT, "
+            "vw_avg_price DOUBLE PRECISION, transactions_numbr INTEGER, PRIMARY KEY (symbol, dt))"
+        )
+
+    backend = TimescaleBackend(TEST_DSN, table="fmd_test_prices", symbols_table="fmd_test_symbols")
+    index = pd.bdate_range("2023-01-02", periods=5, name="date")
+    with backend:
+        backend.append("MCD", pd.DataFrame({"open": 1.0, "adjusted_close": 1.5, "volume": 100}, index=index))
+    with backend:
+        # overlaps the last two archived days and adds a new one
+        overlapping_index = index[3:].append(index[-1:] + pd.Timedelta(days=3))
+        backend.append("MCD", pd.DataFrame({"open": 1.0, "adjusted_close": 2.0, "volume": 100}, index=overlapping_index))
+
+    data = backend.read(["MCD"], columns=["adjusted_close", "volume"])["MCD"]
+    assert len(data) == 6
+    assert data["adjusted_close"].tolist() == [1.5, 1.5, 1.5, 2.0, 2.0, 2.0]
+    assert backend.last_timestamps(["MCD", "AAPL"]) == {"MCD": pd.Timestamp("2023-01-09")}